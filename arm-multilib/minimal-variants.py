@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+"""Find the library variants that a set of compile commands needs.
+
+Given the compile flags a product uses, this runs clang's library
+selection (as simulated by multilib_select.py) against a generated
+multilib.yaml, and prints the variants selected for any of them as an
+ENABLE_VARIANTS list, for example:
+
+    $ minimal-variants.py --multilib-yaml build/multilib/multilib.yaml \\
+          --clang build/llvm/bin/clang --flag-sets product-flags.txt
+    armv7m_hard_fpv4_sp_d16;armv8m.main_hard_fp
+
+The flag sets are read from a file, one compile command's flags per
+line, and/or given with --flags. Blank lines and lines starting with
+'#' are ignored. With --clang, they are compile flags, converted to
+multilib flags by clang -print-multi-flags-experimental. Without it,
+they must already be multilib flags.
+
+The multilib.yaml should be generated with every variant enabled, so
+that each flag set picks the library it would get from a full build.
+Leaving out variants that no flag set selected doesn't change what is
+selected for any of them, which is checked before anything is
+printed. --output-json writes the entries of multilib.json for those
+variants, with any placeholder error entries, to use as MULTILIB_JSON.
+A flag set that selects no variant, or an error entry, is reported and
+makes the exit code 1.
+"""
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+
+import multilib_select
+
+
+def read_flag_sets(filename):
+    flag_sets = []
+    with open(filename) as fh:
+        for line in fh:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                flag_sets.append(shlex.split(line))
+    return flag_sets
+
+
+def multilib_flags(clang, flags):
+    """Return the multilib flags clang derives from compile flags."""
+    result = subprocess.run(
+        [clang, "-print-multi-flags-experimental"] + flags,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return result.stdout.split()
+
+
+def variant_name(variant):
+    return os.path.basename(variant.dir)
+
+
+def select_variants(multilib_set, flag_sets):
+    """Return the variants selected for each flag set, in multilib.yaml
+    order, and the error message of each flag set that failed."""
+    selections = []
+    errors = []
+    for flags in flag_sets:
+        selected = multilib_set.select(flags)
+        error = multilib_select.selection_error(selected)
+        if error is not None:
+            errors.append(f"{shlex.join(flags)}: {error}")
+        selections.append(selected)
+    return selections, errors
+
+
+def minimal_set(multilib_set, selections):
+    """Return a MultilibSet with only the selected variants and the
+    placeholder error entries."""
+    needed = {id(variant) for selected in selections for variant in selected}
+    variants = [
+        variant
+        for variant in multilib_set.variants
+        if id(variant) in needed or variant.error
+    ]
+    return multilib_select.MultilibSet(
+        variants,
+        multilib_set.mappings,
+        multilib_set.exclusive_groups,
+        multilib_set.cache_flags,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--multilib-yaml",
+        required=True,
+        help="multilib.yaml generated with every variant enabled",
+    )
+    parser.add_argument(
+        "--multilib-json",
+        default=os.path.join(os.path.dirname(__file__), "json", "multilib.json"),
+        help="The multilib.json the multilib.yaml was generated from",
+    )
+    parser.add_argument(
+        "--flag-sets",
+        help="File of flag sets, one per line",
+    )
+    parser.add_argument(
+        "--flags",
+        action="append",
+        default=[],
+        help="A flag set, as one argument. May be given more than once",
+    )
+    parser.add_argument(
+        "--clang",
+        help="clang executable, to convert compile flags to multilib flags",
+    )
+    parser.add_argument(
+        "--output-json",
+        help="Write the multilib.json entries of the selected variants here",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Print the variants selected for each flag set",
+    )
+    args = parser.parse_args()
+
+    flag_sets = [shlex.split(flags) for flags in args.flags]
+    if args.flag_sets:
+        flag_sets.extend(read_flag_sets(args.flag_sets))
+    if not flag_sets:
+        parser.error("no flag sets given")
+    if args.clang:
+        try:
+            flag_sets = [multilib_flags(args.clang, flags) for flags in flag_sets]
+        except (OSError, RuntimeError) as e:
+            sys.exit(f"Unable to get the multilib flags from {args.clang}: {e}")
+
+    multilib_set = multilib_select.load(args.multilib_yaml)
+    selections, errors = select_variants(multilib_set, flag_sets)
+    for error in errors:
+        print(error, file=sys.stderr)
+
+    reduced = minimal_set(multilib_set, selections)
+    for flags, selected in zip(flag_sets, selections):
+        if reduced.select(flags) != selected:
+            sys.exit(
+                f"{shlex.join(flags)}: the selection changes without the "
+                "other variants"
+            )
+        if args.verbose:
+            names = ", ".join(
+                variant_name(variant) for variant in selected if not variant.error
+            )
+            print(f"{shlex.join(flags)}: {names or 'none'}", file=sys.stderr)
+
+    variants = [
+        variant_name(variant) for variant in reduced.variants if not variant.error
+    ]
+    if args.output_json:
+        with open(args.multilib_json) as fh:
+            multilib_json = json.load(fh)
+        multilib_json["libs"] = [
+            lib
+            for lib in multilib_json["libs"]
+            if lib["variant"] in variants or "error" in lib
+        ]
+        with open(args.output_json, "w") as fh:
+            json.dump(multilib_json, fh, indent=4)
+            fh.write("\n")
+    print(";".join(variants))
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
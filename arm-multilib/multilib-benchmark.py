@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""Measure how the cost of multilib selection grows with multilib.yaml.
+
+Every clang invocation that needs a library (a link, or
+-print-multi-directory) matches its multilib flags against all the
+Match regexes in multilib.yaml and then checks every variant. This
+script times that work using the multilib_select.py simulator, for
+increasing prefixes of the Variants and Mappings lists, so that the
+effect of adding variants or generated Match rules can be seen.
+
+The query flag sets are derived from the variants themselves: each
+variant's own flags, plus each of those with one flag removed, which
+covers both successful and failed selections.
+
+Two timings are reported for each configuration. 'uncached' matches
+every regex for every query, which is the work clang does per
+invocation. 'cached' reuses the regex results for flags seen before,
+which is how multilib_select.py runs large sweeps.
+"""
+
+import argparse
+import math
+import time
+
+import multilib_select
+
+
+def make_queries(multilib_set):
+    """Return a list of flag lists to select with."""
+    queries = []
+    for variant in multilib_set.variants:
+        flags = sorted(variant.flags)
+        queries.append(flags)
+        for i in range(len(flags)):
+            queries.append(flags[:i] + flags[i + 1 :])
+    return queries
+
+
+def time_queries(multilib_set, queries, min_time):
+    """Return the number of queries per second that multilib_set can
+    answer, running the query list repeatedly for at least min_time
+    seconds."""
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for flags in queries:
+            multilib_set.select(flags)
+        count += len(queries)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--multilib-yaml", required=True, help="Path to multilib.yaml."
+    )
+    parser.add_argument(
+        "--steps",
+        type=int,
+        default=4,
+        help="Number of prefix sizes to time for the variants and the "
+        "mappings (default: 4).",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.5,
+        help="Minimum time in seconds to spend on each measurement "
+        "(default: 0.5).",
+    )
+    args = parser.parse_args()
+
+    full_set = multilib_select.load(args.multilib_yaml)
+    queries = make_queries(full_set)
+    variant_total = len(full_set.variants)
+    mapping_total = len(full_set.mappings)
+
+    print(
+        f"{len(queries)} queries, {variant_total} variants, "
+        f"{mapping_total} mappings"
+    )
+    print(
+        f"{'variants':>8} {'mappings':>8} "
+        f"{'uncached q/s':>14} {'cached q/s':>14} {'us/query':>10}"
+    )
+    for variant_step in range(1, args.steps + 1):
+        variant_count = math.ceil(variant_total * variant_step / args.steps)
+        for mapping_step in range(1, args.steps + 1):
+            mapping_count = math.ceil(mapping_total * mapping_step / args.steps)
+            results = []
+            for cache_flags in (False, True):
+                multilib_set = full_set.subset(variant_count, mapping_count)
+                multilib_set.cache_flags = cache_flags
+                results.append(time_queries(multilib_set, queries, args.min_time))
+            uncached, cached = results
+            print(
+                f"{variant_count:>8} {mapping_count:>8} "
+                f"{uncached:>14.0f} {cached:>14.0f} {1e6 / uncached:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -36,76 +36,43 @@ lower or equal architecture version, so that if, for example, a library
 requires armv8.3-a, then a link command targeting any later version will be
 able to select it. These generated options don't include the feature modifiers,
 which can be matched separately if a library requires them.
+
+The information extracted from clang only depends on the clang binary
+and ARMTargetParser.def, so the clang invocations are run concurrently,
+and if --cache-dir is given their results are saved there keyed by a
+hash of both files. Regenerating with an unchanged toolchain then
+doesn't need to run clang at all.
 """
 
 import argparse
+import concurrent.futures
+import hashlib
 import json
 import os
 import shlex
 import subprocess
+import tempfile
 from dataclasses import dataclass
 
+import target_parser_def
+
+# Target triples whose -march extension lists are combined by
+# generate_extensions. The order matters: it determines the order of
+# the generated output.
+EXTENSION_TRIPLES = ["aarch64-none-eabi", "arm-none-eabi"]
+
 
 def get_fpu_list(args):
     """Extract the list of FPUs from ARMTargetParser.def.
 
-    Strategy: the intended use of ARMTargetParser.def in the actual
-    LLVM build is to run it through the C preprocessor with whatever
-    #defines will generate the output you want. So the most reliable
-    way to get what _we_ want is to do exactly the same.
-
-    The output format I've chosen is actually JSON, because that's
-    close enough to C-like syntax that you can generate it easily
-    using cpp features like stringification, and also convenient for
-    Python to consume afterwards.
+    The file is read directly by target_parser_def.py, rather than by
+    running it through the C preprocessor, and the FPU names that
+    aren't really FPUs (with FPUVersion::NONE) are dropped.
     """
-
-    command = [
-        args.clang,
-        # For this purpose we're only interested in the calls to the
-        # ARM_FPU macro in the input file, and want the first and
-        # third argument of each of those.
-        #
-        # The first argument will be a string literal giving the FPU
-        # name, which we copy into the JSON output still as a string
-        # literal.
-        #
-        # The third argument indicates the general FPU category, which
-        # we need so as to exclude FPUVersion::NONE. That is not
-        # already a string literal, so we stringify it in the
-        # preprocessor to make it legal JSON.
-        "-DARM_FPU(name,kind,version,...)=[name,#version],",
-        "-E",  # preprocess
-        "-P",  # don't output linemarkers
-        "-xc",  # treat input as C, even though no .c filename extension
-        os.path.join(
-            args.llvm_source,
-            "llvm",
-            "include",
-            "llvm",
-            "TargetParser",
-            "ARMTargetParser.def",
-        ),
-    ]
-
-    raw_output = subprocess.check_output(command)
-
-    # The output of the above is a collection of JSON arrays each
-    # containing two strings, and each followed by a comma. Turn it
-    # into a single legal JSON declaration by deleting the final comma
-    # and wrapping it in array brackets.
-    json_output = b"[" + raw_output.strip().rstrip(b",") + b"]"
-
-    # Filter the list of 2-tuples to exclude the FPU names that aren't
-    # FPUs.
-    for name, fputype in json.loads(json_output):
-        assert fputype.startswith("FPUVersion::"), (
-            f"FPU type value {fputype} not of the expected form!\n"
-            "Has ARMTargetParser.def been refactored?"
-        )
-
-        if fputype != "FPUVersion::NONE":
-            yield name
+    index = target_parser_def.load(
+        target_parser_def.get_def_path(args.llvm_source)
+    )
+    return index.hardware_fpus()
 
 
 def get_target_features(args, fpu):
@@ -180,35 +147,158 @@ def get_target_features(args, fpu):
     return features
 
 
-def generate_fpus(args):
-    # Collect all the data: make the list of FPU names, and the set of
-    # features that LLVM maps each one to.
-    fpu_features = {
-        fpuname: get_target_features(args, fpuname)
-        for fpuname in get_fpu_list(args)
-    }
+def get_cache_key(args):
+    """Return a hash identifying everything the clang probes depend on.
+
+    That is the contents of the clang binary itself, and of the
+    ARMTargetParser.def it was built from.
+    """
+    hasher = hashlib.sha256()
+    for filename in [
+        args.clang,
+        target_parser_def.get_def_path(args.llvm_source),
+    ]:
+        with open(filename, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def probe_clang(args):
+    """Run all the clang commands whose output the generator needs.
+
+    The commands are independent of each other, so they are run in a
+    thread pool rather than one after another.
+
+    Returns a tuple of (fpu_features, extensions): a dict mapping each
+    FPU name to its set of target features, and a dict mapping each
+    triple in EXTENSION_TRIPLES to its list of extension names.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        extension_futures = {
+            triple: pool.submit(
+                lambda triple: list(get_extension_list(args.clang, triple)),
+                triple,
+            )
+            for triple in EXTENSION_TRIPLES
+        }
+        fpu_futures = {
+            fpuname: pool.submit(get_target_features, args, fpuname)
+            for fpuname in get_fpu_list(args)
+        }
+        fpu_features = {
+            fpuname: future.result() for fpuname, future in fpu_futures.items()
+        }
+        extensions = {
+            triple: future.result()
+            for triple, future in extension_futures.items()
+        }
+    return fpu_features, extensions
+
+
+def get_clang_data(args):
+    """Return the result of probe_clang, using the cache if possible."""
+    if not args.cache_dir:
+        return probe_clang(args)
+
+    cache_file = os.path.join(
+        args.cache_dir, f"multilib-generate-{get_cache_key(args)}.json"
+    )
+    if os.path.exists(cache_file):
+        with open(cache_file) as fh:
+            cached = json.load(fh)
+        fpu_features = {
+            fpuname: set(features)
+            for fpuname, features in cached["fpu_features"].items()
+        }
+        return fpu_features, cached["extensions"]
+
+    fpu_features, extensions = probe_clang(args)
+
+    # Write to a temporary file and rename it into place, so that an
+    # interrupted or concurrent run can't leave a truncated cache file.
+    os.makedirs(args.cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=args.cache_dir, suffix=".tmp", delete=False
+    ) as fh:
+        json.dump(
+            {
+                "fpu_features": {
+                    fpuname: sorted(features)
+                    for fpuname, features in fpu_features.items()
+                },
+                "extensions": extensions,
+            },
+            fh,
+        )
+    os.replace(fh.name, cache_file)
+
+    return fpu_features, extensions
+
+
+def get_fpu_subsets(fpu_features, transitive_reduction=False):
+    """Return a dict mapping each FPU name to a sorted list of the
+    other FPUs whose features are a subset of its own.
 
-    # Now, for each FPU, find all the FPUs that are subsets of it
-    # (excluding itself).
-    sorted_fpus = list(sorted(fpu_features))
+    Each feature name is interned as one bit of an integer, so that
+    the subset test for a pair of FPUs is a single mask operation
+    instead of a set comparison.
+
+    If transitive_reduction is set, an FPU is only listed as a subset
+    of another if there is no third FPU strictly between them, so the
+    full relation is the transitive closure of the result. FPUs with
+    identical feature sets are always listed as subsets of each other.
+    """
+    feature_bits = {}
+    masks = {}
+    for fpu in sorted(fpu_features):
+        mask = 0
+        for feature in sorted(fpu_features[fpu]):
+            mask |= feature_bits.setdefault(feature, 1 << len(feature_bits))
+        masks[fpu] = mask
+
+    sorted_fpus = list(masks)
+    subsets = {}
     for super_fpu in sorted_fpus:
-        subsets = [
+        super_mask = masks[super_fpu]
+        subsets[super_fpu] = [
             sub_fpu
             for sub_fpu in sorted_fpus
-            if sub_fpu != super_fpu
-            and fpu_features[sub_fpu].issubset(fpu_features[super_fpu])
+            if sub_fpu != super_fpu and masks[sub_fpu] & ~super_mask == 0
         ]
 
+    if transitive_reduction:
+        for super_fpu, sub_fpus in subsets.items():
+            strict_masks = {
+                masks[sub_fpu]
+                for sub_fpu in sub_fpus
+                if masks[sub_fpu] != masks[super_fpu]
+            }
+            subsets[super_fpu] = [
+                sub_fpu
+                for sub_fpu in sub_fpus
+                if not any(
+                    mask != masks[sub_fpu] and masks[sub_fpu] & ~mask == 0
+                    for mask in strict_masks
+                )
+            ]
+
+    return subsets
+
+
+def generate_fpus(fpu_features, transitive_reduction=False):
+    subsets = get_fpu_subsets(fpu_features, transitive_reduction)
+    for super_fpu, sub_fpus in subsets.items():
         # If this FPU has any subsets at all, write a multilib.yaml
         # snippet that adds all the subset FPU flags if it sees the
         # superset flag.
         #
         # The YAML is trivial enough that it's easier to do this by
         # hand than to rely on everyone having python3-yaml available.
-        if len(subsets) > 0:
+        if len(sub_fpus) > 0:
             print("- Match: -mfpu=" + super_fpu)
             print("  Flags:")
-            for sub_fpu in subsets:
+            for sub_fpu in sub_fpus:
                 print("  - -mfpu=" + sub_fpu)
     print()
 
@@ -235,14 +325,15 @@ def get_extension_list(clang, triple):
             yield parts[0]
 
 
-def generate_extensions(args):
-    aarch64_features = get_extension_list(args.clang, "aarch64-none-eabi")
-    aarch32_features = get_extension_list(args.clang, "arm-none-eabi")
-    all_features = list(aarch64_features)
+def generate_extensions(extensions):
+    all_features = []
     # Combine the aarch64 and aarch32 lists without duplication.
     # Casting to sets and merging would be simpler, but creates
     # non-deterministic output.
-    all_features.extend(feat for feat in list(aarch32_features) if feat not in all_features)
+    for triple in EXTENSION_TRIPLES:
+        all_features.extend(
+            feat for feat in extensions[triple] if feat not in all_features
+        )
 
     print("# Expand -march=...+[no]feature... into individual options we can match")
     print("# on. We use 'armvX' to represent a feature applied to any architecture, so")
@@ -312,10 +403,35 @@ def main():
         required=True,
         help="Path to root of llvm-project source tree.",
     )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory in which to cache the information extracted from "
+        "clang between runs.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of clang processes to run concurrently "
+        "(default: number of CPUs).",
+    )
+    parser.add_argument(
+        "--fpu-implications",
+        choices=["full", "reduced"],
+        default="full",
+        help="'full' (the default) makes each -mfpu option imply every "
+        "FPU that is a subset of it. 'reduced' only emits the transitive "
+        "reduction of that graph. clang matches each Match rule against "
+        "the original command-line flags only, not against flags added "
+        "by other rules, so the reduced form is only suitable for "
+        "inspecting the FPU hierarchy or for a consumer that expands "
+        "the rules to a fixed point.",
+    )
     args = parser.parse_args()
 
-    generate_fpus(args)
-    generate_extensions(args)
+    fpu_features, extensions = get_clang_data(args)
+    generate_fpus(fpu_features, args.fpu_implications == "reduced")
+    generate_extensions(extensions)
     generate_versions(args)
 
 if __name__ == "__main__":
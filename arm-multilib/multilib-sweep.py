@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+"""Check which library variant clang selects across many compile flag
+combinations.
+
+The combinations are the product of the target architectures the
+multilib.yaml mappings cover, -march extensions, -mfpu, -mfloat-abi,
+exceptions/RTTI on or off and unaligned access on or off. For each one
+clang is run with -print-multi-directory against the multilib.yaml in
+the given sysroot, and the result is recorded as the variant from
+multilib.json that was selected, or as 'none', 'ambiguous' (more than
+one directory) or 'error' (an Error entry in multilib.yaml matched).
+
+clang only answers one flag set per process, so the invocations are
+deduplicated and run concurrently across a thread pool.
+
+The results can be written to a JSON snapshot with --output, and
+compared against a previous snapshot with --compare, which lists
+every combination whose selection changed and exits with status 1 if
+there were any. That way a change to multilib.yaml.in or
+multilib.json can be checked for unintended effects.
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import subprocess
+import sys
+
+import target_parser_def
+
+# The targets to sweep over. Each entry is the --target triple, the
+# -march value to combine extensions with, and the extensions to try
+# in addition to none at all.
+AARCH32_TARGETS = [
+    ("armv4t-none-eabi", "armv4t", []),
+    ("armv5te-none-eabi", "armv5te", []),
+    ("thumbv6m-none-eabi", "armv6-m", []),
+    ("thumbv7m-none-eabi", "armv7-m", []),
+    ("thumbv7em-none-eabi", "armv7e-m", []),
+    ("armv7r-none-eabi", "armv7-r", []),
+    ("armv7a-none-eabi", "armv7-a", []),
+    ("thumbv8m.base-none-eabi", "armv8-m.base", []),
+    ("thumbv8m.main-none-eabi", "armv8-m.main", []),
+    (
+        "thumbv8.1m.main-none-eabi",
+        "armv8.1-m.main",
+        ["+mve", "+mve.fp", "+fp16", "+pacbti"],
+    ),
+    ("armv8a-none-eabi", "armv8-a", []),
+    ("armv8r-none-eabi", "armv8-r", []),
+]
+AARCH64_TARGETS = [
+    ("aarch64-none-elf", "armv8-a", ["+nofp+nosimd"]),
+    ("aarch64_be-none-elf", "armv8-a", ["+nofp+nosimd"]),
+    ("aarch64-none-elf", "armv8.5-a", []),
+    ("aarch64-none-elf", "armv9.2-a", []),
+]
+
+# Used if --llvm-source isn't given to read the list from
+# ARMTargetParser.def.
+DEFAULT_FPUS = [
+    "vfpv2",
+    "vfpv3-d16",
+    "vfpv3xd",
+    "vfpv3",
+    "fpv4-sp-d16",
+    "fpv5-sp-d16",
+    "fpv5-d16",
+    "fp-armv8",
+    "neon",
+    "neon-fp-armv8",
+    "crypto-neon-fp-armv8",
+]
+
+OPTIONAL_FLAGS = [
+    ["-fno-exceptions", "-fno-rtti"],
+    ["-mno-unaligned-access"],
+]
+
+
+def with_optional_flags(flags):
+    """Yield the flags combined with each subset of OPTIONAL_FLAGS."""
+    for choice in itertools.product([False, True], repeat=len(OPTIONAL_FLAGS)):
+        extra = [
+            flag
+            for chosen, optional in zip(choice, OPTIONAL_FLAGS)
+            if chosen
+            for flag in optional
+        ]
+        yield flags + extra
+
+
+def get_combinations(fpus):
+    """Yield every combination of compile flags to check."""
+    for triple, march, extensions in AARCH32_TARGETS:
+        for extension in [""] + extensions:
+            for fpu in ["none"] + fpus:
+                for float_abi in ["soft", "softfp", "hard"]:
+                    yield from with_optional_flags(
+                        [
+                            f"--target={triple}",
+                            f"-march={march}{extension}",
+                            f"-mfpu={fpu}",
+                            f"-mfloat-abi={float_abi}",
+                        ]
+                    )
+    for triple, march, extensions in AARCH64_TARGETS:
+        for extension in [""] + extensions:
+            flags = [f"--target={triple}", f"-march={march}{extension}"]
+            if "nofp" in extension:
+                flags.append("-mabi=aapcs-soft")
+            yield from with_optional_flags(flags)
+
+
+def get_variant_names(multilib_json):
+    """Return the set of variant names defined in multilib.json."""
+    with open(multilib_json) as fh:
+        return {lib["variant"] for lib in json.load(fh)["libs"]}
+
+
+def query_clang(args, flags):
+    """Run clang to find which library directory it selects."""
+    command = (
+        [args.clang]
+        + flags
+        + [f"--sysroot={args.sysroot}", "-print-multi-directory"]
+    )
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"status": "error", "message": result.stderr.strip()}
+    dirs = [line for line in result.stdout.splitlines() if line not in ("", ".")]
+    if not dirs:
+        return {"status": "none"}
+    return {"status": "ambiguous" if len(dirs) > 1 else "selected", "dirs": dirs}
+
+
+def describe(result, variant_names):
+    """Turn the raw clang result into the form stored in the snapshot."""
+    if "dirs" not in result:
+        return result
+    variants = []
+    for directory in result["dirs"]:
+        variant = os.path.basename(directory)
+        variants.append(variant if variant in variant_names else directory)
+    return {"status": result["status"], "variants": variants}
+
+
+def run_sweep(args):
+    if args.llvm_source:
+        index = target_parser_def.load(
+            target_parser_def.get_def_path(args.llvm_source)
+        )
+        fpus = index.hardware_fpus()
+    else:
+        fpus = DEFAULT_FPUS
+
+    variant_names = get_variant_names(args.multilib_json)
+    combinations = {" ".join(flags): flags for flags in get_combinations(fpus)}
+
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(query_clang, args, flags): key
+            for key, flags in combinations.items()
+        }
+        for done, future in enumerate(
+            concurrent.futures.as_completed(futures), 1
+        ):
+            results[futures[future]] = describe(future.result(), variant_names)
+            if args.verbose and done % 1000 == 0:
+                print(f"{done}/{len(futures)} combinations checked", file=sys.stderr)
+    return dict(sorted(results.items()))
+
+
+def compare(old, new):
+    """Print the differences between two snapshots and return how many
+    combinations differ."""
+    differences = 0
+    for key in sorted(old.keys() | new.keys()):
+        if old.get(key) == new.get(key):
+            continue
+        differences += 1
+        print(key)
+        print(f"  was: {json.dumps(old.get(key))}")
+        print(f"  now: {json.dumps(new.get(key))}")
+    return differences
+
+
+def summarise(results, variant_names):
+    """Print how many combinations had each outcome, and which variants
+    were never selected at all."""
+    statuses = {}
+    selected = set()
+    for result in results.values():
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+        selected.update(result.get("variants", []))
+    print(f"{len(results)} combinations checked")
+    for status, count in sorted(statuses.items()):
+        print(f"  {status}: {count}")
+    unselected = sorted(variant_names - selected)
+    if unselected:
+        print("Variants never selected: " + ", ".join(unselected))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--clang", required=True, help="Path to clang executable."
+    )
+    parser.add_argument(
+        "--sysroot",
+        required=True,
+        help="Directory containing the multilib.yaml to test, e.g. "
+        "lib/clang-runtimes in a toolchain build or install.",
+    )
+    parser.add_argument(
+        "--multilib-json",
+        default=os.path.join(os.path.dirname(__file__), "json", "multilib.json"),
+        help="JSON file defining the variants (default: the one in this "
+        "directory).",
+    )
+    parser.add_argument(
+        "--llvm-source",
+        help="Path to root of llvm-project source tree, to read the list of "
+        "FPUs from. A built-in list is used otherwise.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of clang processes to run concurrently "
+        "(default: number of CPUs).",
+    )
+    parser.add_argument(
+        "--output", help="Write the results to this JSON snapshot file."
+    )
+    parser.add_argument(
+        "--compare",
+        help="Compare the results against this JSON snapshot file, and "
+        "exit with status 1 if they differ.",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Print progress information."
+    )
+    args = parser.parse_args()
+
+    results = run_sweep(args)
+    summarise(results, get_variant_names(args.multilib_json))
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=1)
+            fh.write("\n")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            previous = json.load(fh)
+        differences = compare(previous, results)
+        if differences:
+            print(f"{differences} combinations differ from {args.compare}")
+            sys.exit(1)
+        print(f"No differences from {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
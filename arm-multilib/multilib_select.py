@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+"""Simulate clang's library selection from a multilib.yaml file.
+
+Given the multilib flags for a compile command (as printed by
+`clang -print-multi-flags-experimental`), this reproduces what clang
+does with them:
+
+1. Each Mappings entry whose Match regex matches one of the input
+   flags in full adds its Flags to the set. As in clang, the regexes
+   are only matched against the original input flags, not against
+   flags added by other mappings.
+
+2. Every variant whose Flags are all in the expanded set is a
+   candidate. Within an exclusive group only the last candidate in
+   file order is kept.
+
+3. If any selected variant is an Error entry, selection fails with
+   its message.
+
+Running this in-process is much cheaper than starting a clang process
+per query, which makes it suitable for checking large numbers of flag
+combinations. The regex results for each distinct input flag are
+cached, since the same few flags recur across most queries.
+
+Only the subset of YAML that CMakeLists.txt and multilib-generate.py
+write is understood, so that python3-yaml isn't needed.
+"""
+
+import argparse
+import re
+import sys
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Variant:
+    dir: str
+    error: str
+    flags: frozenset
+    group: str
+
+
+@dataclass
+class Mapping:
+    match: str
+    flags: list
+    regex: re.Pattern = field(repr=False)
+
+
+def parse_scalar(text):
+    """Parse a plain, single-quoted or double-quoted YAML scalar."""
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] == "'":
+        return text[1:-1].replace("''", "'")
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        return text[1:-1].encode().decode("unicode_escape")
+    return text
+
+
+def parse_yaml(text):
+    """Parse the restricted YAML used by multilib.yaml.
+
+    That is a top-level mapping whose values are either scalars or
+    lists of mappings, and those mappings' values are either scalars
+    or lists of scalars. Returns nested dicts and lists.
+    """
+    document = {}
+    top_list = None
+    item = None
+    item_list = None
+    for lineno, line in enumerate(text.splitlines(), 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        indent = len(line) - len(line.lstrip(" "))
+        if indent == 0 and not stripped.startswith("-"):
+            key, _, value = stripped.partition(":")
+            if value.strip():
+                document[key] = parse_scalar(value)
+                top_list = None
+            else:
+                top_list = document[key] = []
+            item = item_list = None
+        elif indent == 0 and top_list is not None:
+            item = {}
+            top_list.append(item)
+            item_list = None
+            key, _, value = stripped[1:].strip().partition(":")
+            item[key] = parse_scalar(value)
+        elif indent == 2 and stripped.startswith("- ") and item_list is not None:
+            item_list.append(parse_scalar(stripped[2:]))
+        elif indent == 2 and item is not None:
+            key, _, value = stripped.partition(":")
+            if value.strip():
+                item[key] = parse_scalar(value)
+                item_list = None
+            else:
+                item_list = item[key] = []
+        else:
+            raise ValueError(
+                f"line {lineno}: unsupported multilib.yaml syntax: {line}"
+            )
+    return document
+
+
+def compile_match(match):
+    """Compile a Match regex the way clang does, anchoring it at both
+    ends unless it is already anchored."""
+    if not match.startswith("^"):
+        match = "^" + match
+    if not match.endswith("$"):
+        match = match + "$"
+    return re.compile(match)
+
+
+class MultilibSet:
+    def __init__(self, variants, mappings, exclusive_groups, cache_flags=True):
+        self.variants = variants
+        self.mappings = mappings
+        self.exclusive_groups = exclusive_groups
+        self.cache_flags = cache_flags
+        self._flag_cache = {}
+
+    def flags_added_by(self, flag):
+        """Return the flags the mappings add for one input flag."""
+        if self.cache_flags and flag in self._flag_cache:
+            return self._flag_cache[flag]
+        added = []
+        for mapping in self.mappings:
+            if mapping.regex.match(flag):
+                added.extend(mapping.flags)
+        added = tuple(added)
+        if self.cache_flags:
+            self._flag_cache[flag] = added
+        return added
+
+    def expand_flags(self, flags):
+        """Return the input flags plus all the flags the mappings add."""
+        expanded = set(flags)
+        for flag in flags:
+            expanded.update(self.flags_added_by(flag))
+        return expanded
+
+    def select(self, flags):
+        """Return the list of variants selected for the input flags, in
+        file order. Use selection_error to check for failure."""
+        expanded = self.expand_flags(flags)
+        selected = []
+        groups_seen = set()
+        for variant in reversed(self.variants):
+            if not variant.flags.issubset(expanded):
+                continue
+            if variant.group in self.exclusive_groups:
+                if variant.group in groups_seen:
+                    continue
+                groups_seen.add(variant.group)
+            selected.append(variant)
+        selected.reverse()
+        return selected
+
+    def subset(self, variant_count=None, mapping_count=None):
+        """Return a new MultilibSet with only the first variant_count
+        variants and mapping_count mappings."""
+        return MultilibSet(
+            self.variants[:variant_count],
+            self.mappings[:mapping_count],
+            self.exclusive_groups,
+            self.cache_flags,
+        )
+
+
+def selection_error(selected):
+    """Return an error message if a selection failed, or None."""
+    if not selected:
+        return "no multilib variant matches"
+    errors = [variant.error for variant in selected if variant.error]
+    if errors:
+        return "\n".join(errors)
+    return None
+
+
+def load(path, cache_flags=True):
+    """Load a multilib.yaml file into a MultilibSet."""
+    with open(path) as fh:
+        document = parse_yaml(fh.read())
+
+    version = document.get("MultilibVersion", "")
+    if not version.startswith("1."):
+        raise ValueError(f"{path}: unsupported MultilibVersion '{version}'")
+
+    exclusive_groups = {
+        group["Name"]
+        for group in document.get("Groups", [])
+        if group.get("Type") == "Exclusive"
+    }
+    variants = [
+        Variant(
+            variant.get("Dir"),
+            variant.get("Error"),
+            frozenset(variant.get("Flags", [])),
+            variant.get("Group"),
+        )
+        for variant in document.get("Variants", [])
+    ]
+    mappings = [
+        Mapping(mapping["Match"], mapping["Flags"], compile_match(mapping["Match"]))
+        for mapping in document.get("Mappings", [])
+    ]
+    return MultilibSet(variants, mappings, exclusive_groups, cache_flags)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--multilib-yaml", required=True, help="Path to multilib.yaml."
+    )
+    parser.add_argument(
+        "--print-expanded-flags",
+        action="store_true",
+        help="Print the expanded flag set before the selected variants.",
+    )
+    parser.add_argument(
+        "flags",
+        nargs="*",
+        help="Multilib flags, as printed by clang -print-multi-flags-experimental. "
+        "Put '--' before them, since they start with '-'.",
+    )
+    args = parser.parse_args()
+
+    multilib_set = load(args.multilib_yaml)
+    if args.print_expanded_flags:
+        for flag in sorted(multilib_set.expand_flags(args.flags)):
+            print(flag)
+        print()
+    selected = multilib_set.select(args.flags)
+    error = selection_error(selected)
+    if error is not None:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+    for variant in selected:
+        print(variant.dir)
+
+
+if __name__ == "__main__":
+    main()
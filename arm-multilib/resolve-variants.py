@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+"""Resolve the library variant definitions for one C library.
+
+The variants are defined in multilib.json, which names a JSON file in
+json/variants for each of them. The "args" of those files hold the
+CMake arguments of the variant: a "common" section, and a section for
+each C library whose values take precedence over the common ones.
+
+This script reads and checks all of those files once, merges the
+sections for the chosen C library, and writes the result to the output
+directory in two forms:
+
+resolved-variants.json
+    {"c_library": ..., "sources": [...], "libs": [...]}, where each
+    entry of "libs" has the "variant" and "flags" from multilib.json,
+    and either the "json" file and its merged "args", or the "error"
+    of a placeholder. Variants that don't support the C library are
+    left out.
+
+resolved-variants.cmake
+    The same, as CMake variables, so that arm-multilib/CMakeLists.txt
+    and arm-runtimes/CMakeLists.txt can load it with a single include:
+      resolved_c_library       the C library
+      resolved_sources         the files it was resolved from
+      resolved_libs            the variant names, in multilib.json order
+      resolved_<v>_flags       the multilib flags of variant <v>
+      resolved_<v>_json        its variant JSON file, or
+      resolved_<v>_error       the error message of a placeholder
+      resolved_<v>_args        the names of its merged arguments
+      resolved_<v>_<arg>       the value of each argument
+
+The files are only rewritten when their contents change, so that
+CMake doesn't see them as modified on every configure.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+JSON_FILE = "resolved-variants.json"
+CMAKE_FILE = "resolved-variants.cmake"
+
+
+def check_strings(mapping, where, errors):
+    if not isinstance(mapping, dict):
+        errors.append(f"{where}: expected an object")
+        return False
+    for key, value in mapping.items():
+        if not isinstance(value, str):
+            errors.append(f"{where}: {key} must be a string")
+    return True
+
+
+def resolve_variant(variant_file, c_library, errors):
+    """Return the merged args of a variant JSON file, adding any
+    problems found to errors."""
+    try:
+        with open(variant_file) as fh:
+            variant_json = json.load(fh)
+    except (OSError, ValueError) as e:
+        errors.append(f"{variant_file}: {e}")
+        return None
+    sections = variant_json.get("args") if isinstance(variant_json, dict) else None
+    if not isinstance(sections, dict):
+        errors.append(f"{variant_file}: missing the \"args\" object")
+        return None
+    args = {}
+    for section in ("common", c_library):
+        if section not in sections:
+            errors.append(f"{variant_file}: missing the args.{section} object")
+            return None
+        if check_strings(sections[section], f"{variant_file}: args.{section}", errors):
+            args.update(sections[section])
+    return args
+
+
+def resolve(multilib_json, variants_dir, c_library):
+    """Return the resolved index, and a list of the problems found."""
+    errors = []
+    sources = [multilib_json]
+    try:
+        with open(multilib_json) as fh:
+            libs = json.load(fh)["libs"]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        return None, [f"{multilib_json}: {e}"]
+
+    resolved = []
+    seen = set()
+    for index, lib in enumerate(libs):
+        where = f"{multilib_json}: libs[{index}]"
+        if not isinstance(lib, dict) or not check_strings(lib, where, errors):
+            continue
+        variant = lib.get("variant")
+        if not variant or "flags" not in lib:
+            errors.append(f"{where}: \"variant\" and \"flags\" are required")
+            continue
+        if variant in seen:
+            errors.append(f"{where}: variant {variant} is defined more than once")
+            continue
+        seen.add(variant)
+        if ("json" in lib) == ("error" in lib):
+            errors.append(f"{where}: exactly one of \"json\" and \"error\" is required")
+            continue
+        supported = lib.get("libraries_supported")
+        if supported is not None and c_library not in supported.split(","):
+            continue
+
+        entry = {"variant": variant, "flags": lib["flags"]}
+        if "error" in lib:
+            entry["error"] = lib["error"]
+        else:
+            variant_file = os.path.join(variants_dir, lib["json"])
+            sources.append(variant_file)
+            args = resolve_variant(variant_file, c_library, errors)
+            if args is None:
+                continue
+            entry["json"] = variant_file
+            entry["args"] = args
+        resolved.append(entry)
+
+    index = {"c_library": c_library, "sources": sources, "libs": resolved}
+    return index, errors
+
+
+def cmake_value(value):
+    """Return value as a CMake bracket argument, which needs no escaping."""
+    level = 0
+    while f"]{'=' * level}]" in value:
+        level += 1
+    return f"[{'=' * level}[{value}]{'=' * level}]"
+
+
+def cmake_set(name, *values):
+    return f"set({' '.join([name] + [cmake_value(v) for v in values])})\n"
+
+
+def format_cmake(index):
+    lines = [
+        "# Generated by arm-multilib/resolve-variants.py. Do not edit.\n",
+        cmake_set("resolved_c_library", index["c_library"]),
+        cmake_set("resolved_sources", *index["sources"]),
+        cmake_set("resolved_libs", *(lib["variant"] for lib in index["libs"])),
+    ]
+    for lib in index["libs"]:
+        prefix = f"resolved_{lib['variant']}"
+        lines.append(cmake_set(f"{prefix}_flags", lib["flags"]))
+        if "error" in lib:
+            lines.append(cmake_set(f"{prefix}_error", lib["error"]))
+            continue
+        lines.append(cmake_set(f"{prefix}_json", lib["json"]))
+        lines.append(cmake_set(f"{prefix}_args", *lib["args"]))
+        for name, value in lib["args"].items():
+            lines.append(cmake_set(f"{prefix}_{name}", value))
+    return "".join(lines)
+
+
+def write_if_changed(filename, contents):
+    try:
+        with open(filename) as fh:
+            if fh.read() == contents:
+                return
+    except FileNotFoundError:
+        pass
+    with open(filename + ".tmp", "w") as fh:
+        fh.write(contents)
+    os.replace(filename + ".tmp", filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--multilib-json",
+        default=os.path.join(os.path.dirname(__file__), "json", "multilib.json"),
+        help="The multilib.json file listing the variants",
+    )
+    parser.add_argument(
+        "--variants-dir",
+        help="Directory of the variant JSON files (default: the variants "
+        "directory next to multilib.json)",
+    )
+    parser.add_argument(
+        "--c-library",
+        required=True,
+        help="The C library to resolve the variants for",
+    )
+    parser.add_argument(
+        "--output-dir",
+        required=True,
+        help="Directory to write the resolved index to",
+    )
+    args = parser.parse_args()
+
+    multilib_json = os.path.abspath(args.multilib_json)
+    variants_dir = os.path.abspath(
+        args.variants_dir or os.path.join(os.path.dirname(multilib_json), "variants")
+    )
+    index, errors = resolve(multilib_json, variants_dir, args.c_library)
+    if errors:
+        for error in errors:
+            print(error, file=sys.stderr)
+        sys.exit(1)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    write_if_changed(
+        os.path.join(args.output_dir, JSON_FILE), json.dumps(index, indent=1) + "\n"
+    )
+    write_if_changed(os.path.join(args.output_dir, CMAKE_FILE), format_cmake(index))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+"""Read the macro tables in LLVM's ARMTargetParser.def without a C
+preprocessor.
+
+ARMTargetParser.def is a list of calls to macros such as ARM_FPU and
+ARM_CPU_NAME, which LLVM's own build expands by #including it with
+suitable #defines. The calls are simple enough to parse directly: each
+one is a macro name followed by a parenthesised, comma-separated list
+of arguments, where the arguments are string literals, identifiers,
+{} or parenthesised expressions.
+
+load() turns the file into a TargetParserIndex, which holds one table
+per macro plus some lookups between them, for example from an
+architecture ID to every CPU that implements it.
+
+Run as a script, this prints the index as JSON, which is handy for
+checking what a given LLVM source tree contains.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from dataclasses import asdict, dataclass, field
+
+
+@dataclass
+class FPU:
+    name: str
+    kind: str
+    version: str
+    neon_support: str
+    restriction: str
+
+
+@dataclass
+class Arch:
+    name: str
+    id: str
+    cpu_attr: str
+    sub_arch: str
+    arch_attr: str
+    default_fpu: str
+    base_extensions: str
+
+
+@dataclass
+class ArchExtension:
+    name: str
+    id: str
+    feature: str
+    neg_feature: str
+
+
+@dataclass
+class CPU:
+    name: str
+    arch_id: str
+    default_fpu: str
+    is_default: bool
+    default_extensions: str
+
+
+# Map each macro name to the record type its calls are stored as.
+MACRO_TYPES = {
+    "ARM_FPU": FPU,
+    "ARM_ARCH": Arch,
+    "ARM_ARCH_EXT_NAME": ArchExtension,
+    "ARM_CPU_NAME": CPU,
+}
+
+MACRO_CALL_RE = re.compile(
+    r"\b(" + "|".join(MACRO_TYPES) + r")\s*\("
+)
+
+DIRECTIVE_RE = re.compile(r"[ \t]*#")
+
+CLOSING_BRACKETS = {"(": ")", "{": "}", "[": "]"}
+
+
+@dataclass
+class TargetParserIndex:
+    fpus: dict = field(default_factory=dict)
+    archs: dict = field(default_factory=dict)
+    extensions: dict = field(default_factory=dict)
+    cpus: dict = field(default_factory=dict)
+    fpus_by_kind: dict = field(default_factory=dict)
+    archs_by_id: dict = field(default_factory=dict)
+    cpus_by_arch: dict = field(default_factory=dict)
+
+    def add(self, record):
+        if isinstance(record, FPU):
+            self.fpus[record.name] = record
+            self.fpus_by_kind[record.kind] = record
+        elif isinstance(record, Arch):
+            self.archs[record.name] = record
+            self.archs_by_id[record.id] = record
+        elif isinstance(record, ArchExtension):
+            self.extensions[record.name] = record
+        elif isinstance(record, CPU):
+            self.cpus[record.name] = record
+            self.cpus_by_arch.setdefault(record.arch_id, []).append(record)
+
+    def hardware_fpus(self):
+        """Return the names of the FPUs that are real FPUs, i.e. not
+        'none' or 'invalid', in file order."""
+        names = []
+        for fpu in self.fpus.values():
+            assert fpu.version.startswith("FPUVersion::"), (
+                f"FPU type value {fpu.version} not of the expected form!\n"
+                "Has ARMTargetParser.def been refactored?"
+            )
+            if fpu.version != "FPUVersion::NONE":
+                names.append(fpu.name)
+        return names
+
+    def cpu_default_fpu(self, cpu_name):
+        """Return the FPU record for a CPU's default FPU, or None."""
+        cpu = self.cpus[cpu_name]
+        return self.fpus_by_kind.get(cpu.default_fpu)
+
+
+def strip_comments_and_directives(text):
+    """Return the text with C comments and preprocessor lines removed.
+
+    String literals are passed through untouched, so that a '//'
+    inside one isn't mistaken for a comment. Removed comments are
+    replaced by a space and removed directives by an empty line.
+    """
+    text = text.replace("\\\n", "")
+    output = []
+    pos = 0
+    at_line_start = True
+    while pos < len(text):
+        char = text[pos]
+        if at_line_start and DIRECTIVE_RE.match(text, pos):
+            end = text.find("\n", pos)
+            pos = len(text) if end < 0 else end
+            continue
+        if text.startswith("//", pos):
+            end = text.find("\n", pos)
+            pos = len(text) if end < 0 else end
+            continue
+        if text.startswith("/*", pos):
+            end = text.find("*/", pos + 2)
+            assert end >= 0, "unterminated comment in ARMTargetParser.def"
+            output.append(" ")
+            pos = end + 2
+            continue
+        if char == '"':
+            end = pos + 1
+            while text[end] != '"':
+                end += 2 if text[end] == "\\" else 1
+            output.append(text[pos : end + 1])
+            pos = end + 1
+            at_line_start = False
+            continue
+        output.append(char)
+        if char == "\n":
+            at_line_start = True
+        elif not char.isspace():
+            at_line_start = False
+        pos += 1
+    return "".join(output)
+
+
+def split_arguments(text, start):
+    """Split the macro arguments starting just after an opening
+    parenthesis at text[start - 1].
+
+    Returns a tuple of the list of argument strings and the position
+    just after the closing parenthesis.
+    """
+    args = []
+    expected = [")"]
+    current = start
+    pos = start
+    while expected:
+        char = text[pos]
+        if char == '"':
+            pos += 1
+            while text[pos] != '"':
+                pos += 2 if text[pos] == "\\" else 1
+        elif char in CLOSING_BRACKETS:
+            expected.append(CLOSING_BRACKETS[char])
+        elif char in ")}]":
+            assert char == expected.pop(), (
+                f"mismatched '{char}' in ARMTargetParser.def macro call:\n"
+                f"{text[start:pos + 1]}"
+            )
+            if not expected:
+                args.append(text[current:pos])
+        elif char == "," and len(expected) == 1:
+            args.append(text[current:pos])
+            current = pos + 1
+        pos += 1
+    return args, pos
+
+
+def convert_argument(arg):
+    """Turn one macro argument into a Python value.
+
+    String literals become the string they denote, true and false
+    become bools, and anything else is kept as its source text with
+    whitespace normalised.
+    """
+    arg = " ".join(arg.split())
+    if arg.startswith('"') and arg.endswith('"'):
+        return json.loads(arg)
+    if arg in ("true", "false"):
+        return arg == "true"
+    return arg
+
+
+def parse(text):
+    """Yield a record for each recognised macro call in the text."""
+    text = strip_comments_and_directives(text)
+    pos = 0
+    while True:
+        match = MACRO_CALL_RE.search(text, pos)
+        if match is None:
+            return
+        macro = match.group(1)
+        args, pos = split_arguments(text, match.end())
+        record_type = MACRO_TYPES[macro]
+        expected_len = len(record_type.__dataclass_fields__)
+        assert len(args) == expected_len, (
+            f"{macro} call has {len(args)} arguments, expected {expected_len}:\n"
+            f"{text[match.start():pos]}\n"
+            "Has ARMTargetParser.def been refactored?"
+        )
+        yield record_type(*map(convert_argument, args))
+
+
+def load(path):
+    """Parse ARMTargetParser.def and return a TargetParserIndex."""
+    with open(path) as fh:
+        text = fh.read()
+    index = TargetParserIndex()
+    for record in parse(text):
+        index.add(record)
+    return index
+
+
+def get_def_path(llvm_source):
+    """Return the path of ARMTargetParser.def in an LLVM source tree."""
+    return os.path.join(
+        llvm_source,
+        "llvm",
+        "include",
+        "llvm",
+        "TargetParser",
+        "ARMTargetParser.def",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--llvm-source",
+        required=True,
+        help="Path to root of llvm-project source tree.",
+    )
+    args = parser.parse_args()
+
+    index = load(get_def_path(args.llvm_source))
+    json.dump(
+        {
+            "fpus": [asdict(fpu) for fpu in index.fpus.values()],
+            "archs": [asdict(arch) for arch in index.archs.values()],
+            "extensions": [asdict(ext) for ext in index.extensions.values()],
+            "cpus": [asdict(cpu) for cpu in index.cpus.values()],
+        },
+        sys.stdout,
+        indent=4,
+    )
+    print()
+
+
+if __name__ == "__main__":
+    main()
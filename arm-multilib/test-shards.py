@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+"""Split the library tests into shards, to run on several machines.
+
+The tests are divided into units: one check target (check-picolibc,
+check-compiler-rt, check-cxx, ...) of one variant. With
+TEST_SHARD_COUNT set, arm-multilib/CMakeLists.txt uses this script to
+choose the units run by the check targets of shard TEST_SHARD_INDEX.
+
+It has two subcommands:
+
+plan
+    Prints the units of one shard, one per line, as
+    "<variant> <check target> <piece> <pieces>". The work of each unit
+    is estimated from the history, as its duration multiplied by the
+    number of pieces it was split into, taking the largest of the last
+    HISTORY_WINDOW runs. Units with no history are assumed to be
+    average.
+
+    A lit-based unit with more work than a shard should have is split
+    into pieces, run with lit's own sharding. Its pieces always go to
+    different shards. The units and pieces are then ranked heaviest
+    first, and each given to the shard with the least work so far.
+
+    Every shard must be planned from the same units and history, so
+    that the shards together run every test exactly once. Ties are
+    broken by name, so the plan doesn't depend on the order of the
+    arguments.
+
+run
+    Runs one unit and appends its duration to the JSON-lines history
+    file. Histories from several machines can be concatenated to plan
+    the next run.
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# The check targets whose tests are run by lit, which can run a subset
+# of them given LIT_NUM_SHARDS and LIT_RUN_SHARD.
+LIT_TARGETS = ["check-compiler-rt", "check-cxx", "check-cxxabi", "check-unwind"]
+
+HISTORY_WINDOW = 5
+
+
+def read_history(history_file):
+    """Return the recorded runs of each (variant, target), oldest first."""
+    runs = {}
+    if not history_file:
+        return runs
+    try:
+        with open(history_file) as fh:
+            lines = fh.readlines()
+    except FileNotFoundError:
+        return runs
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        key = (record["variant"], record["target"])
+        runs.setdefault(key, []).append(record)
+    return runs
+
+
+def estimate_work(records):
+    """Return the estimated work of a unit in seconds."""
+    recent = records[-HISTORY_WINDOW:]
+    return max(record["seconds"] * record["pieces"] for record in recent)
+
+
+def split_units(work, count):
+    """Return the pieces of each unit as (variant, target, piece,
+    pieces, work) tuples, splitting the heavy lit-based units."""
+    target_work = max(sum(work.values()) / count, 1e-9)
+    pieces = []
+    for (variant, target), unit_work in sorted(work.items()):
+        parts = 1
+        if target in LIT_TARGETS:
+            parts = min(max(math.ceil(unit_work / target_work), 1), count)
+        for piece in range(1, parts + 1):
+            pieces.append((variant, target, piece, parts, unit_work / parts))
+    return pieces
+
+
+def plan_shards(units, runs, count):
+    """Return the pieces run by each of count shards."""
+    work = {}
+    for unit in units:
+        records = runs.get(unit)
+        work[unit] = estimate_work(records) if records else None
+    known = [w for w in work.values() if w is not None]
+    default = statistics.mean(known) if known else 1.0
+    work = {unit: w if w is not None else default for unit, w in work.items()}
+
+    shards = [[] for _ in range(count)]
+    loads = [0.0] * count
+    ranked = sorted(split_units(work, count), key=lambda p: (-p[4], p[:4]))
+    for variant, target, piece, parts, piece_work in ranked:
+        taken = {
+            index
+            for index, shard in enumerate(shards)
+            if any(p[:2] == (variant, target) for p in shard)
+        }
+        index = min(
+            (index for index in range(count) if index not in taken),
+            key=lambda index: (loads[index], index),
+        )
+        shards[index].append((variant, target, piece, parts))
+        loads[index] += piece_work
+    return shards
+
+
+def parse_unit(text):
+    variant, sep, target = text.partition(":")
+    if not sep or not variant or not target:
+        raise argparse.ArgumentTypeError(
+            f"{text!r} is not in the form <variant>:<check target>"
+        )
+    return variant, target
+
+
+def print_plan(args):
+    if not 0 <= args.index < args.count:
+        sys.exit(f"shard index {args.index} is not less than the count {args.count}")
+    shards = plan_shards(set(args.units), read_history(args.history), args.count)
+    for variant, target, piece, parts in sorted(shards[args.index]):
+        print(f"{variant} {target} {piece} {parts}")
+
+
+def append_history(history_file, record):
+    line = json.dumps(record).encode() + b"\n"
+    fd = os.open(history_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def run_unit(args):
+    env = os.environ.copy()
+    if args.pieces > 1:
+        env["LIT_NUM_SHARDS"] = str(args.pieces)
+        env["LIT_RUN_SHARD"] = str(args.piece)
+    start_time = time.monotonic()
+    returncode = subprocess.call(args.command, env=env)
+    seconds = time.monotonic() - start_time
+    # Failing tests still ran, so the duration is still useful.
+    append_history(
+        args.history,
+        {
+            "variant": args.variant,
+            "target": args.target,
+            "seconds": seconds,
+            "pieces": args.pieces,
+        },
+    )
+    sys.exit(returncode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--history",
+        help="JSON-lines file of past test durations",
+    )
+    subparsers = parser.add_subparsers(dest="subcommand", required=True)
+
+    plan_parser = subparsers.add_parser("plan", help="Print the units of a shard")
+    plan_parser.add_argument("--count", type=int, required=True, help="Number of shards")
+    plan_parser.add_argument(
+        "--index", type=int, required=True, help="Shard to print, counting from 0"
+    )
+    plan_parser.add_argument(
+        "units",
+        nargs="*",
+        type=parse_unit,
+        help="Every unit to be tested, as <variant>:<check target>",
+    )
+    plan_parser.set_defaults(function=print_plan)
+
+    run_parser = subparsers.add_parser("run", help="Run and record one unit")
+    run_parser.add_argument("--variant", required=True)
+    run_parser.add_argument("--target", required=True)
+    run_parser.add_argument("--piece", type=int, default=1)
+    run_parser.add_argument("--pieces", type=int, default=1)
+    run_parser.add_argument("command", nargs=argparse.REMAINDER)
+    run_parser.set_defaults(function=run_unit)
+
+    args = parser.parse_args()
+    if args.subcommand == "plan" and args.count < 1:
+        parser.error("the shard count must be at least 1")
+    if args.subcommand == "run":
+        if args.command[:1] == ["--"]:
+            args.command = args.command[1:]
+        if not args.command:
+            parser.error("run needs a command")
+        if not args.history:
+            parser.error("run needs --history")
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+"""Check multilib.json and the variant JSON files for mistakes.
+
+A mistake in these files, such as a misspelt argument, a missing JSON
+file or an FVP config that doesn't exist, would otherwise only show up
+when the variant is built or tested. arm-multilib/CMakeLists.txt runs
+this script before anything else at configure time, and it takes a
+fraction of a second.
+
+The arguments each variant can set are taken from
+arm-runtimes/CMakeLists.txt, which reads them: every
+"set(<ARG> ${<ARG>_def} CACHE <type> ...)" is an argument, a BOOL must
+be ON or OFF, and one with a "set_property(CACHE <ARG> PROPERTY
+STRINGS ...)" must be one of those strings. The other checks are:
+
+multilib.json
+    Each entry has a unique "variant", its "flags", and either a
+    "json" file that exists or the "error" of a placeholder. No two
+    entries have the same flags, AArch64 variants have AArch64
+    targets, and every variant JSON file is used (unless
+    --allow-unused is given).
+
+multilib flags
+    Only the options that clang uses to select a multilib are used.
+    A flag that multilib.yaml.in normalises with a mapping, such as an
+    -march with several extensions, can't select a variant, so the
+    variant must use one of the flags the mappings produce instead.
+
+variant JSON files
+    There is a "common" section and one for each C library. Memory
+    addresses and sizes are numbers. FVP_MODEL is a model in
+    run_fvp.MODELS and each FVP_CONFIG has a file in fvp/config. A
+    QEMU variant has QEMU_MACHINE and QEMU_CPU.
+
+Every problem found is printed, and the exit code is 1 if there were
+any.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from os import path
+
+REPO_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+
+sys.path.append(path.join(REPO_DIR, "arm-runtimes", "test-support"))
+from run_fvp import MODELS
+
+# The options clang passes to multilib selection, with or without a value.
+MULTILIB_OPTIONS = {
+    "--target",
+    "-march",
+    "-mabi",
+    "-mbranch-protection",
+    "-mfloat-abi",
+    "-mfpu",
+    "-fno-exceptions",
+    "-fno-rtti",
+    "-mno-unaligned-access",
+}
+
+LIB_KEYS = {"variant", "json", "flags", "error", "libraries_supported"}
+
+REQUIRED_ARGS = ["TARGET_ARCH", "VARIANT", "COMPILE_FLAGS", "TEST_EXECUTOR"]
+
+MEMORY_ARG = re.compile(r".*_(ADDRESS|SIZE)$")
+MEMORY_VALUE = re.compile(r"0x[0-9a-fA-F]+|[0-9]+[KM]?")
+
+
+class Problems:
+    def __init__(self):
+        self.messages = []
+
+    def add(self, where, message):
+        # The same setting can be inherited by several C libraries.
+        message = f"{where}: {message}"
+        if message not in self.messages:
+            self.messages.append(message)
+
+
+def read_runtimes_args(cmakelists):
+    """Return the type of each argument arm-runtimes reads from a
+    variant JSON, and the allowed values of those that have them."""
+    with open(cmakelists) as fh:
+        text = fh.read()
+    arg_types = {
+        name: arg_type
+        for name, arg_type in re.findall(
+            r"set\((\w+) \$\{\1_def\} CACHE (\w+)", text
+        )
+    }
+    choices = {}
+    for name, values in re.findall(
+        r"set_property\(CACHE (\w+) PROPERTY STRINGS ([^)]*)\)", text
+    ):
+        choices[name] = [value.strip('"') for value in values.split()]
+    return arg_types, choices
+
+
+def read_mappings(multilib_yaml_in):
+    """Return the Match patterns of the mappings in multilib.yaml.in,
+    and the flags the mappings produce. The template isn't valid YAML,
+    but the Mappings section is simple enough to read line by line."""
+    patterns = []
+    produced = set()
+    in_mappings = False
+    with open(multilib_yaml_in) as fh:
+        for line in fh:
+            line = line.rstrip("\n")
+            if line.startswith("Mappings:"):
+                in_mappings = True
+            elif not in_mappings or line.startswith("#"):
+                continue
+            elif line.startswith("- Match: "):
+                patterns.append(re.compile(line[len("- Match: "):].strip()))
+            elif line.startswith("  - "):
+                produced.add(line[len("  - "):].strip())
+    return patterns, produced
+
+
+def check_flags(where, flags, patterns, produced, problems):
+    for flag in flags:
+        option = flag.split("=", 1)[0]
+        if option not in MULTILIB_OPTIONS:
+            problems.add(where, f"{flag} is not an option used to select multilibs")
+            continue
+        if option == "--target" or flag in produced:
+            continue
+        if any(pattern.fullmatch(flag) for pattern in patterns):
+            problems.add(
+                where,
+                f"{flag} is normalised by a mapping in multilib.yaml.in, so it "
+                "never selects a variant; use the flags the mapping produces",
+            )
+
+
+def check_args(where, section, args, arg_types, choices, problems):
+    if not isinstance(args, dict):
+        problems.add(where, f"args.{section} must be an object")
+        return
+    for name, value in args.items():
+        if name not in arg_types:
+            problems.add(where, f"args.{section}.{name} is not an argument of arm-runtimes")
+            continue
+        if not isinstance(value, str):
+            problems.add(where, f"args.{section}.{name} must be a string")
+            continue
+        if arg_types[name] == "BOOL" and value not in ("ON", "OFF"):
+            problems.add(where, f"args.{section}.{name} must be ON or OFF, not {value!r}")
+        if name in choices and value not in choices[name]:
+            problems.add(
+                where,
+                f"args.{section}.{name} must be one of "
+                f"{', '.join(choices[name])}, not {value!r}",
+            )
+        if MEMORY_ARG.match(name) and not MEMORY_VALUE.fullmatch(value):
+            problems.add(where, f"args.{section}.{name} is not a number: {value!r}")
+
+
+def check_executor(where, args, fvp_config_dir, problems):
+    """Check the test executor settings of a variant's merged args."""
+    executor = args.get("TEST_EXECUTOR")
+    if executor == "fvp":
+        model = args.get("FVP_MODEL")
+        if model not in MODELS:
+            problems.add(
+                where,
+                f"FVP_MODEL {model!r} is not one of {', '.join(sorted(MODELS))}",
+            )
+        for config in args.get("FVP_CONFIG", "").split():
+            if not path.isfile(path.join(fvp_config_dir, config + ".cfg")):
+                problems.add(where, f"FVP_CONFIG {config} has no {config}.cfg in {fvp_config_dir}")
+        if not args.get("FVP_CONFIG"):
+            problems.add(where, "FVP_CONFIG is required by the fvp executor")
+    elif executor == "qemu":
+        for name in ("QEMU_MACHINE", "QEMU_CPU"):
+            if not args.get(name):
+                problems.add(where, f"{name} is required by the qemu executor")
+
+
+def check_variant(variant_file, arg_types, choices, fvp_config_dir, problems):
+    try:
+        with open(variant_file) as fh:
+            variant_json = json.load(fh)
+    except (OSError, ValueError) as e:
+        problems.add(variant_file, str(e))
+        return
+    if not isinstance(variant_json, dict) or set(variant_json) != {"args"}:
+        problems.add(variant_file, 'expected an object with only "args"')
+        return
+    sections = variant_json["args"]
+    if not isinstance(sections, dict):
+        problems.add(variant_file, "args must be an object")
+        return
+    c_libraries = choices.get("C_LIBRARY", [])
+    for section in sections:
+        if section != "common" and section not in c_libraries:
+            problems.add(variant_file, f"args.{section} is not a C library")
+    for section in ["common"] + c_libraries:
+        if section not in sections:
+            problems.add(variant_file, f"args.{section} is missing")
+            continue
+        check_args(variant_file, section, sections[section], arg_types, choices, problems)
+
+    common = sections.get("common")
+    if not isinstance(common, dict):
+        return
+    for name in REQUIRED_ARGS:
+        if name not in common:
+            problems.add(variant_file, f"args.common.{name} is required")
+    for c_library in c_libraries:
+        if isinstance(sections.get(c_library), dict):
+            merged = dict(common, **sections[c_library])
+            check_executor(variant_file, merged, fvp_config_dir, problems)
+
+
+def check_multilib(multilib_json, variants_dir, arg_types, choices, patterns, produced, fvp_config_dir, check_unused, problems):
+    try:
+        with open(multilib_json) as fh:
+            libs = json.load(fh)["libs"]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        problems.add(multilib_json, str(e))
+        return
+    seen_variants = set()
+    seen_flags = {}
+    used_files = set()
+    for index, lib in enumerate(libs):
+        where = f"{multilib_json}: libs[{index}]"
+        if not isinstance(lib, dict):
+            problems.add(where, "expected an object")
+            continue
+        for key in sorted(set(lib) - LIB_KEYS):
+            problems.add(where, f"unknown key {key!r}")
+        for key, value in lib.items():
+            if not isinstance(value, str):
+                problems.add(where, f"{key} must be a string")
+        variant = lib.get("variant")
+        flags = lib.get("flags")
+        if not isinstance(variant, str) or not isinstance(flags, str):
+            problems.add(where, '"variant" and "flags" are required')
+            continue
+        where = f"{multilib_json}: {variant}"
+        if variant in seen_variants:
+            problems.add(where, "defined more than once")
+        seen_variants.add(variant)
+
+        flag_list = flags.split()
+        flag_set = frozenset(flag_list)
+        if flag_set in seen_flags:
+            problems.add(where, f"has the same flags as {seen_flags[flag_set]}")
+        seen_flags.setdefault(flag_set, variant)
+        check_flags(where, flag_list, patterns, produced, problems)
+        targets = [flag for flag in flag_list if flag.startswith("--target=")]
+        if len(targets) != 1:
+            problems.add(where, "needs exactly one --target flag")
+        elif variant.startswith("aarch64") != targets[0].startswith("--target=aarch64"):
+            problems.add(where, f"{targets[0]} doesn't match the variant's name")
+
+        supported = lib.get("libraries_supported")
+        if isinstance(supported, str):
+            for c_library in supported.split(","):
+                if c_library not in choices.get("C_LIBRARY", []):
+                    problems.add(where, f"libraries_supported: {c_library} is not a C library")
+
+        if ("json" in lib) == ("error" in lib):
+            problems.add(where, 'exactly one of "json" and "error" is required')
+        elif isinstance(lib.get("json"), str):
+            variant_file = path.join(variants_dir, lib["json"])
+            used_files.add(path.normpath(variant_file))
+            if not path.isfile(variant_file):
+                problems.add(where, f"{variant_file} does not exist")
+            else:
+                check_variant(variant_file, arg_types, choices, fvp_config_dir, problems)
+
+    if check_unused and path.isdir(variants_dir):
+        for filename in sorted(os.listdir(variants_dir)):
+            variant_file = path.normpath(path.join(variants_dir, filename))
+            if filename.endswith(".json") and variant_file not in used_files:
+                problems.add(variant_file, "is not used by any variant in multilib.json")
+
+
+def main():
+    multilib_dir = path.dirname(path.abspath(__file__))
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--multilib-json",
+        default=path.join(multilib_dir, "json", "multilib.json"),
+        help="The multilib.json file listing the variants",
+    )
+    parser.add_argument(
+        "--variants-dir",
+        help="Directory of the variant JSON files (default: the variants "
+        "directory next to multilib.json)",
+    )
+    parser.add_argument(
+        "--fvp-config-dir",
+        default=path.join(REPO_DIR, "fvp", "config"),
+        help="Directory of the FVP config files",
+    )
+    parser.add_argument(
+        "--allow-unused",
+        action="store_true",
+        help="Don't report variant JSON files that multilib.json doesn't "
+        "use, for a multilib.json listing only some of the variants",
+    )
+    args = parser.parse_args()
+
+    variants_dir = args.variants_dir or path.join(
+        path.dirname(args.multilib_json), "variants"
+    )
+    arg_types, choices = read_runtimes_args(
+        path.join(REPO_DIR, "arm-runtimes", "CMakeLists.txt")
+    )
+    patterns, produced = read_mappings(path.join(multilib_dir, "multilib.yaml.in"))
+    problems = Problems()
+    check_multilib(
+        args.multilib_json,
+        variants_dir,
+        arg_types,
+        choices,
+        patterns,
+        produced,
+        args.fvp_config_dir,
+        not args.allow_unused,
+        problems,
+    )
+    for message in problems.messages:
+        print(message, file=sys.stderr)
+    if problems.messages:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+"""Schedule the library variant build steps using their past durations.
+
+With ENABLE_PARALLEL_LIB_BUILD, each build stage (compiler_rt-build,
+clib-build, cxxlibs-build) of every variant runs at once, each with
+the same PARALLEL_LIB_BUILD_LEVELS jobs, however long the variant
+takes to build. This script replaces that fixed split.
+
+It has two subcommands, both used by arm-multilib/CMakeLists.txt when
+ENABLE_VARIANT_BUILD_SCHEDULER is on:
+
+run
+    Runs one step of one variant. Every step's duration and job count
+    is appended to a JSON-lines history file. For a build stage, the
+    step first waits for its share of the cores, as decided by the
+    plan, and its build gets that many jobs through
+    CMAKE_BUILD_PARALLEL_LEVEL.
+
+plan
+    Runs before the first stage. It estimates how much work each
+    variant's build steps are from the history. That estimate is the
+    duration multiplied by the job count, taking the largest of the
+    last HISTORY_WINDOW runs. A longer window keeps an incremental
+    rebuild from making a variant look cheap.
+
+    For each stage it then:
+    * ranks the variants longest first;
+    * gives each one enough jobs to finish in about the time the
+      whole stage would take if the work were spread evenly over
+      the cores.
+    Variants with no history are assumed to be average.
+
+The cores are shared out by a token count in a file in the plan
+directory, protected by a lock. A waiting step only takes its tokens
+when no waiting step ranked ahead of it is left, so the longest builds
+start first. The short ones fill in the remaining cores towards the
+end of the stage. Tokens held by a process that has died are
+reclaimed.
+"""
+
+import argparse
+import fcntl
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from os import path
+
+# The build stages whose job counts are planned. The configure stages
+# are recorded too, but are largely single-threaded.
+SCHEDULED_STEPS = ["compiler_rt-build", "clib-build", "cxxlibs-build"]
+
+HISTORY_WINDOW = 5
+
+POLL_INTERVAL = 0.5
+
+
+def read_history(history_file):
+    """Return the recorded runs of each (variant, step), oldest first."""
+    runs = {}
+    try:
+        with open(history_file) as fh:
+            lines = fh.readlines()
+    except FileNotFoundError:
+        return runs
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        key = (record["variant"], record["step"])
+        runs.setdefault(key, []).append(record)
+    return runs
+
+
+def estimate_work(records):
+    """Return the estimated work of a step in job-seconds."""
+    recent = records[-HISTORY_WINDOW:]
+    return max(record["seconds"] * record["jobs"] for record in recent)
+
+
+def plan_stage(work, cores):
+    """Return the rank and job count of each variant in a stage, given
+    its estimated work, or None where it has no history."""
+    known = {variant for variant, w in work.items() if w is not None}
+    default = statistics.mean(work[variant] for variant in known) if known else 1.0
+    work = {variant: w if w is not None else default for variant, w in work.items()}
+    target_time = max(sum(work.values()) / cores, 1e-9)
+    ranked = sorted(work, key=lambda variant: (-work[variant], variant))
+    return {
+        variant: {
+            "rank": rank,
+            "jobs": min(max(math.ceil(work[variant] / target_time), 1), cores),
+            "estimate": work[variant],
+            "measured": variant in known,
+        }
+        for rank, variant in enumerate(ranked)
+    }
+
+
+def make_plan(history_file, variants, cores):
+    runs = read_history(history_file)
+    plan = {"cores": cores, "steps": {}}
+    for step in SCHEDULED_STEPS:
+        work = {}
+        for variant in variants:
+            records = runs.get((variant, step))
+            work[variant] = estimate_work(records) if records else None
+        plan["steps"][step] = plan_stage(work, cores)
+    return plan
+
+
+def print_plan(plan):
+    cores = plan["cores"]
+    for step, stage in plan["steps"].items():
+        if not any(entry["measured"] for entry in stage.values()):
+            print(f"{step}: no history")
+            continue
+        total = sum(entry["estimate"] for entry in stage.values())
+        print(f"{step}: about {total / cores:.0f}s on {cores} cores")
+        ranked = sorted(stage.items(), key=lambda item: item[1]["rank"])
+        for variant, entry in ranked:
+            if entry["jobs"] > 1:
+                print(f"  {variant}: {entry['jobs']} jobs")
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def locked_state(plan_dir):
+    """Yield the token state of the plan directory, locked, and write
+    it back afterwards."""
+    state_file = path.join(plan_dir, "tokens.json")
+    with open(path.join(plan_dir, "tokens.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(state_file) as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            state = {"holders": {}, "waiters": {}}
+        for table in state.values():
+            for pid in [pid for pid in table if not process_alive(int(pid))]:
+                del table[pid]
+        yield state
+        with open(state_file + ".tmp", "w") as fh:
+            json.dump(state, fh)
+        os.replace(state_file + ".tmp", state_file)
+
+
+def acquire_tokens(plan_dir, cores, rank, jobs):
+    pid = str(os.getpid())
+    with locked_state(plan_dir) as state:
+        state["waiters"][pid] = rank
+    while True:
+        with locked_state(plan_dir) as state:
+            free = cores - sum(state["holders"].values())
+            first = min(state["waiters"].items(), key=lambda item: (item[1], item[0]))
+            if first[0] == pid and free >= jobs:
+                del state["waiters"][pid]
+                state["holders"][pid] = jobs
+                return
+        time.sleep(POLL_INTERVAL)
+
+
+def release_tokens(plan_dir):
+    pid = str(os.getpid())
+    with locked_state(plan_dir) as state:
+        state["holders"].pop(pid, None)
+        state["waiters"].pop(pid, None)
+
+
+def append_history(history_file, record):
+    line = json.dumps(record).encode() + b"\n"
+    fd = os.open(history_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def run_step(args):
+    entry = None
+    cores = None
+    try:
+        with open(path.join(args.plan_dir, "plan.json")) as fh:
+            plan = json.load(fh)
+        cores = plan["cores"]
+        entry = plan["steps"].get(args.step, {}).get(args.variant)
+    except (OSError, ValueError):
+        pass
+
+    env = os.environ.copy()
+    if entry is not None:
+        env["CMAKE_BUILD_PARALLEL_LEVEL"] = str(entry["jobs"])
+        acquire_tokens(args.plan_dir, cores, entry["rank"], entry["jobs"])
+    try:
+        start_time = time.monotonic()
+        returncode = subprocess.call(args.command, env=env)
+        seconds = time.monotonic() - start_time
+    finally:
+        if entry is not None:
+            release_tokens(args.plan_dir)
+
+    # A failed step says little about how long a good one takes.
+    if returncode == 0:
+        append_history(
+            args.history,
+            {
+                "variant": args.variant,
+                "step": args.step,
+                "seconds": seconds,
+                "jobs": int(env.get("CMAKE_BUILD_PARALLEL_LEVEL", 1)),
+            },
+        )
+    sys.exit(returncode)
+
+
+def plan_builds(args):
+    cores = args.cores or os.cpu_count()
+    os.makedirs(args.plan_dir, exist_ok=True)
+    plan = make_plan(args.history, args.variants, cores)
+    with open(path.join(args.plan_dir, "plan.json"), "w") as fh:
+        json.dump(plan, fh, indent=1)
+    if args.verbose:
+        print_plan(plan)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Schedule library variant builds by their past durations"
+    )
+    parser.add_argument(
+        "--history",
+        required=True,
+        help="JSON-lines file of past step durations",
+    )
+    parser.add_argument(
+        "--plan-dir",
+        required=True,
+        help="Directory holding the plan and the shared token count",
+    )
+    subparsers = parser.add_subparsers(dest="subcommand", required=True)
+
+    plan_parser = subparsers.add_parser(
+        "plan", help="Plan the build stages from the history"
+    )
+    plan_parser.add_argument(
+        "--cores",
+        type=int,
+        default=0,
+        help="Number of cores to share out (default: all of them)",
+    )
+    plan_parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Print the estimated stage times and the variants given "
+        "more than one job",
+    )
+    plan_parser.add_argument("variants", nargs="+", help="Variants being built")
+    plan_parser.set_defaults(function=plan_builds)
+
+    run_parser = subparsers.add_parser(
+        "run", help="Run and record one step of a variant"
+    )
+    run_parser.add_argument("--variant", required=True)
+    run_parser.add_argument("--step", required=True)
+    run_parser.add_argument("command", nargs=argparse.REMAINDER)
+    run_parser.set_defaults(function=run_step)
+
+    args = parser.parse_args()
+    if args.subcommand == "run":
+        if args.command[:1] == ["--"]:
+            args.command = args.command[1:]
+        if not args.command:
+            parser.error("run needs a command")
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
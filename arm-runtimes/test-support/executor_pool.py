@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Shared machinery for the test executors that keep emulators running
+# between tests (fvp_pool.py and qemu_pool.py).
+#
+# There is one server per combination of emulator settings, identified
+# by a key made from them. It listens on a localhost TCP port, recorded
+# in a file in the pool directory, and is started by the first executor
+# that finds no server running. It exits after a period with no
+# requests.
+#
+# Each request is a line of JSON describing the test to run, at least
+# its image, arguments, timeout and working directory. The server hands
+# it to an idle worker, starting a new one if fewer than --max-workers
+# exist, and replies with a line of JSON holding the exit code, the
+# output and whatever statistics about the run the worker collected
+# (see stream_output.py). What a worker is and how it runs a test is up
+# to the module using the pool.
+
+import base64
+import hashlib
+import json
+import os
+import queue
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from os import path
+
+# How long a client waits for a newly started server to accept
+# connections, in seconds.
+SERVER_START_TIMEOUT = 60
+
+# The server applies each test's timeout, and can't leave it unlimited,
+# so a day is used as a stand-in for no timeout.
+NO_TIMEOUT = 86400
+
+
+def pool_key(prefix, settings):
+    """Return a short name identifying a server, made from a prefix
+    and a hash of a JSON-serialisable list of its settings."""
+    digest = hashlib.sha256(json.dumps(settings).encode()).hexdigest()
+    return f"{prefix}-{digest[:16]}"
+
+
+class PoolServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self, settings, worker_type):
+        super().__init__(("localhost", 0), PoolRequestHandler)
+        self.settings = settings
+        self.worker_type = worker_type
+        self.idle_workers = queue.LifoQueue()
+        self.worker_slots = threading.BoundedSemaphore(settings.max_workers)
+        self.activity_lock = threading.Lock()
+        self.active_requests = 0
+        self.last_activity = time.monotonic()
+
+    def run_job(self, job, stats):
+        with self.activity_lock:
+            self.active_requests += 1
+        try:
+            with self.worker_slots:
+                try:
+                    worker = self.idle_workers.get_nowait()
+                except queue.Empty:
+                    worker = self.worker_type(self.settings)
+                try:
+                    result = worker.run(job, stats)
+                except BaseException:
+                    worker.close()
+                    raise
+                if worker.alive():
+                    self.idle_workers.put(worker)
+                return result
+        finally:
+            with self.activity_lock:
+                self.active_requests -= 1
+                self.last_activity = time.monotonic()
+
+    def watch_idle(self):
+        """Shut the server down once it has been idle for long enough."""
+        while True:
+            time.sleep(1)
+            with self.activity_lock:
+                idle_time = time.monotonic() - self.last_activity
+                if self.active_requests == 0 and idle_time > self.settings.idle_timeout:
+                    break
+        self.shutdown()
+
+    def close_workers(self):
+        while True:
+            try:
+                self.idle_workers.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class PoolRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        job = json.loads(self.rfile.readline())
+        stats = {}
+        try:
+            returncode, stdout, stderr = self.server.run_job(job, stats)
+            response = {
+                "returncode": returncode,
+                "stdout": base64.b64encode(stdout).decode(),
+                "stderr": base64.b64encode(stderr).decode(),
+                "stats": stats,
+            }
+        except subprocess.TimeoutExpired:
+            response = {"error": "timeout"}
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+def serve(settings, key, worker_type):
+    """Run a server for settings.pool_dir until it has been idle for
+    settings.idle_timeout seconds."""
+    os.makedirs(settings.pool_dir, exist_ok=True)
+    port_file = path.join(settings.pool_dir, key + ".port")
+    server = PoolServer(settings, worker_type)
+    # Publish the port atomically, so a client never reads half of it.
+    with open(port_file + ".tmp", "w") as fh:
+        fh.write(str(server.server_address[1]))
+    os.replace(port_file + ".tmp", port_file)
+    threading.Thread(target=server.watch_idle, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        try:
+            with open(port_file) as fh:
+                if fh.read() == str(server.server_address[1]):
+                    os.remove(port_file)
+        except OSError:
+            pass
+        server.close_workers()
+
+
+def connect(port_file):
+    """Return a socket connected to the pool server, or None."""
+    try:
+        with open(port_file) as fh:
+            port = int(fh.read())
+        return socket.create_connection(("localhost", port))
+    except (OSError, ValueError):
+        return None
+
+
+def start_server(pool_dir, key, server_command):
+    """Start a server unless another client has just done so, and wait
+    for it to accept connections."""
+    import fcntl
+
+    port_file = path.join(pool_dir, key + ".port")
+    with open(path.join(pool_dir, key + ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        sock = connect(port_file)
+        if sock is not None:
+            return sock
+        try:
+            os.remove(port_file)
+        except FileNotFoundError:
+            pass
+        with open(path.join(pool_dir, key + ".log"), "ab") as log:
+            subprocess.Popen(
+                server_command,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                start_new_session=True,
+            )
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            sock = connect(port_file)
+            if sock is not None:
+                return sock
+            time.sleep(0.1)
+    raise RuntimeError(f"pool server {key} did not start")
+
+
+def submit(pool_dir, key, server_command, job):
+    """Send a job to the server identified by key, starting it with
+    server_command if needed, and return its response.
+
+    The response is a dict holding either "returncode", "stdout",
+    "stderr" and "stats", or "error" if the job could not be run, which
+    is "timeout" if the test timed out."""
+    try:
+        os.makedirs(pool_dir, exist_ok=True)
+        sock = connect(path.join(pool_dir, key + ".port"))
+        if sock is None:
+            sock = start_server(pool_dir, key, server_command)
+        with sock, sock.makefile("rwb") as stream:
+            stream.write(json.dumps(job).encode() + b"\n")
+            stream.flush()
+            return json.loads(stream.readline())
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def write_output(response):
+    """Pass a successful response's output on to this process's own."""
+    sys.stdout.buffer.write(base64.b64decode(response["stdout"]))
+    sys.stdout.buffer.flush()
+    sys.stderr.buffer.write(base64.b64decode(response["stderr"]))
+    sys.stderr.buffer.flush()
+
+
+def add_server_arguments(parser):
+    """Add the command-line options common to all pool servers."""
+    parser.add_argument(
+        "--pool-dir",
+        required=True,
+        help="Directory for the server's port, lock and log files",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Maximum number of emulators to run at once (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=int,
+        default=300,
+        help="Exit after this many seconds without a request (default: 300)",
+    )
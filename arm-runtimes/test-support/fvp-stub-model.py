@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# A stand-in for a running FVP model, used by the "stub" worker of
+# fvp_pool.py so that the pool and its reuse of running models can be
+# tested without an FVP.
+#
+# Like a model driven over Iris, it stays running between tests. It
+# reads one line of JSON per test from stdin, with the image, arguments
+# and working directory, runs the image as a host program, and writes
+# one line of JSON back with its exit code, base64-encoded output, and
+# the number of tests this process has run, so that a test of the pool
+# can see whether the model was reused. It applies no timeout of its
+# own: as with Iris, the worker stops waiting and kills the model.
+
+import base64
+import json
+import subprocess
+import sys
+
+
+def main():
+    runs = 0
+    for line in sys.stdin:
+        job = json.loads(line)
+        result = subprocess.run(
+            [job["image"]] + job["arguments"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=job["working_directory"],
+        )
+        runs += 1
+        response = {
+            "returncode": result.returncode,
+            "stdout": base64.b64encode(result.stdout).decode(),
+            "runs": runs,
+        }
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Starting an FVP model takes far longer than running most test
+# programs on it, so for test suites with thousands of programs (such
+# as libc++) most of the time is spent starting models. This module
+# keeps a pool of running models instead, using the server in
+# executor_pool.py, with one server per combination of FVP install,
+# model and config files.
+#
+# Two worker types are available:
+#
+# * "iris" starts the model with its Iris debug server enabled, and
+#   for each test resets it, loads the image and sets the semihosting
+#   command line and working directory through the Iris Python
+#   library that ships with the FVPs. It is experimental: it hasn't
+#   been run against a real FVP, and relies on the model stopping at
+#   the program's semihosting exit call rather than quitting, and on
+#   the semihosting parameters taking effect when written between
+#   runs, which they may not, since they are normally only read when
+#   the model starts.
+#
+# * "cold" starts a new model for every test, just like run_fvp. It
+#   is a stand-in for testing the pool itself without the Iris library.
+#
+# * "stub" keeps a fvp-stub-model.py process running in place of each
+#   model, which runs the test image as a host program. It exercises
+#   the same reuse and timeout handling as "iris", so that those can
+#   be tested without an FVP, but can't run Arm images.
+#
+# If anything goes wrong in talking to the pool, run_fvp_pooled falls
+# back to running the model directly with run_fvp.
+
+import argparse
+import base64
+import json
+import os
+import select
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from os import path
+
+import executor_pool
+from run_fvp import MODELS, fvp_command, run_fvp, write_semihosting_features
+from stream_output import run_captured, truncation_message
+
+# Semihosting operation numbers and the exit reason for a normal exit,
+# used to work out a program's exit status when the model stops.
+SYS_EXIT = 0x18
+SYS_EXIT_EXTENDED = 0x20
+ADP_STOPPED_APPLICATION_EXIT = 0x20026
+
+# How long to wait for a model's Iris server to accept connections, in
+# seconds.
+MODEL_START_TIMEOUT = 60
+
+
+def wait_for_model(worker, job, wait):
+    """Call wait(), which returns when the worker's model stops or
+    raises an exception if the job's timeout expires first.
+
+    Iris reports an expired timeout with an exception of its own, so it
+    is told apart from other errors by the time taken, and turned into
+    subprocess.TimeoutExpired so that the client doesn't run the test
+    again without the pool. Either way the model is left in an unknown
+    state, so it is killed rather than reused."""
+    start_time = time.monotonic()
+    try:
+        wait()
+    except Exception:
+        timed_out = time.monotonic() - start_time >= job["timeout"]
+        worker.close()
+        if timed_out:
+            raise subprocess.TimeoutExpired(job["image"], job["timeout"])
+        raise
+
+
+def pool_key(worker, fvp_install_dir, fvp_config_dir, fvp_model, fvp_configs):
+    """Return a short name identifying the worker type and model
+    configuration, so that each combination gets its own server."""
+    settings = [
+        worker,
+        path.abspath(fvp_install_dir),
+        path.abspath(fvp_config_dir),
+        fvp_model,
+        list(fvp_configs),
+    ]
+    return executor_pool.pool_key(f"fvp-{fvp_model}", settings)
+
+
+class ColdStartWorker:
+    """Worker that starts a new model for every test."""
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    def run(self, job, stats):
+        command = fvp_command(
+            self.settings.fvp_install_dir,
+            self.settings.fvp_config_dir,
+            self.settings.fvp_model,
+            self.settings.fvp_config,
+            job["image"],
+            job["arguments"],
+            None,
+        )
+        return run_captured(
+            command,
+            job["timeout"],
+            job["working_directory"],
+            job["max_output"],
+            stats,
+        )
+
+    def alive(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class IrisWorker:
+    """Worker that keeps one model running and reloads it through Iris."""
+
+    def __init__(self, settings):
+        if settings.iris_python_dir not in sys.path:
+            sys.path.append(settings.iris_python_dir)
+        import iris.debug
+
+        self.model_info = MODELS[settings.fvp_model]
+        with socket.socket() as sock:
+            sock.bind(("localhost", 0))
+            iris_port = sock.getsockname()[1]
+        command = fvp_command(
+            settings.fvp_install_dir,
+            settings.fvp_config_dir,
+            settings.fvp_model,
+            settings.fvp_config,
+            None,
+            None,
+            None,
+        )
+        command.extend(["--iris-server", "--iris-port", str(iris_port)])
+        self.process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        )
+
+        # The model's output has to be read continuously, otherwise it
+        # would block once the pipe is full.
+        self.output = bytearray()
+        self.output_lock = threading.Lock()
+        self.max_output = None
+        self.discarded = 0
+        self.reader = threading.Thread(target=self.read_output, daemon=True)
+        self.reader.start()
+
+        deadline = time.monotonic() + MODEL_START_TIMEOUT
+        while True:
+            try:
+                self.model = iris.debug.NetworkModel("localhost", iris_port)
+                break
+            except Exception:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise
+                time.sleep(0.5)
+        self.cpu = self.model.get_cpus()[0]
+        # MODELS names the parameter with its full instance path, but
+        # Iris addresses it relative to the CPU.
+        self.param_prefix = self.model_info.cmdline_param.rsplit(".", 1)[-1]
+        self.param_prefix = self.param_prefix[: -len("cmd_line")]
+        self.runs = 0
+
+    def read_output(self):
+        while True:
+            data = self.process.stdout.read1(65536)
+            if not data:
+                return
+            with self.output_lock:
+                if self.max_output is not None:
+                    room = max(self.max_output - len(self.output), 0)
+                    self.discarded += max(len(data) - room, 0)
+                    data = data[:room]
+                self.output.extend(data)
+
+    def take_output(self):
+        # Output written just before the model stopped may still be in
+        # the pipe, so wait until it has been quiet briefly.
+        while True:
+            with self.output_lock:
+                length = len(self.output)
+            time.sleep(0.05)
+            with self.output_lock:
+                if len(self.output) == length:
+                    data = bytes(self.output)
+                    self.output.clear()
+                    return data
+
+    def read_exit_status(self):
+        """Work out the program's exit status from the semihosting call
+        it stopped in."""
+        try:
+            operation = self.cpu.read_register("X0")
+            parameter = self.cpu.read_register("X1")
+            word_size = 8
+        except Exception:
+            operation = self.cpu.read_register("R0")
+            parameter = self.cpu.read_register("R1")
+            word_size = 4
+
+        if operation == SYS_EXIT and word_size == 4:
+            # On AArch32 SYS_EXIT passes the reason directly and has no
+            # way to report an exit code.
+            return 0 if parameter == ADP_STOPPED_APPLICATION_EXIT else 1
+        if operation in (SYS_EXIT, SYS_EXIT_EXTENDED):
+            reason, subcode = self.cpu.read_memory(
+                parameter, size=word_size, count=2
+            )
+            if reason == ADP_STOPPED_APPLICATION_EXIT:
+                return subcode
+            return 1
+        raise RuntimeError(f"model stopped in unexpected state (op={operation:#x})")
+
+    def run(self, job, stats):
+        # The model process outlives the test, so only the wall time
+        # can be measured.
+        start_time = time.monotonic()
+        with self.output_lock:
+            self.output.clear()
+            self.max_output = job["max_output"]
+            self.discarded = 0
+        self.model.reset()
+        self.cpu.load_application(job["image"])
+        self.cpu.parameters[self.param_prefix + "cmd_line"] = shlex.join(
+            job["arguments"]
+        )
+        self.cpu.parameters[self.param_prefix + "cwd"] = job["working_directory"]
+        wait_for_model(
+            self, job, lambda: self.model.run(blocking=True, timeout=job["timeout"])
+        )
+        self.runs += 1
+        if self.process.poll() is not None:
+            # The model exited by itself instead of stopping, so this
+            # worker can't be reused, but its exit status is the answer.
+            returncode = self.process.wait()
+        else:
+            returncode = self.read_exit_status()
+        stdout = self.take_output()
+        stderr = b""
+        if self.discarded:
+            stderr = truncation_message(self.discarded, self.max_output)
+        stats["wall_time"] = time.monotonic() - start_time
+        stats["model_runs"] = self.runs
+        return returncode, stdout, stderr
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+
+class StubWorker:
+    """Worker that keeps a fvp-stub-model.py process running in place
+    of a model."""
+
+    def __init__(self, settings):
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                path.join(path.dirname(path.abspath(__file__)), "fvp-stub-model.py"),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def wait_for_response(self, timeout):
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            raise RuntimeError("stub model timed out")
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("stub model exited")
+        self.response = json.loads(line)
+
+    def run(self, job, stats):
+        start_time = time.monotonic()
+        request = {
+            "image": job["image"],
+            "arguments": job["arguments"],
+            "working_directory": job["working_directory"],
+        }
+        self.process.stdin.write(json.dumps(request).encode() + b"\n")
+        self.process.stdin.flush()
+        wait_for_model(self, job, lambda: self.wait_for_response(job["timeout"]))
+        stdout = base64.b64decode(self.response["stdout"])
+        stderr = b""
+        if job["max_output"] is not None and len(stdout) > job["max_output"]:
+            stderr = truncation_message(len(stdout) - job["max_output"], job["max_output"])
+            stdout = stdout[: job["max_output"]]
+        stats["wall_time"] = time.monotonic() - start_time
+        stats["model_pid"] = self.process.pid
+        stats["model_runs"] = self.response["runs"]
+        return self.response["returncode"], stdout, stderr
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+
+WORKER_TYPES = {
+    "iris": IrisWorker,
+    "cold": ColdStartWorker,
+    "stub": StubWorker,
+}
+
+
+def run_fvp_pooled(
+    pool_dir,
+    pool_worker,
+    fvp_install_dir,
+    fvp_config_dir,
+    fvp_model,
+    fvp_configs,
+    image,
+    arguments,
+    timeout,
+    working_directory,
+    verbose,
+    tarmac_file,
+    max_output=None,
+    stats=None,
+):
+    """Execute the program on a pooled FVP and return its exit code.
+
+    Takes the same arguments as run_fvp, plus the pool directory and
+    worker type, and falls back to run_fvp if the pool can't be used.
+    Instruction counts aren't collected for pooled runs.
+    """
+    fvp_configs = fvp_configs or []
+    if tarmac_file is not None:
+        # Tracing needs a plugin loaded at model start-up, so can't be
+        # done with a shared model.
+        return run_fvp(
+            fvp_install_dir,
+            fvp_config_dir,
+            fvp_model,
+            fvp_configs,
+            image,
+            arguments,
+            timeout,
+            working_directory,
+            verbose,
+            tarmac_file,
+            max_output,
+            stats,
+        )
+
+    write_semihosting_features(working_directory)
+    pool_dir = path.abspath(pool_dir)
+    key = pool_key(
+        pool_worker, fvp_install_dir, fvp_config_dir, fvp_model, fvp_configs
+    )
+    server_command = [
+        sys.executable,
+        __file__,
+        "--pool-dir", pool_dir,
+        "--worker", pool_worker,
+        "--fvp-install-dir", fvp_install_dir,
+        "--fvp-config-dir", fvp_config_dir,
+        "--fvp-model", fvp_model,
+    ]
+    for config in fvp_configs:
+        server_command.extend(["--fvp-config", config])
+    job = {
+        "image": path.abspath(image),
+        "arguments": arguments,
+        "timeout": timeout if timeout is not None else executor_pool.NO_TIMEOUT,
+        "working_directory": path.abspath(working_directory),
+        "max_output": max_output,
+    }
+
+    response = executor_pool.submit(pool_dir, key, server_command, job)
+
+    if response.get("error") == "timeout":
+        raise subprocess.TimeoutExpired(image, timeout)
+    if "error" in response:
+        if verbose:
+            print(f"FVP pool unavailable ({response['error']}), running directly")
+        return run_fvp(
+            fvp_install_dir,
+            fvp_config_dir,
+            fvp_model,
+            fvp_configs,
+            image,
+            arguments,
+            timeout,
+            working_directory,
+            verbose,
+            tarmac_file,
+            max_output,
+            stats,
+        )
+    executor_pool.write_output(response)
+    if stats is not None:
+        stats.update(response.get("stats", {}))
+    return response["returncode"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve a pool of running FVP models to test executors"
+    )
+    executor_pool.add_server_arguments(parser)
+    parser.add_argument(
+        "--worker",
+        choices=sorted(WORKER_TYPES),
+        default="cold",
+        help="How to run each test (default: cold)",
+    )
+    parser.add_argument(
+        "--fvp-install-dir",
+        help="Directory in which FVP models are installed",
+        required=True,
+    )
+    parser.add_argument(
+        "--fvp-config-dir",
+        help="Directory containing FVP config files",
+        required=True,
+    )
+    parser.add_argument(
+        "--fvp-model",
+        help="model name for FVP",
+        required=True,
+    )
+    parser.add_argument(
+        "--fvp-config",
+        action="append",
+        default=[],
+        help="FVP config file(s) to use",
+    )
+    parser.add_argument(
+        "--iris-python-dir",
+        default=os.environ.get("IRIS_PYTHON_DIR"),
+        help="Directory containing the Iris Python library "
+        "(default: $IRIS_PYTHON_DIR, or Iris/Python under the FVP install dir)",
+    )
+    args = parser.parse_args()
+    if args.iris_python_dir is None:
+        args.iris_python_dir = path.join(args.fvp_install_dir, "Iris", "Python")
+    key = pool_key(
+        args.worker,
+        args.fvp_install_dir,
+        args.fvp_config_dir,
+        args.fvp_model,
+        args.fvp_config,
+    )
+    executor_pool.serve(args, key, WORKER_TYPES[args.worker])
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,11 @@
 # command-line arguments as llvm-project/libcxx/utils/run.py.
 
 from run_fvp import run_fvp
+from fvp_pool import run_fvp_pooled
 import argparse
+import result_cache
+import test_expectations
+import test_timing
 import pathlib
 import sys
 
@@ -45,8 +49,8 @@ def main():
     parser.add_argument(
         "--execdir",
         type=pathlib.Path,
-        default=pathlib.Path.cwd(),
-        help="directory to run the program from",
+        help="directory to run the program from (default: the current "
+        "directory)",
     )
     parser.add_argument(
         "--codesign_identity",
@@ -59,6 +63,15 @@ def main():
         nargs="*",
         help="ignored, used for compatibility with libc++ tests",
     )
+    parser.add_argument(
+        "--max-output-bytes",
+        type=int,
+        help="Pass on at most this many bytes of the test's output, "
+        "discarding the rest",
+    )
+    result_cache.add_arguments(parser)
+    test_timing.add_arguments(parser)
+    test_expectations.add_arguments(parser)
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -69,6 +82,17 @@ def main():
         "--tarmac",
         help="File to write tarmac trace to (slows execution significantly)",
     )
+    parser.add_argument(
+        "--fvp-pool-dir",
+        help="Run the test on a shared pool of running models, whose server "
+        "keeps its files in this directory",
+    )
+    parser.add_argument(
+        "--fvp-pool-worker",
+        choices=["iris", "cold"],
+        default="cold",
+        help="How the pool runs tests (default: cold)",
+    )
     parser.add_argument("image", help="image file to execute")
     parser.add_argument(
         "arguments",
@@ -77,17 +101,71 @@ def main():
         help="optional arguments for the image",
     )
     args = parser.parse_args()
-    return run_fvp(
-        args.fvp_install_dir,
-        args.fvp_config_dir,
-        args.fvp_model,
-        args.fvp_config,
-        args.image,
+    execdir = args.execdir or pathlib.Path.cwd()
+
+    def run(stats):
+        if args.fvp_pool_dir:
+            return run_fvp_pooled(
+                args.fvp_pool_dir,
+                args.fvp_pool_worker,
+                args.fvp_install_dir,
+                args.fvp_config_dir,
+                args.fvp_model,
+                args.fvp_config,
+                args.image,
+                [args.image] + args.arguments,
+                args.timeout,
+                execdir,
+                args.verbose,
+                args.tarmac,
+                args.max_output_bytes,
+                stats,
+            )
+        else:
+            return run_fvp(
+                args.fvp_install_dir,
+                args.fvp_config_dir,
+                args.fvp_model,
+                args.fvp_config,
+                args.image,
+                [args.image] + args.arguments,
+                args.timeout,
+                execdir,
+                args.verbose,
+                args.tarmac,
+                args.max_output_bytes,
+                stats,
+            )
+
+    expectation = test_expectations.find_expectation(args, "fvp")
+    cache = result_cache.open_cache(args)
+    key = None
+    if cache is not None:
+        # libc++ copies any data files a test needs into its execdir,
+        # so they are part of the key. Other callers don't pass
+        # --execdir, and run in a shared directory.
+        key = result_cache.fvp_key(
+            cache,
+            args.fvp_install_dir,
+            args.fvp_config_dir,
+            args.fvp_model,
+            args.fvp_config,
+            args.image,
+            [args.image] + args.arguments,
+            args.max_output_bytes,
+            result_cache.directory_files(args.execdir) if args.execdir else (),
+        )
+    ret_code = test_timing.run_timed(
+        args,
+        "fvp",
         [args.image] + args.arguments,
-        args.timeout,
-        args.execdir,
-        args.verbose,
-        args.tarmac,
+        # lit has no way for an executor to report a test as skipped,
+        # so a skipped test passes without being run.
+        lambda stats: test_expectations.run_expected(
+            expectation,
+            0,
+            lambda: result_cache.run_with_cache(cache, key, lambda: run(stats)),
+        ),
     )
     sys.exit(ret_code)
 
@@ -8,6 +8,9 @@
 
 from run_qemu import run_qemu
 import argparse
+import result_cache
+import test_expectations
+import test_timing
 import pathlib
 import sys
 
@@ -32,6 +35,11 @@ def main():
         required=False,
         help='list of arguments to pass to qemu, separated with ":"',
     )
+    parser.add_argument(
+        "--qemu-insn-plugin",
+        help="Path of QEMU's insn plugin (libinsn.so), used to count the "
+        "instructions each test runs when --timing-file is given",
+    )
     parser.add_argument(
         "--timeout",
         type=int,
@@ -41,8 +49,8 @@ def main():
     parser.add_argument(
         "--execdir",
         type=pathlib.Path,
-        default=pathlib.Path.cwd(),
-        help="directory to run the program from",
+        help="directory to run the program from (default: the current "
+        "directory)",
     )
     parser.add_argument(
         "--codesign_identity",
@@ -55,6 +63,15 @@ def main():
         nargs="*",
         help="ignored, used for compatibility with libc++ tests",
     )
+    parser.add_argument(
+        "--max-output-bytes",
+        type=int,
+        help="Pass on at most this many bytes of the test's output, "
+        "discarding the rest",
+    )
+    result_cache.add_arguments(parser)
+    test_timing.add_arguments(parser)
+    test_expectations.add_arguments(parser)
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -69,16 +86,54 @@ def main():
         help="optional arguments for the image",
     )
     args = parser.parse_args()
-    ret_code = run_qemu(
-        args.qemu_command,
-        args.qemu_machine,
-        args.qemu_cpu,
-        args.qemu_params.split(":") if args.qemu_params else [],
-        args.image,
+    execdir = args.execdir or pathlib.Path.cwd()
+    qemu_params = args.qemu_params.split(":") if args.qemu_params else []
+
+    def run(stats):
+        return run_qemu(
+            args.qemu_command,
+            args.qemu_machine,
+            args.qemu_cpu,
+            qemu_params,
+            args.image,
+            [args.image] + args.arguments,
+            args.timeout,
+            execdir,
+            args.verbose,
+            args.max_output_bytes,
+            stats,
+            args.qemu_insn_plugin,
+        )
+
+    expectation = test_expectations.find_expectation(args, "qemu")
+    cache = result_cache.open_cache(args)
+    key = None
+    if cache is not None:
+        # libc++ copies any data files a test needs into its execdir,
+        # so they are part of the key. Other callers don't pass
+        # --execdir, and run in a shared directory.
+        key = result_cache.qemu_key(
+            cache,
+            args.qemu_command,
+            args.qemu_machine,
+            args.qemu_cpu,
+            qemu_params,
+            args.image,
+            [args.image] + args.arguments,
+            args.max_output_bytes,
+            result_cache.directory_files(args.execdir) if args.execdir else (),
+        )
+    ret_code = test_timing.run_timed(
+        args,
+        "qemu",
         [args.image] + args.arguments,
-        args.timeout,
-        args.execdir,
-        args.verbose,
+        # lit has no way for an executor to report a test as skipped,
+        # so a skipped test passes without being run.
+        lambda stats: test_expectations.run_expected(
+            expectation,
+            0,
+            lambda: result_cache.run_with_cache(cache, key, lambda: run(stats)),
+        ),
     )
     sys.exit(ret_code)
 
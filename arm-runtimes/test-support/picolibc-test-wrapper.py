@@ -5,65 +5,65 @@
 # This is a wrapper script to run picolibc tests with QEMU or FVPs.
 
 from run_qemu import run_qemu
+from qemu_pool import run_qemu_pooled
 from run_fvp import run_fvp
+from fvp_pool import run_fvp_pooled
 import argparse
+import result_cache
+import test_expectations
+import test_timing
 import pathlib
 import sys
 
-# https://mesonbuild.com/Unit-tests.html#skipped-tests-and-hard-errors
-EXIT_CODE_SKIP = 77
-
-disabled_tests = [
-    # compiler-rt does not properly set floating point exceptions for
-    # computations on types implemented in software
-    # https://github.com/picolibc/picolibc/pull/500
-    "picolibc_armv7m_soft_fpv4_sp_d16-build/test/math_errhandling",
-    "picolibc_armv7m_hard_fpv4_sp_d16-build/test/math_errhandling",
-    "picolibc_armv7r_hard_vfpv3xd-build/test/math_errhandling",
-    "picolibc_armv7r_hard_vfpv3xd_exn_rtti-build/test/math_errhandling",
-    "picolibc_armv8.1m.main_hard_fp_nomve-build/test/math_errhandling",
-    "picolibc_armv7m_soft_fpv4_sp_d16_exn_rtti-build/test/math_errhandling",
-    "picolibc_armv7m_hard_fpv4_sp_d16_exn_rtti-build/test/math_errhandling",
-    "picolibc_armv8.1m.main_hard_fp_nomve_exn_rtti-build/test/math_errhandling",
-    "picolibc_armv8.1m.main_hard_nofp_mve-build/test/fenv",
-    "picolibc_armv8.1m.main_hard_nofp_mve-build/test/math_errhandling",
-    "picolibc_armv8m.main_hard_fp-build/test/math_errhandling",
-    "picolibc_armv8.1m.main_hard_nofp_mve_exn_rtti-build/test/fenv",
-    "picolibc_armv8.1m.main_hard_nofp_mve_exn_rtti-build/test/math_errhandling",
-    "picolibc_armv8m.main_hard_fp_exn_rtti-build/test/math_errhandling",
-    "picolibc_armv8.1m.main_hard_nofp_mve_pacret_bti-build/test/fenv",
-    "picolibc_armv8.1m.main_hard_nofp_mve_pacret_bti_exn_rtti-build/test/fenv",
-    "picolibc_armv8.1m.main_hard_fp_nomve_pacret_bti-build/test/math_errhandling",
-    "picolibc_armv8.1m.main_hard_fp_nomve_pacret_bti_exn_rtti-build/test/math_errhandling",
-    "picolibc_armv8.1m.main_hard_nofp_mve_pacret_bti-build/test/math_errhandling",
-    "picolibc_armv8.1m.main_hard_nofp_mve_pacret_bti_exn_rtti-build/test/math_errhandling",
-]
-
-disabled_tests_fvp = [
-    # SDDKW-25808: SYS_SEEK returns wrong value.
-    "test/semihost/semihost-seek",
-    "test/test-fread-fwrite",
-    "test/posix-io",
-    # SDDKW-94045: rateInHz port not connected in Corstone-310 FVP.
-    "test/semihost/semihost-gettimeofday",
-]
+def test_argv(args):
+    # Some picolibc tests expect argv[0] to be literally "program-name", not
+    # the actual program name.
+    return ["program-name"] + args.arguments
 
 
-def is_disabled(image, use_fvp):
-    if any([image.endswith(t) for t in disabled_tests]):
-        return True
-    if use_fvp and any([image.endswith(t) for t in disabled_tests_fvp]):
-        return True
-    return False
+def cache_key(cache, args):
+    if args.qemu_command:
+        return result_cache.qemu_key(
+            cache,
+            args.qemu_command,
+            args.qemu_machine,
+            args.qemu_cpu,
+            args.qemu_params.split(":") if args.qemu_params else [],
+            args.image,
+            test_argv(args),
+            args.max_output_bytes,
+        )
+    return result_cache.fvp_key(
+        cache,
+        args.fvp_install_dir,
+        args.fvp_config_dir,
+        args.fvp_model,
+        args.fvp_config,
+        args.image,
+        test_argv(args),
+        args.max_output_bytes,
+    )
 
 
-def run(args):
-    if is_disabled(args.image, args.qemu_command is None):
-        return EXIT_CODE_SKIP
-    # Some picolibc tests expect argv[0] to be literally "program-name", not
-    # the actual program name.
-    argv = ["program-name"] + args.arguments
-    if args.qemu_command:
+def run(args, stats):
+    argv = test_argv(args)
+    if args.qemu_command and args.qemu_pool_dir:
+        return run_qemu_pooled(
+            args.qemu_pool_dir,
+            args.qemu_pool_worker,
+            args.qemu_command,
+            args.qemu_machine,
+            args.qemu_cpu,
+            args.qemu_params.split(":") if args.qemu_params else [],
+            args.image,
+            argv,
+            None,
+            pathlib.Path.cwd(),
+            args.verbose,
+            args.max_output_bytes,
+            stats,
+        )
+    elif args.qemu_command:
         return run_qemu(
             args.qemu_command,
             args.qemu_machine,
@@ -74,6 +74,26 @@ def run(args):
             None,
             pathlib.Path.cwd(),
             args.verbose,
+            args.max_output_bytes,
+            stats,
+            args.qemu_insn_plugin,
+        )
+    elif args.fvp_pool_dir:
+        return run_fvp_pooled(
+            args.fvp_pool_dir,
+            args.fvp_pool_worker,
+            args.fvp_install_dir,
+            args.fvp_config_dir,
+            args.fvp_model,
+            args.fvp_config,
+            args.image,
+            argv,
+            None,
+            pathlib.Path.cwd(),
+            args.verbose,
+            args.tarmac,
+            args.max_output_bytes,
+            stats,
         )
     else:
         return run_fvp(
@@ -87,6 +107,8 @@ def run(args):
             pathlib.Path.cwd(),
             args.verbose,
             args.tarmac,
+            args.max_output_bytes,
+            stats,
         )
 
 
@@ -112,6 +134,23 @@ def main():
         "--qemu-params",
         help='list of arguments to pass to qemu, separated with ":"',
     )
+    parser.add_argument(
+        "--qemu-insn-plugin",
+        help="Path of QEMU's insn plugin (libinsn.so), used to count the "
+        "instructions each test runs when --timing-file is given and the "
+        "pool isn't used (QEMU only)",
+    )
+    parser.add_argument(
+        "--qemu-pool-dir",
+        help="Run the test using a shared pool of ready-started QEMUs, whose "
+        "server keeps its files in this directory (QEMU only)",
+    )
+    parser.add_argument(
+        "--qemu-pool-worker",
+        choices=["cold"],
+        default="cold",
+        help="How the pool runs tests (default: cold)",
+    )
     parser.add_argument(
         "--fvp-config-dir", help="Directory in which FVP models are installed"
     )
@@ -128,6 +167,26 @@ def main():
         "--tarmac",
         help="file to wrote tarmac trace to (FVP only)",
     )
+    parser.add_argument(
+        "--fvp-pool-dir",
+        help="Run the test on a shared pool of running models, whose server "
+        "keeps its files in this directory (FVP only)",
+    )
+    parser.add_argument(
+        "--fvp-pool-worker",
+        choices=["iris", "cold"],
+        default="cold",
+        help="How the pool runs tests (default: cold)",
+    )
+    parser.add_argument(
+        "--max-output-bytes",
+        type=int,
+        help="Pass on at most this many bytes of the test's output, "
+        "discarding the rest",
+    )
+    result_cache.add_arguments(parser)
+    test_timing.add_arguments(parser)
+    test_expectations.add_arguments(parser)
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -142,7 +201,22 @@ def main():
         help="optional arguments for the image",
     )
     args = parser.parse_args()
-    ret_code = run(args)
+    executor = "qemu" if args.qemu_command else "fvp"
+    expectation = test_expectations.find_expectation(args, executor)
+    cache = result_cache.open_cache(args)
+    key = cache_key(cache, args) if cache is not None else None
+    ret_code = test_timing.run_timed(
+        args,
+        executor,
+        test_argv(args),
+        lambda stats: test_expectations.run_expected(
+            expectation,
+            test_expectations.EXIT_CODE_SKIP,
+            lambda: result_cache.run_with_cache(
+                cache, key, lambda: run(args, stats)
+            ),
+        ),
+    )
     sys.exit(ret_code)
 
 
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Helper script to modify the junit xml results of the library tests,
+# and optionally merge them into one report.
+
+# picolibc and compiler-rt always put all their test results into a
+# testsuite named after the library. We have multiple variants of each
+# library, so the xml is modified to group the tests by variant:
+#   picolibc     every suite is renamed picolibc-{variant}, and every
+#                test's classname picolibc-{variant}.picolibc-{variant}
+#   compiler-rt  the compiler-rt Builtins tests run two testsuites:
+#                TestCases and Unit. TestCases are recorded in the
+#                "Builtins" suite, but the Unit tests are recorded in
+#                "Builtins-arm-generic" or similar. For readability,
+#                they are all combined under
+#                compiler-rt-{variant}-Builtins.
+# Modifying a file that has already been modified changes nothing.
+#
+# The results of many variants can be given at once, and are processed
+# in parallel. Each file is read and written one testcase at a time, so
+# even very large results don't have to fit in memory.
+#
+# A test command can be given after the options, following "--". It is
+# run first, and the results are processed whether it passed or not.
+# The script then exits with the command's status, so a failing test
+# step still fails, but only once its results have been written.
+
+import argparse
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+from xml.sax.saxutils import quoteattr
+
+# The results file of each library, relative to its build directory.
+RESULTS_FILES = {
+    "picolibc": os.path.join("meson-logs", "testlog.junit.xml"),
+    "compiler-rt": os.path.join("test", "results.junit.xml"),
+}
+
+# The elements that contain testcases. Every other element is written
+# out whole once it has been read.
+CONTAINERS = ("testsuites", "testsuite")
+
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>\n'
+
+
+def start_tag(element):
+    attributes = "".join(f" {k}={quoteattr(v)}" for k, v in element.items())
+    return f"<{element.tag}{attributes}>"
+
+
+def rename_suite(library, variant, testsuite):
+    # A '.' character is used in junit xml to split classes/groups.
+    # Variants such as armv8m.main need to be renamed.
+    variant_name = variant.replace(".", "_")
+    if library == "picolibc":
+        testsuite.set("name", f"picolibc-{variant_name}")
+    else:
+        testsuite.set("name", f"compiler-rt-{variant_name}-Builtins")
+
+
+def rename_case(library, testcase, old_suitename, new_suitename):
+    if library == "picolibc":
+        testcase.set("classname", f"{new_suitename}.{new_suitename}")
+    else:
+        old_classname = testcase.get("classname")
+        testcase.set("classname", old_classname.replace(old_suitename, new_suitename))
+
+
+def copy_junit(xml_file, out, library=None, variant=None, top_level=True):
+    """Write the contents of a junit xml file to out, renaming the
+    suites and tests of a library's variant if library is given. If
+    top_level is False, the testsuites element enclosing the suites is
+    left out, so that they can be added to another file."""
+    # The containers currently open, with their original names.
+    open_containers = []
+    # How deep the parser is inside an element that isn't a container.
+    depth = 0
+    for event, element in ElementTree.iterparse(xml_file, events=("start", "end")):
+        if depth or element.tag not in CONTAINERS:
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth:
+                continue
+            parent = None
+            if open_containers:
+                parent, old_suitename = open_containers[-1]
+                if library and element.tag == "testcase" and parent.tag == "testsuite":
+                    rename_case(library, element, old_suitename, parent.get("name"))
+            element.tail = None
+            out.write(ElementTree.tostring(element, encoding="unicode") + "\n")
+            # Drop the element once it has been written.
+            if parent is not None:
+                parent.remove(element)
+            continue
+
+        write = top_level or element.tag != "testsuites"
+        if event == "start":
+            old_name = element.get("name")
+            if library and element.tag == "testsuite":
+                rename_suite(library, variant, element)
+            open_containers.append((element, old_name))
+            if write:
+                out.write(start_tag(element) + "\n")
+        else:
+            open_containers.pop()
+            if write:
+                out.write(f"</{element.tag}>\n")
+            if open_containers:
+                open_containers[-1][0].remove(element)
+
+
+def process_results(work):
+    """Rename the suites and tests in a variant's results file. Return
+    the file's path, and an error message if it couldn't be processed."""
+    library, variant, build_dir = work
+    xml_file = os.path.join(build_dir, RESULTS_FILES[library])
+    temp_file = xml_file + ".tmp"
+    try:
+        with open(temp_file, "w", encoding="utf-8") as out:
+            out.write(XML_DECLARATION)
+            copy_junit(xml_file, out, library, variant)
+        os.replace(temp_file, xml_file)
+    except (OSError, ElementTree.ParseError) as e:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        return xml_file, f"Unable to process {library} results of {variant}: {e}"
+    return xml_file, None
+
+
+def merge_results(xml_files, merged_file):
+    """Write the suites of all the xml files to merged_file. Return an
+    error message if one of them couldn't be read."""
+    temp_file = merged_file + ".tmp"
+    try:
+        with open(temp_file, "w", encoding="utf-8") as out:
+            out.write(XML_DECLARATION)
+            out.write("<testsuites>\n")
+            for xml_file in xml_files:
+                copy_junit(xml_file, out, top_level=False)
+            out.write("</testsuites>\n")
+        os.replace(temp_file, merged_file)
+    except (OSError, ElementTree.ParseError) as e:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        return f"Unable to merge results into {merged_file}: {e}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reformat picolibc and compiler-rt xml results"
+    )
+    for library in RESULTS_FILES:
+        parser.add_argument(
+            f"--{library}",
+            nargs=2,
+            action="append",
+            default=[],
+            metavar=("VARIANT", "DIR"),
+            help=f"Name of a variant under test and the path to its {library} "
+            "build directory. May be given more than once",
+        )
+    parser.add_argument(
+        "--merge",
+        metavar="FILE",
+        help="Also write all the results to this file",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="A junit xml file to merge unchanged, such as the libc++ "
+        "results. May be given more than once",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of files to process at once (default: the number of CPUs)",
+    )
+    parser.add_argument(
+        "--missing-ok",
+        action="store_true",
+        help="Skip variants that have no results file, such as those "
+        "whose tests haven't been run",
+    )
+    parser.add_argument(
+        "command",
+        nargs=argparse.REMAINDER,
+        help="A test command to run before processing its results",
+    )
+    args = parser.parse_args()
+    if args.command[:1] == ["--"]:
+        args.command = args.command[1:]
+
+    work = [
+        (library, variant, build_dir)
+        for library in RESULTS_FILES
+        for variant, build_dir in getattr(args, library.replace("-", "_"))
+    ]
+    if not work and not (args.merge and args.include):
+        parser.error("no results to process")
+
+    returncode = 0
+    if args.command:
+        returncode = subprocess.call(args.command)
+    if args.missing_ok:
+        found = []
+        for library, variant, build_dir in work:
+            if os.path.exists(os.path.join(build_dir, RESULTS_FILES[library])):
+                found.append((library, variant, build_dir))
+            else:
+                print(f"No {library} results of {variant}, skipping")
+        work = found
+
+    results = []
+    failed = False
+    if len(work) > 1 and args.jobs != 1:
+        with ProcessPoolExecutor(args.jobs) as executor:
+            outcomes = list(executor.map(process_results, work))
+    else:
+        outcomes = map(process_results, work)
+    for xml_file, error in outcomes:
+        if error:
+            print(error)
+            failed = True
+        else:
+            print(f"Results written to {xml_file}")
+            results.append(xml_file)
+
+    if args.merge:
+        error = merge_results(results + args.include, args.merge)
+        if error:
+            print(error)
+            failed = True
+        else:
+            print(f"Merged results written to {args.merge}")
+    if returncode:
+        sys.exit(returncode)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Runs QEMU tests through the server in executor_pool.py, with one
+# server per combination of QEMU executable, machine, CPU and extra
+# parameters, as fvp_pool.py does for the FVPs.
+#
+# The only worker, "cold", starts a new QEMU for every test, just like
+# run_qemu, so the pool only shares the server's queueing. Keeping a
+# QEMU running between tests would also need its RAM and semihosting
+# state to be cleared between them, since otherwise a test's result
+# could depend on the one run before it.
+#
+# If anything goes wrong in talking to the pool, run_qemu_pooled falls
+# back to running QEMU directly with run_qemu.
+
+import argparse
+import subprocess
+import sys
+from os import path
+
+import executor_pool
+from run_qemu import build_qemu_command, run_qemu
+from stream_output import run_captured
+
+
+def cold_start(settings, job, stats):
+    """Run a test in a new QEMU, as run_qemu does."""
+    command = build_qemu_command(
+        settings.qemu_command,
+        settings.qemu_machine,
+        settings.qemu_cpu,
+        settings.qemu_params,
+        job["image"],
+        job["arguments"],
+    )
+    return run_captured(
+        command,
+        job["timeout"],
+        job["working_directory"],
+        job["max_output"],
+        stats,
+    )
+
+
+class ColdStartWorker:
+    """Worker that starts a new QEMU for every test."""
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    def run(self, job, stats):
+        return cold_start(self.settings, job, stats)
+
+    def alive(self):
+        return True
+
+    def close(self):
+        pass
+
+
+WORKER_TYPES = {
+    "cold": ColdStartWorker,
+}
+
+
+def pool_key(worker, qemu_command, qemu_machine, qemu_cpu, qemu_extra_params):
+    """Return a short name identifying the worker type and QEMU
+    configuration, so that each combination gets its own server."""
+    settings = [
+        worker,
+        qemu_command,
+        qemu_machine,
+        qemu_cpu,
+        list(qemu_extra_params),
+    ]
+    return executor_pool.pool_key(f"qemu-{qemu_machine}", settings)
+
+
+def run_qemu_pooled(
+    pool_dir,
+    pool_worker,
+    qemu_command,
+    qemu_machine,
+    qemu_cpu,
+    qemu_extra_params,
+    image,
+    arguments,
+    timeout,
+    working_directory,
+    verbose,
+    max_output=None,
+    stats=None,
+):
+    """Execute the program on a pooled QEMU and return its exit code.
+
+    Takes the same arguments as run_qemu, plus the pool directory and
+    worker type, and falls back to run_qemu if the pool can't be used.
+    Instruction counts aren't collected for pooled runs.
+    """
+    pool_dir = path.abspath(pool_dir)
+    key = pool_key(
+        pool_worker, qemu_command, qemu_machine, qemu_cpu, qemu_extra_params
+    )
+    server_command = [
+        sys.executable,
+        __file__,
+        "--pool-dir", pool_dir,
+        "--worker", pool_worker,
+        "--qemu-command", qemu_command,
+        "--qemu-machine", qemu_machine,
+    ]
+    if qemu_cpu:
+        server_command.extend(["--qemu-cpu", qemu_cpu])
+    if qemu_extra_params:
+        server_command.extend(["--qemu-params", ":".join(qemu_extra_params)])
+    job = {
+        "image": path.abspath(image),
+        "arguments": arguments,
+        "timeout": timeout if timeout is not None else executor_pool.NO_TIMEOUT,
+        "working_directory": path.abspath(working_directory),
+        "max_output": max_output,
+    }
+
+    response = executor_pool.submit(pool_dir, key, server_command, job)
+
+    if response.get("error") == "timeout":
+        raise subprocess.TimeoutExpired(image, timeout)
+    if "error" in response:
+        if verbose:
+            print(f"QEMU pool unavailable ({response['error']}), running directly")
+        return run_qemu(
+            qemu_command,
+            qemu_machine,
+            qemu_cpu,
+            qemu_extra_params,
+            image,
+            arguments,
+            timeout,
+            working_directory,
+            verbose,
+            max_output,
+            stats,
+        )
+    executor_pool.write_output(response)
+    if stats is not None:
+        stats.update(response.get("stats", {}))
+    return response["returncode"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve a pool of QEMU test runners to test executors"
+    )
+    executor_pool.add_server_arguments(parser)
+    parser.add_argument(
+        "--worker",
+        choices=sorted(WORKER_TYPES),
+        default="cold",
+        help="How to run each test (default: cold)",
+    )
+    parser.add_argument(
+        "--qemu-command", required=True, help="qemu-system-<arch> path"
+    )
+    parser.add_argument(
+        "--qemu-machine",
+        required=True,
+        help="name of the machine to pass to QEMU",
+    )
+    parser.add_argument(
+        "--qemu-cpu", required=False, help="name of the cpu to pass to QEMU"
+    )
+    parser.add_argument(
+        "--qemu-params",
+        required=False,
+        help='list of arguments to pass to qemu, separated with ":"',
+    )
+    args = parser.parse_args()
+    args.qemu_params = args.qemu_params.split(":") if args.qemu_params else []
+    key = pool_key(
+        args.worker,
+        args.qemu_command,
+        args.qemu_machine,
+        args.qemu_cpu,
+        args.qemu_params,
+    )
+    executor_pool.serve(args, key, WORKER_TYPES[args.worker])
+
+
+if __name__ == "__main__":
+    main()
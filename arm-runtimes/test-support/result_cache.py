@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# A cache of test results for the emulator-based test executors, so
+# that a test image that hasn't changed since it was last run doesn't
+# have to be run again.
+#
+# Each result is stored in a JSON file named after a hash of everything
+# that can affect it: the contents of the image, its arguments, the
+# emulator and its settings (including the contents of FVP config
+# files), and for the lit-based tests the other files in the directory
+# the test runs in. The stored result is the exit code and stdout.
+#
+# Only passing results are stored. A failure may be down to something
+# other than the test, such as an overloaded host or a flaky emulator,
+# and replaying it would keep the test failing until its image changed.
+#
+# The cache is limited in size. Reading an entry updates its
+# modification time, and when the total size is over the limit the
+# entries modified longest ago are removed. As walking the cache
+# directory isn't free, this is only checked every EVICTION_INTERVAL
+# seconds, so the limit can be overshot briefly.
+#
+# Results aren't cached for tests that time out, or when --verbose or
+# tarmac tracing is used, since they don't just depend on the test.
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from os import path
+
+from run_fvp import MODELS
+
+# Included in every key, so that a change to how results are stored or
+# keyed can invalidate all existing entries.
+CACHE_VERSION = 2
+
+DEFAULT_MAX_SIZE = 1 << 30
+
+EVICTION_INTERVAL = 60
+
+
+def file_digest(filename):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def executable_identity(command):
+    """Identify an executable by its path, size and modification time,
+    which is much cheaper than hashing the whole emulator binary."""
+    resolved = shutil.which(command) or command
+    stat = os.stat(resolved)
+    return [path.realpath(resolved), stat.st_size, stat.st_mtime_ns]
+
+
+def directory_files(directory):
+    """Return the paths of the regular files directly inside a
+    directory, in sorted order, except those the executors create."""
+    return sorted(
+        entry.path
+        for entry in os.scandir(directory)
+        if entry.is_file() and entry.name != ":semihosting-features"
+    )
+
+
+class TeeOutput(io.BufferedIOBase):
+    """Binary stream that writes to another one and keeps a copy."""
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.stream.write(data)
+        self.data += data
+        return len(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class ResultCache:
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, executor, settings, image, arguments, files=()):
+        """Return the cache key for running image with arguments.
+
+        settings is a JSON-serialisable description of the emulator
+        configuration, and files lists other files whose contents
+        affect the result."""
+        material = [
+            CACHE_VERSION,
+            executor,
+            settings,
+            file_digest(image),
+            arguments,
+            [[path.basename(filename), file_digest(filename)] for filename in files],
+        ]
+        return hashlib.sha256(json.dumps(material).encode()).hexdigest()
+
+    def entry_path(self, key):
+        return path.join(self.directory, key[:2], key + ".json")
+
+    def lookup(self, key):
+        """Return the cached exit code and stdout for key, or None."""
+        entry_path = self.entry_path(key)
+        try:
+            with open(entry_path) as fh:
+                entry = json.load(fh)
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            return None
+        return entry["returncode"], entry["stdout"].encode("latin-1")
+
+    def store(self, key, returncode, stdout):
+        entry_path = self.entry_path(key)
+        os.makedirs(path.dirname(entry_path), exist_ok=True)
+        # Write atomically, so that a concurrent lookup never sees a
+        # partial entry.
+        fd, temp_path = tempfile.mkstemp(dir=path.dirname(entry_path))
+        with os.fdopen(fd, "w") as fh:
+            json.dump(
+                {"returncode": returncode, "stdout": stdout.decode("latin-1")},
+                fh,
+            )
+        os.replace(temp_path, entry_path)
+        self.evict_if_due()
+
+    def evict_if_due(self):
+        marker = path.join(self.directory, "last-eviction")
+        try:
+            if time.time() - os.stat(marker).st_mtime < EVICTION_INTERVAL:
+                return
+        except FileNotFoundError:
+            pass
+        with open(marker, "w"):
+            pass
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is
+        within its size limit."""
+        entries = []
+        total = 0
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, entry_path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def run_with_cache(cache, key, run):
+    """Return the exit code of a test, from the cache if possible.
+
+    On a cache miss, run() is called to run the test. If it returns 0,
+    that and everything it writes to stdout are stored under key. If
+    cache or key is None, run() is just called."""
+    if cache is None or key is None:
+        return run()
+    cached = cache.lookup(key)
+    if cached is not None:
+        returncode, stdout = cached
+        sys.stdout.buffer.write(stdout)
+        sys.stdout.buffer.flush()
+        return returncode
+    sys.stdout.flush()
+    tee = TeeOutput(sys.stdout.buffer)
+    wrapper = io.TextIOWrapper(tee, write_through=True)
+    with contextlib.redirect_stdout(wrapper):
+        returncode = run()
+    wrapper.detach()
+    if returncode == 0:
+        cache.store(key, returncode, bytes(tee.data))
+    return returncode
+
+
+def add_arguments(parser):
+    """Add the result cache options to an executor's argument parser."""
+    parser.add_argument(
+        "--result-cache-dir",
+        help="Directory in which to cache test results, so that unchanged "
+        "tests aren't run again",
+    )
+    parser.add_argument(
+        "--result-cache-size",
+        type=int,
+        default=DEFAULT_MAX_SIZE,
+        help="Maximum size of the result cache in bytes (default: 1GiB)",
+    )
+    parser.add_argument(
+        "--no-result-cache",
+        action="store_true",
+        help="Neither use nor update the result cache",
+    )
+
+
+def open_cache(args):
+    """Return the ResultCache selected by an executor's arguments, or
+    None if results aren't to be cached."""
+    if args.no_result_cache or not args.result_cache_dir or args.verbose:
+        return None
+    if getattr(args, "tarmac", None):
+        return None
+    return ResultCache(args.result_cache_dir, args.result_cache_size)
+
+
+def qemu_key(
+    cache,
+    qemu_command,
+    qemu_machine,
+    qemu_cpu,
+    qemu_extra_params,
+    image,
+    arguments,
+    max_output,
+    files=(),
+):
+    """Return the cache key for a test run with QEMU."""
+    settings = [
+        executable_identity(qemu_command),
+        qemu_machine,
+        qemu_cpu,
+        list(qemu_extra_params),
+        max_output,
+    ]
+    return cache.key("qemu", settings, image, arguments, files)
+
+
+def fvp_key(
+    cache,
+    fvp_install_dir,
+    fvp_config_dir,
+    fvp_model,
+    fvp_configs,
+    image,
+    arguments,
+    max_output,
+    files=(),
+):
+    """Return the cache key for a test run with an FVP."""
+    fvp_configs = fvp_configs or []
+    settings = [
+        executable_identity(path.join(fvp_install_dir, MODELS[fvp_model].model_exe)),
+        fvp_model,
+        fvp_configs,
+        max_output,
+    ]
+    config_files = [
+        path.join(fvp_config_dir, config + ".cfg") for config in fvp_configs
+    ]
+    return cache.key("fvp", settings, image, arguments, config_files + list(files))
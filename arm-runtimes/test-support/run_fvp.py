@@ -2,11 +2,21 @@
 
 # SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
 
-import subprocess
-import sys
 from os import path
 from dataclasses import dataclass
+import re
 import shlex
+import sys
+
+from stream_output import run_streaming
+
+# With --stat, a model prints a block of statistics for each CPU when
+# it exits, starting with a line like "--- cpu0 statistics: -----" and
+# ending with a line of dashes, in which a line like
+# "cpu0 : 12.34 MIPS (   123456 Inst)" gives the instructions run.
+STATISTICS_START = re.compile(rb"^--- .* statistics: -*\s*$")
+STATISTICS_END = re.compile(rb"^-+\s*$")
+INSTRUCTION_COUNT = re.compile(rb"\(\s*(\d+)\s+Inst\)")
 
 @dataclass
 class FVP:
@@ -37,19 +47,20 @@ MODELS = {
 }
 
 
-def run_fvp(
+def fvp_command(
     fvp_install_dir,
     fvp_config_dir,
     fvp_model,
     fvp_configs,
     image,
     arguments,
-    timeout,
-    working_directory,
-    verbose,
     tarmac_file,
 ):
-    """Execute the program using an FVP and return the subprocess return code."""
+    """Return the command line to run an FVP model.
+
+    If image is None, no application is loaded and no semihosting
+    command line is set, so that they can be supplied later through
+    the model's debug interface."""
     if fvp_model not in MODELS:
         raise Exception(f"{fvp_model} is not a recognised model name")
     model = MODELS[fvp_model]
@@ -58,8 +69,9 @@ def run_fvp(
     command.extend(["--quiet"])
     for config in fvp_configs:
         command.extend(["--config-file", path.join(fvp_config_dir, config + ".cfg")])
-    command.extend(["--application", image])
-    command.extend(["--parameter", f"{model.cmdline_param}={shlex.join(arguments)}"])
+    if image is not None:
+        command.extend(["--application", image])
+        command.extend(["--parameter", f"{model.cmdline_param}={shlex.join(arguments)}"])
     command.extend(["--plugin", path.join(fvp_install_dir, model.crypto_plugin)])
     if tarmac_file is not None:
         command.extend([
@@ -68,10 +80,54 @@ def run_fvp(
             "--parameter",
             "TRACE.TarmacTrace.trace-file=" + tarmac_file,
         ])
+    return command
 
-    if verbose:
-        print("running: {}".format(shlex.join(command)))
 
+class StatisticsFilter:
+    """Binary file object that passes a model's output on to another,
+    except for the statistics printed by --stat, from which it collects
+    the number of instructions run."""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.pending = b""
+        self.in_statistics = False
+        self.instructions = None
+
+    def write(self, data):
+        # Only whole lines can be recognised, so the last, incomplete
+        # one is held back until the rest of it arrives.
+        lines = (self.pending + data).split(b"\n")
+        self.pending = lines.pop()
+        for line in lines:
+            self.filter_line(line)
+        return len(data)
+
+    def filter_line(self, line):
+        if not self.in_statistics and STATISTICS_START.match(line):
+            self.in_statistics = True
+        elif self.in_statistics:
+            match = INSTRUCTION_COUNT.search(line)
+            if match:
+                self.instructions = (self.instructions or 0) + int(match.group(1))
+            elif STATISTICS_END.match(line):
+                self.in_statistics = False
+        else:
+            self.sink.write(line + b"\n")
+
+    def flush(self):
+        self.sink.flush()
+
+    def finish(self):
+        """Pass on any incomplete last line."""
+        if self.pending and not self.in_statistics:
+            self.sink.write(self.pending)
+        self.pending = b""
+        self.sink.flush()
+
+
+def write_semihosting_features(working_directory):
+    """Create the ":semihosting-features" file the test program reads."""
     # SDDKW-53824: the ":semihosting-features" pseudo-file isn't simulated
     # by these models. To work around that, we create one ourselves in the
     # test process's working directory, containing the single feature flag
@@ -84,14 +140,52 @@ def run_fvp(
     ) as fh:
         fh.write(b"SHFB\x01")
 
-    result = subprocess.run(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=sys.stderr,
-        timeout=timeout,
-        cwd=working_directory,
-        check=False,
+
+def run_fvp(
+    fvp_install_dir,
+    fvp_config_dir,
+    fvp_model,
+    fvp_configs,
+    image,
+    arguments,
+    timeout,
+    working_directory,
+    verbose,
+    tarmac_file,
+    max_output=None,
+    stats=None,
+):
+    """Execute the program using an FVP and return the subprocess return code.
+
+    The program's output is passed on as it is produced, up to
+    max_output bytes if that isn't None. If stats is a dict, it is
+    filled in as described in stream_output.py, and the model's own
+    statistics are used to add "instructions", the number it ran."""
+    command = fvp_command(
+        fvp_install_dir,
+        fvp_config_dir,
+        fvp_model,
+        fvp_configs,
+        image,
+        arguments,
+        tarmac_file,
     )
-    sys.stdout.buffer.write(result.stdout)
-    return result.returncode
 
+    if verbose:
+        print("running: {}".format(shlex.join(command)))
+
+    write_semihosting_features(working_directory)
+
+    if stats is None:
+        return run_streaming(command, timeout, working_directory, max_output)
+
+    command.append("--stat")
+    sink = StatisticsFilter(sys.stdout.buffer)
+    try:
+        return run_streaming(
+            command, timeout, working_directory, max_output, stats, sink
+        )
+    finally:
+        sink.finish()
+        if sink.instructions is not None:
+            stats["instructions"] = sink.instructions
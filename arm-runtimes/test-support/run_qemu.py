@@ -2,22 +2,40 @@
 
 # Copyright (c) 2023, Arm Limited and affiliates.
 
-import subprocess
-import sys
+import os
+import re
+import tempfile
 
+from stream_output import run_streaming
 
-def run_qemu(
+# QEMU's "insn" TCG plugin (contrib/plugins or tests/plugin, built as
+# libinsn.so) writes lines like "cpu 0 insns: 1234" and
+# "total insns: 1234", or just "insns: 1234" in older versions, to the
+# plugin log when QEMU exits.
+INSN_COUNT = re.compile(r"^(cpu \d+ |total )?insns: (\d+)", re.MULTILINE)
+
+
+def read_instruction_count(log_text):
+    """Return the number of instructions reported by the insn plugin,
+    or None if it didn't report any."""
+    counts = INSN_COUNT.findall(log_text)
+    totals = [int(count) for prefix, count in counts if prefix == "total "]
+    if totals:
+        return totals[-1]
+    if counts:
+        return sum(int(count) for _, count in counts)
+    return None
+
+
+def build_qemu_command(
     qemu_command,
     qemu_machine,
     qemu_cpu,
     qemu_extra_params,
     image,
     arguments,
-    timeout,
-    working_directory,
-    verbose,
 ):
-    """Execute the program using QEMU and return the subprocess return code."""
+    """Return the command line to run QEMU."""
     qemu_params = ["-M", qemu_machine]
     if qemu_cpu:
         qemu_params += ["-cpu", qemu_cpu]
@@ -44,18 +62,54 @@ def run_qemu(
     else:
         qemu_params += ["-device", f"loader,file={image},cpu-num=0"]
 
-    command = [qemu_command] + qemu_params
+    return [qemu_command] + qemu_params
 
-    if verbose:
-        print("running: {}".format(" ".join(command)))
 
-    result = subprocess.run(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=sys.stderr,
-        timeout=timeout,
-        cwd=working_directory,
-        check=False,
+def run_qemu(
+    qemu_command,
+    qemu_machine,
+    qemu_cpu,
+    qemu_extra_params,
+    image,
+    arguments,
+    timeout,
+    working_directory,
+    verbose,
+    max_output=None,
+    stats=None,
+    insn_plugin=None,
+):
+    """Execute the program using QEMU and return the subprocess return code.
+
+    The program's output is passed on as it is produced, up to
+    max_output bytes if that isn't None. If stats is a dict, it is
+    filled in as described in stream_output.py, and if insn_plugin is
+    the path of QEMU's insn plugin, it is used to add "instructions",
+    the number the guest ran."""
+    command = build_qemu_command(
+        qemu_command,
+        qemu_machine,
+        qemu_cpu,
+        qemu_extra_params,
+        image,
+        arguments,
     )
-    sys.stdout.buffer.write(result.stdout)
-    return result.returncode
+
+    if stats is None or insn_plugin is None:
+        if verbose:
+            print("running: {}".format(" ".join(command)))
+        return run_streaming(command, timeout, working_directory, max_output, stats)
+
+    log_fd, log_file = tempfile.mkstemp(prefix="qemu-insn-", suffix=".log")
+    os.close(log_fd)
+    command += ["-plugin", insn_plugin, "-d", "plugin", "-D", log_file]
+    if verbose:
+        print("running: {}".format(" ".join(command)))
+    try:
+        return run_streaming(command, timeout, working_directory, max_output, stats)
+    finally:
+        with open(log_file, errors="replace") as fh:
+            instructions = read_instruction_count(fh.read())
+        os.remove(log_file)
+        if instructions is not None:
+            stats["instructions"] = instructions
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Helpers for passing an emulator's output on as it is produced, rather
+# than collecting all of it and writing it out once the emulator exits.
+# The output can be limited to a maximum number of bytes, beyond which
+# it is read and discarded, so that a test stuck printing in a loop
+# doesn't use an unbounded amount of memory before its timeout.
+#
+# Each function can also fill in a dict of statistics about the run:
+# "wall_time" and "cpu_time" in seconds and "max_rss_kib", the peak
+# resident set size of the process in KiB. The CPU time and memory use
+# are collected when reaping the process, so are only available on
+# hosts with os.wait4.
+
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+CHUNK_SIZE = 65536
+
+
+def copy_output(source, sink, max_output=None):
+    """Copy the binary file object source to sink until end of file,
+    a chunk at a time as data arrives.
+
+    Only the first max_output bytes are written, if it isn't None, and
+    the rest is discarded. Returns the number of bytes discarded."""
+    written = 0
+    discarded = 0
+    while True:
+        data = source.read1(CHUNK_SIZE)
+        if not data:
+            return discarded
+        if max_output is not None and written + len(data) > max_output:
+            room = max(max_output - written, 0)
+            discarded += len(data) - room
+            data = data[:room]
+        if data:
+            sink.write(data)
+            sink.flush()
+            written += len(data)
+
+
+def truncation_message(discarded, max_output):
+    return (
+        f"\n[output truncated: {discarded} bytes discarded after the "
+        f"first {max_output}]\n"
+    ).encode()
+
+
+def wait_process(process, timeout):
+    """Wait for a process to exit, like process.wait(timeout), and
+    return its resource usage, or None if that isn't available."""
+    if not hasattr(os, "wait4"):
+        process.wait(timeout=timeout)
+        return None
+    usage = []
+
+    def reap():
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            # Popen reaped it first, while killing it after a timeout.
+            process.wait()
+            return
+        process.returncode = os.waitstatus_to_exitcode(status)
+        usage.append(rusage)
+
+    waiter = threading.Thread(target=reap)
+    waiter.start()
+    waiter.join(timeout)
+    if waiter.is_alive():
+        process.kill()
+        waiter.join()
+        raise subprocess.TimeoutExpired(process.args, timeout)
+    return usage[0] if usage else None
+
+
+def record_usage(stats, start_time, usage):
+    stats["wall_time"] = time.monotonic() - start_time
+    if usage is not None:
+        stats["cpu_time"] = usage.ru_utime + usage.ru_stime
+        # ru_maxrss is in bytes on macOS, and KiB everywhere else.
+        if sys.platform == "darwin":
+            stats["max_rss_kib"] = usage.ru_maxrss // 1024
+        else:
+            stats["max_rss_kib"] = usage.ru_maxrss
+
+
+def stream_process(process, sink, timeout, max_output=None, stats=None):
+    """Copy a process's stdout to sink while waiting for it to exit,
+    and return its exit code and the number of bytes discarded.
+
+    The process must have been started with stdout=subprocess.PIPE.
+    As with subprocess.run, it is killed and subprocess.TimeoutExpired
+    raised if it doesn't exit within timeout seconds. If stats isn't
+    None, it is filled in even if the process times out; the wall time
+    counts from when this function is called."""
+    start_time = time.monotonic()
+    usage = None
+    discarded = []
+    reader = threading.Thread(
+        target=lambda: discarded.append(
+            copy_output(process.stdout, sink, max_output)
+        )
+    )
+    reader.start()
+    try:
+        usage = wait_process(process, timeout)
+    finally:
+        reader.join()
+        process.stdout.close()
+        if stats is not None:
+            record_usage(stats, start_time, usage)
+    return process.returncode, discarded[0]
+
+
+def run_streaming(
+    command, timeout, working_directory, max_output=None, stats=None, sink=None
+):
+    """Run a command, passing its stdout on to this process's stdout as
+    it arrives, and return its exit code.
+
+    The stderr of the command goes straight to this process's stderr,
+    along with a note if any of the stdout was discarded. The stdout
+    can be sent to another binary file object, sink, instead."""
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=sys.stderr,
+        cwd=working_directory,
+    )
+    returncode, discarded = stream_process(
+        process, sink or sys.stdout.buffer, timeout, max_output, stats
+    )
+    if discarded:
+        sys.stderr.buffer.write(truncation_message(discarded, max_output))
+        sys.stderr.buffer.flush()
+    return returncode
+
+
+def capture_process(process, stderr_file, timeout, max_output=None, stats=None):
+    """Wait for a process started with stdout=subprocess.PIPE and its
+    stderr going to the temporary file stderr_file, and return its exit
+    code, stdout and stderr.
+
+    At most max_output bytes of stdout are kept, if it isn't None."""
+    stdout = io.BytesIO()
+    returncode, discarded = stream_process(
+        process, stdout, timeout, max_output, stats
+    )
+    stderr_file.seek(0)
+    stderr = stderr_file.read()
+    if discarded:
+        stderr += truncation_message(discarded, max_output)
+    return returncode, stdout.getvalue(), stderr
+
+
+def run_captured(command, timeout, working_directory, max_output=None, stats=None):
+    """Run a command and return its exit code, stdout and stderr.
+
+    Like subprocess.run with both outputs captured, except that at
+    most max_output bytes of stdout are kept, if it isn't None."""
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            cwd=working_directory,
+        )
+        return capture_process(process, stderr_file, timeout, max_output, stats)
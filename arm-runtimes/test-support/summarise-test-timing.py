@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Summarise the timing files written by the test executors (see
+# test_timing.py), listing the slowest tests and the variants whose
+# tests took longest in total.
+#
+# The arguments are timing files, or directories to search for files
+# named test-timing.jsonl, such as a whole build directory. A timing
+# file is appended to each time the tests are run, so only the most
+# recent record for each test is used. Tests whose result came from the
+# result cache are left out, as they say nothing about the test itself.
+
+import argparse
+import json
+import os
+import sys
+from os import path
+
+TIMING_FILE_NAME = "test-timing.jsonl"
+
+METRICS = {
+    "wall_time": "Wall (s)",
+    "cpu_time": "CPU (s)",
+    "max_rss_kib": "Peak RSS (KiB)",
+    "instructions": "Instructions",
+}
+
+
+def find_timing_files(paths):
+    for name in paths:
+        if path.isdir(name):
+            for dirpath, _, filenames in os.walk(name):
+                if TIMING_FILE_NAME in filenames:
+                    yield path.join(dirpath, TIMING_FILE_NAME)
+        else:
+            yield name
+
+
+def read_records(timing_files):
+    """Return the most recent emulated record for each test, keyed by
+    variant, image and arguments."""
+    latest = {}
+    for timing_file in timing_files:
+        with open(timing_file) as fh:
+            for line_number, line in enumerate(fh, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A run interrupted mid-write can leave a partial
+                    # last line.
+                    print(
+                        f"{timing_file}:{line_number}: ignoring malformed record",
+                        file=sys.stderr,
+                    )
+                    continue
+                if not record.get("emulated"):
+                    continue
+                if record["variant"] is None:
+                    record["variant"] = path.basename(path.dirname(timing_file))
+                key = (
+                    record["variant"],
+                    record["image"],
+                    tuple(record["arguments"]),
+                )
+                latest[key] = record
+    return list(latest.values())
+
+
+def format_value(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def print_table(headings, rows):
+    widths = [
+        max(len(row[column]) for row in [headings] + rows)
+        for column in range(len(headings))
+    ]
+    for row in [headings] + rows:
+        # Right-align the numbers, left-align the final name column.
+        cells = [cell.rjust(width) for cell, width in zip(row[:-1], widths)]
+        print("  ".join(cells + [row[-1]]))
+
+
+def test_name(record):
+    name = record["image"]
+    if record["returncode"] is None:
+        name += " (timed out)"
+    return name
+
+
+def summarise_tests(records, metric, count):
+    records = [r for r in records if r.get(metric) is not None]
+    records.sort(key=lambda r: r[metric], reverse=True)
+    rows = [
+        [format_value(r.get(m)) for m in METRICS]
+        + [r["variant"], test_name(r)]
+        for r in records[:count]
+    ]
+    print(f"Slowest {len(rows)} of {len(records)} tests by {METRICS[metric]}:")
+    print_table(list(METRICS.values()) + ["Variant", "Test"], rows)
+
+
+def summarise_variants(records, metric, count):
+    totals = {}
+    for record in records:
+        total = totals.setdefault(
+            record["variant"], {"tests": 0, **{m: None for m in METRICS}}
+        )
+        total["tests"] += 1
+        for m in METRICS:
+            if record.get(m) is None:
+                continue
+            if m == "max_rss_kib":
+                total[m] = max(total[m] or 0, record[m])
+            else:
+                total[m] = (total[m] or 0) + record[m]
+    ranked = sorted(
+        totals.items(), key=lambda item: item[1][metric] or 0, reverse=True
+    )
+    rows = [
+        [str(total["tests"])]
+        + [format_value(total[m]) for m in METRICS]
+        + [variant]
+        for variant, total in ranked[:count]
+    ]
+    print(f"Slowest {len(rows)} of {len(totals)} variants by total {METRICS[metric]}:")
+    print_table(["Tests"] + list(METRICS.values()) + ["Variant"], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rank the slowest tests and variants from test timing files"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help=f"timing files, or directories to search for {TIMING_FILE_NAME}",
+    )
+    parser.add_argument(
+        "--sort",
+        choices=sorted(METRICS),
+        default="wall_time",
+        help="Measurement to rank by (default: wall_time). The peak RSS of "
+        "a variant is its largest for any test",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="Number of tests and variants to list (default: 20)",
+    )
+    args = parser.parse_args()
+
+    records = read_records(find_timing_files(args.paths))
+    if not records:
+        print("No timing records found", file=sys.stderr)
+        sys.exit(1)
+    summarise_tests(records, args.sort, args.top)
+    print()
+    summarise_variants(records, args.sort, args.top)
+
+
+if __name__ == "__main__":
+    main()
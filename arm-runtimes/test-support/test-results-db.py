@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Keep the results of many test runs in an SQLite database, to find
+# trends across them, such as tests that are flaky or getting slower.
+#
+# The ingest subcommand adds one run to the database. Its arguments are
+# junit xml files, timing files written by the test executors (see
+# test_timing.py), or build directories to search for both. Each
+# testcase is stored with its run, variant, suite, classname and name,
+# its outcome (pass, fail, error or skip) and its duration. The variant
+# is taken from a runtimes-{variant}-build directory in the file's path,
+# or else from the suite name given by process-junit-xml.py.
+#
+# Timing files are appended to by every test run, so only the records
+# added since the file was last ingested are stored with the run. The
+# part of each file that a run took is remembered, so that ingesting the
+# run again with the same label reads the same records.
+#
+# The query subcommand answers these questions about the most recent
+# runs, ordered by their time:
+#   flaky        tests that have both passed and failed
+#   regressions  tests whose duration in the latest run is much longer
+#                than their average over the earlier runs
+#   slowest      the suites with the longest average total duration
+#   emulator     the tests with the longest average emulator wall time,
+#                from the timing records
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from os import path
+from xml.etree import ElementTree
+
+# The junit files written by the library tests, searched for in build
+# directories. The merged report written by check-all is left out, as
+# its tests are already in these.
+JUNIT_FILE_NAMES = ("testlog.junit.xml", "results.junit.xml")
+TIMING_FILE_NAME = "test-timing.jsonl"
+
+VARIANT_DIR = re.compile(r"^runtimes-(.+)-build$")
+VARIANT_SUITES = [
+    re.compile(r"^picolibc-(.+)$"),
+    re.compile(r"^compiler-rt-(.+)-Builtins$"),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    label TEXT UNIQUE,
+    time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    variant TEXT NOT NULL,
+    suite TEXT NOT NULL,
+    classname TEXT NOT NULL,
+    test TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    duration REAL,
+    PRIMARY KEY (run, variant, suite, classname, test)
+);
+CREATE INDEX IF NOT EXISTS results_by_test
+    ON results (variant, suite, classname, test, run);
+CREATE TABLE IF NOT EXISTS timings (
+    run INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    variant TEXT,
+    executor TEXT,
+    image TEXT NOT NULL,
+    arguments TEXT NOT NULL,
+    returncode INTEGER,
+    wall_time REAL,
+    cpu_time REAL,
+    max_rss_kib INTEGER,
+    instructions INTEGER
+);
+CREATE INDEX IF NOT EXISTS timings_by_run ON timings (run);
+CREATE TABLE IF NOT EXISTS timing_files (
+    path TEXT NOT NULL,
+    run INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    start INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    PRIMARY KEY (path, run)
+);
+"""
+
+
+def open_db(db_file):
+    db = sqlite3.connect(db_file)
+    db.execute("PRAGMA foreign_keys = ON")
+    db.executescript(SCHEMA)
+    return db
+
+
+def find_files(paths):
+    """Yield the junit and timing files among paths, searching any
+    directories."""
+    for name in paths:
+        if not path.isdir(name):
+            yield name
+            continue
+        for dirpath, _, filenames in os.walk(name):
+            for filename in filenames:
+                if filename in JUNIT_FILE_NAMES or filename == TIMING_FILE_NAME:
+                    yield path.join(dirpath, filename)
+
+
+def path_variant(filename):
+    for part in reversed(path.abspath(filename).split(os.sep)):
+        match = VARIANT_DIR.match(part)
+        if match:
+            return match.group(1)
+    return None
+
+
+def suite_variant(suite):
+    for pattern in VARIANT_SUITES:
+        match = pattern.match(suite)
+        if match:
+            return match.group(1)
+    return ""
+
+
+def outcome(testcase):
+    for tag, name in (("failure", "fail"), ("error", "error"), ("skipped", "skip")):
+        if testcase.find(tag) is not None:
+            return name
+    return "pass"
+
+
+def read_junit(xml_file):
+    """Yield a row for each testcase in a junit file, reading it one
+    testcase at a time."""
+    variant = path_variant(xml_file)
+    suites = []
+    for event, element in ElementTree.iterparse(xml_file, events=("start", "end")):
+        if element.tag == "testsuite":
+            if event == "start":
+                suites.append(element.get("name", ""))
+            else:
+                suites.pop()
+                element.clear()
+        elif element.tag == "testcase" and event == "end":
+            suite = suites[-1] if suites else ""
+            duration = element.get("time")
+            yield (
+                variant if variant is not None else suite_variant(suite),
+                suite,
+                element.get("classname", ""),
+                element.get("name", ""),
+                outcome(element),
+                float(duration) if duration else None,
+            )
+            element.clear()
+
+
+def read_new_timings(db, run, timing_file):
+    """Yield a row for each record added to a timing file since it was
+    last ingested, and remember which part of it the run took. A run
+    that is ingested again takes the same part, and also any records
+    added since if no other run has read them."""
+    key = path.abspath(timing_file)
+    row = db.execute(
+        "SELECT start, offset FROM timing_files WHERE path = ? AND run = ?",
+        (key, run),
+    ).fetchone()
+    end = None
+    if row:
+        start = row[0]
+        later = db.execute(
+            "SELECT 1 FROM timing_files WHERE path = ? AND run != ? AND start >= ?",
+            (key, run, row[1]),
+        ).fetchone()
+        if later:
+            end = row[1]
+    else:
+        start = db.execute(
+            "SELECT max(offset) FROM timing_files WHERE path = ?", (key,)
+        ).fetchone()[0]
+        start = start or 0
+    if start > path.getsize(timing_file):
+        # The file has been replaced, so start again.
+        start = 0
+        end = None
+    offset = start
+    variant = path_variant(timing_file)
+    with open(timing_file, "rb") as fh:
+        fh.seek(offset)
+        for line in fh:
+            if end is not None and offset >= end:
+                break
+            if not line.endswith(b"\n"):
+                # A record still being written is left for next time.
+                break
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not record.get("emulated"):
+                continue
+            yield (
+                record["variant"] or variant,
+                record.get("executor"),
+                record["image"],
+                json.dumps(record["arguments"]),
+                record["returncode"],
+                record.get("wall_time"),
+                record.get("cpu_time"),
+                record.get("max_rss_kib"),
+                record.get("instructions"),
+            )
+    db.execute(
+        "INSERT OR REPLACE INTO timing_files VALUES (?, ?, ?, ?)",
+        (key, run, start, offset),
+    )
+
+
+def ingest(args):
+    db = open_db(args.db)
+    with db:
+        row = None
+        if args.label is not None:
+            row = db.execute(
+                "SELECT id FROM runs WHERE label = ?", (args.label,)
+            ).fetchone()
+        if row:
+            # Ingesting a run again replaces its results, but keeps its
+            # id, and its time unless a new one is given.
+            run = row[0]
+            if args.time is not None:
+                db.execute("UPDATE runs SET time = ? WHERE id = ?", (args.time, run))
+            db.execute("DELETE FROM results WHERE run = ?", (run,))
+            db.execute("DELETE FROM timings WHERE run = ?", (run,))
+        else:
+            run = db.execute(
+                "INSERT INTO runs (label, time) VALUES (?, ?)",
+                (args.label, args.time if args.time is not None else time.time()),
+            ).lastrowid
+        results = 0
+        timings = 0
+        for filename in find_files(args.paths):
+            if path.basename(filename) == TIMING_FILE_NAME:
+                rows = [(run,) + row for row in read_new_timings(db, run, filename)]
+                db.executemany(
+                    "INSERT INTO timings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                timings += len(rows)
+            else:
+                rows = [(run,) + row for row in read_junit(filename)]
+                # A junit file can list the same test twice, such as
+                # when a test is run again; the last result is kept.
+                db.executemany(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                results += len(rows)
+    print(f"Run {run}: stored {results} test results and {timings} timing records")
+
+
+# The most recent runs by time, as a common table expression, given the
+# number of runs as its parameter. Runs at the same time are ordered by
+# when they were first ingested.
+RECENT_RUNS = """
+    WITH recent AS (SELECT id FROM runs ORDER BY time DESC, id DESC LIMIT ?)
+"""
+
+
+def query_flaky(db, args):
+    return (
+        ["Passes", "Failures", "Variant", "Suite", "Test"],
+        db.execute(
+            RECENT_RUNS
+            + """
+            SELECT sum(outcome = 'pass') AS passes,
+                   sum(outcome IN ('fail', 'error')) AS failures,
+                   variant, suite, classname || '.' || test
+            FROM results
+            WHERE run IN (SELECT id FROM recent)
+            GROUP BY variant, suite, classname, test
+            HAVING passes > 0 AND failures > 0
+            ORDER BY failures * passes DESC, variant, suite, test
+            LIMIT ?
+            """,
+            (args.runs, args.top),
+        ).fetchall(),
+    )
+
+
+def query_regressions(db, args):
+    latest = db.execute(
+        "SELECT id FROM runs ORDER BY time DESC, id DESC LIMIT 1"
+    ).fetchone()
+    if latest is None:
+        return [], []
+    return (
+        ["Before (s)", "Latest (s)", "Ratio", "Variant", "Suite", "Test"],
+        db.execute(
+            RECENT_RUNS
+            + """
+            SELECT avg(earlier.duration) AS before, latest.duration,
+                   latest.duration / avg(earlier.duration) AS ratio,
+                   latest.variant, latest.suite,
+                   latest.classname || '.' || latest.test
+            FROM results AS latest
+            JOIN results AS earlier
+              ON earlier.variant = latest.variant
+             AND earlier.suite = latest.suite
+             AND earlier.classname = latest.classname
+             AND earlier.test = latest.test
+             AND earlier.run IN (SELECT id FROM recent)
+             AND earlier.run != latest.run
+            WHERE latest.run = ? AND latest.duration >= ?
+            GROUP BY latest.variant, latest.suite, latest.classname, latest.test
+            HAVING before > 0 AND ratio >= ?
+            ORDER BY latest.variant, ratio DESC
+            LIMIT ?
+            """,
+            (args.runs, latest[0], args.min_duration, args.threshold, args.top),
+        ).fetchall(),
+    )
+
+
+def query_slowest(db, args):
+    return (
+        ["Tests", "Average (s)", "Variant", "Suite"],
+        db.execute(
+            RECENT_RUNS
+            + """
+            SELECT max(tests), avg(total), variant, suite
+            FROM (
+                SELECT run, variant, suite, count(*) AS tests,
+                       sum(duration) AS total
+                FROM results
+                WHERE run IN (SELECT id FROM recent)
+                GROUP BY run, variant, suite
+            )
+            GROUP BY variant, suite
+            ORDER BY avg(total) DESC
+            LIMIT ?
+            """,
+            (args.runs, args.top),
+        ).fetchall(),
+    )
+
+
+def query_emulator(db, args):
+    return (
+        ["Runs", "Wall (s)", "CPU (s)", "Variant", "Image"],
+        db.execute(
+            RECENT_RUNS
+            + """
+            SELECT count(*), avg(wall_time), avg(cpu_time), variant, image
+            FROM timings
+            WHERE run IN (SELECT id FROM recent)
+            GROUP BY variant, image, arguments
+            ORDER BY avg(wall_time) DESC
+            LIMIT ?
+            """,
+            (args.runs, args.top),
+        ).fetchall(),
+    )
+
+
+QUERIES = {
+    "flaky": query_flaky,
+    "regressions": query_regressions,
+    "slowest": query_slowest,
+    "emulator": query_emulator,
+}
+
+
+def format_value(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def print_table(headings, rows):
+    rows = [[format_value(value) for value in row] for row in rows]
+    widths = [
+        max(len(row[column]) for row in [headings] + rows)
+        for column in range(len(headings))
+    ]
+    for row in [headings] + rows:
+        # Right-align the numbers, left-align the final name column.
+        cells = [cell.rjust(width) for cell, width in zip(row[:-1], widths)]
+        print("  ".join(cells + [row[-1]]))
+
+
+def query(args):
+    if not path.exists(args.db):
+        sys.exit(f"{args.db} does not exist")
+    db = open_db(args.db)
+    headings, rows = QUERIES[args.query](db, args)
+    if not rows:
+        print("Nothing found")
+        return
+    print_table(headings, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Store test results from many runs and query their trends"
+    )
+    parser.add_argument("--db", required=True, help="SQLite database file")
+    subparsers = parser.add_subparsers(dest="subcommand", required=True)
+
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="Add the results of a test run to the database"
+    )
+    ingest_parser.add_argument(
+        "paths",
+        nargs="+",
+        help="junit xml files, timing files, or build directories to search "
+        f"for {', '.join(JUNIT_FILE_NAMES)} and {TIMING_FILE_NAME}",
+    )
+    ingest_parser.add_argument(
+        "--label",
+        help="Name of the run, such as a CI build number. Ingesting a run "
+        "with the same label again replaces its results, keeping its time "
+        "unless --time is given",
+    )
+    ingest_parser.add_argument(
+        "--time",
+        type=float,
+        help="Time of the run, in seconds since the epoch (default: now)",
+    )
+    ingest_parser.set_defaults(function=ingest)
+
+    query_parser = subparsers.add_parser("query", help="Query the recent runs")
+    query_parser.add_argument("query", choices=sorted(QUERIES))
+    query_parser.add_argument(
+        "--runs",
+        type=int,
+        default=30,
+        help="Number of most recent runs to look at (default: 30)",
+    )
+    query_parser.add_argument(
+        "--top",
+        type=int,
+        default=50,
+        help="Maximum number of rows to list (default: 50)",
+    )
+    query_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.5,
+        help="For regressions, how many times longer than its average a "
+        "test must have taken (default: 1.5)",
+    )
+    query_parser.add_argument(
+        "--min-duration",
+        type=float,
+        default=0.1,
+        help="For regressions, ignore tests that took less than this many "
+        "seconds in the latest run (default: 0.1)",
+    )
+    query_parser.set_defaults(function=query)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
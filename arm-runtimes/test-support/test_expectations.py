@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# The tests that are known not to work on some variants, executors or C
+# libraries, shared by all the emulator-based test executors. They are
+# listed in test-expectations.json, which is passed to the executors
+# with --expectations-file. Each entry in its "expectations" list has:
+#   tests        paths of the test images, relative to the build
+#                directory of the library under test; an image matches
+#                if its path ends with one of them
+#   expect       "skip" to not run the test at all, or "xfail" to run
+#                it and expect it to fail
+#   reason       why, usually with a link to the bug
+#   variants     the variants it applies to (default: all of them)
+#   executors    "qemu" and/or "fvp" (default: both)
+#   c_libraries  the C libraries it applies to (default: all of them)
+#   expires      optionally, a date in YYYY-MM-DD form after which the
+#                entry is ignored, so that a workaround for a bug that
+#                should have been fixed doesn't hide it forever
+#
+# An executor only needs the entries for its own variant, executor and
+# C library, so the file is reduced to an index of those, keyed by test
+# path. Looking up an image then takes one dictionary lookup per
+# component of its path, before the emulator is started.
+
+import datetime
+import json
+import sys
+from dataclasses import dataclass
+from os import path
+
+# https://mesonbuild.com/Unit-tests.html#skipped-tests-and-hard-errors
+EXIT_CODE_SKIP = 77
+
+EXPECTATIONS = ("skip", "xfail")
+
+
+@dataclass
+class Expectation:
+    test: str
+    expect: str
+    reason: str
+    expires: datetime.date = None
+
+
+def applies(entry, field, value):
+    return value is None or field not in entry or value in entry[field]
+
+
+def load_index(expectations_file, variant, executor, c_library):
+    """Return the expectations in expectations_file that apply to a
+    variant, executor and C library, keyed by test path. A variant or
+    C library of None matches every entry."""
+    with open(expectations_file) as fh:
+        entries = json.load(fh)["expectations"]
+    index = {}
+    for entry in entries:
+        if entry["expect"] not in EXPECTATIONS:
+            raise ValueError(
+                f"{expectations_file}: unknown expectation {entry['expect']!r}"
+            )
+        if not (
+            applies(entry, "variants", variant)
+            and applies(entry, "executors", executor)
+            and applies(entry, "c_libraries", c_library)
+        ):
+            continue
+        expires = entry.get("expires")
+        if expires is not None:
+            expires = datetime.date.fromisoformat(expires)
+        for test in entry["tests"]:
+            index[path.normpath(test)] = Expectation(
+                test, entry["expect"], entry["reason"], expires
+            )
+    return index
+
+
+def lookup(index, image):
+    """Return the Expectation for a test image, or None if it is
+    expected to pass. An expired entry is reported and ignored."""
+    parts = path.normpath(image).split(path.sep)
+    for start in range(len(parts)):
+        expectation = index.get(path.join(*parts[start:]))
+        if expectation is None:
+            continue
+        if (
+            expectation.expires is not None
+            and expectation.expires < datetime.date.today()
+        ):
+            print(
+                f"Ignoring the {expectation.expect} expectation of "
+                f"{expectation.test}, which expired on {expectation.expires}",
+                file=sys.stderr,
+            )
+            return None
+        return expectation
+    return None
+
+
+def add_arguments(parser):
+    """Add the expectation options to an executor's argument parser."""
+    parser.add_argument(
+        "--expectations-file",
+        help="JSON file of the tests to skip or expect to fail",
+    )
+    parser.add_argument(
+        "--expectations-variant",
+        help="Name of the library variant under test, to select the "
+        "expectations that apply to it",
+    )
+    parser.add_argument(
+        "--expectations-c-library",
+        help="Name of the C library under test, to select the expectations "
+        "that apply to it",
+    )
+
+
+def find_expectation(args, executor):
+    """Return the Expectation selected by an executor's arguments for
+    its image, or None."""
+    if not args.expectations_file:
+        return None
+    index = load_index(
+        args.expectations_file,
+        args.expectations_variant,
+        executor,
+        args.expectations_c_library,
+    )
+    return lookup(index, args.image)
+
+
+def run_expected(expectation, skip_code, run):
+    """Return the exit code of a test with an expectation: skip_code
+    without calling run() if it is to be skipped, or the result of
+    run() inverted if it is expected to fail. With no expectation, the
+    result of run() is returned unchanged."""
+    if expectation is None:
+        return run()
+    if expectation.expect == "skip":
+        print(f"Skipped: {expectation.reason}")
+        return skip_code
+    returncode = run()
+    if returncode == 0:
+        print(f"Unexpectedly passed, expected to fail: {expectation.reason}")
+        return 1
+    print(f"Failed as expected: {expectation.reason}")
+    return 0
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Records how long each test took to run on an emulator, so that the
+# tests and variants that dominate a test run can be found with
+# summarise-test-timing.py.
+#
+# Each executor appends one line of JSON per test to the file given
+# with --timing-file. Each record has:
+#   variant      the name given with --timing-variant, or null
+#   executor     "qemu" or "fvp"
+#   image        absolute path of the test image
+#   arguments    the test's semihosting arguments
+#   returncode   its exit code, or null if it timed out or failed to run
+#   emulated     false if no emulator was run, because the result came
+#                from the result cache or the test is disabled
+#   wall_time    seconds from starting the test to its end
+# and, when they could be measured (see stream_output.py):
+#   cpu_time     host CPU seconds used by the emulator process
+#   max_rss_kib  peak resident set size of the emulator process
+#   instructions number of guest instructions run
+#
+# Several executors append to the same file at once. Each record is
+# written with a single write to a file opened for appending, which
+# keeps the lines whole.
+
+import json
+import os
+import time
+from os import path
+
+
+def add_arguments(parser):
+    """Add the timing options to an executor's argument parser."""
+    parser.add_argument(
+        "--timing-file",
+        help="Append the test's timing and resource usage to this "
+        "JSON-lines file",
+    )
+    parser.add_argument(
+        "--timing-variant",
+        help="Name of the library variant under test, to record in the "
+        "timing file",
+    )
+
+
+def write_record(timing_file, record):
+    line = json.dumps(record).encode() + b"\n"
+    fd = os.open(timing_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def run_timed(args, executor, arguments, run):
+    """Return run(stats), recording the test's timing if the executor's
+    arguments ask for it.
+
+    run is passed a dict for the functions running the emulator to fill
+    in, or None if timing isn't being recorded."""
+    if not args.timing_file:
+        return run(None)
+    stats = {}
+    returncode = None
+    start_time = time.monotonic()
+    try:
+        returncode = run(stats)
+        return returncode
+    finally:
+        record = {
+            "variant": args.timing_variant,
+            "executor": executor,
+            "image": path.abspath(args.image),
+            "arguments": arguments,
+            "returncode": returncode,
+            "emulated": bool(stats),
+            "wall_time": time.monotonic() - start_time,
+        }
+        record.update(stats)
+        write_record(args.timing_file, record)
@@ -5,15 +5,413 @@ Script to copy target libraries into the build tree.
 Building libraries can take a very long time on some platforms so
 building them on another platform and copying them in can be a big
 time saver.
+
+Only the lib/clang-runtimes directory of the distribution is wanted,
+so the archive is read as a stream and only the members under that
+directory are extracted. If the xz, zstd or pigz program is available
+for the archive's compression, it is used to decompress the archive
+in a separate, multithreaded process. Otherwise Python's own
+decompression is used.
+
+With --variants, only the named library variants are extracted, along
+with the files shared by all of them, such as multilib.yaml.
+
+A manifest of the copied files and their hashes is kept beside the
+libraries, in clang-runtimes.manifest.json. If the distribution and
+the variants are the same as the last time, nothing is copied. If
+they have changed, only the variant directories and shared files whose
+contents differ are replaced, so that the rest keep their timestamps.
+The manifest is assumed to describe the libraries on disk; --force
+copies everything again regardless.
 """
 
 import argparse
+import contextlib
 import glob
+import hashlib
+import json
 import os
+import posixpath
 import shutil
+import subprocess
 import tarfile
 import tempfile
 
+# The directories that library variants are installed in, one for
+# each target triple.
+TRIPLE_DIRS = ["arm-none-eabi", "aarch64-none-elf"]
+
+# Programs that can decompress each type of archive faster than
+# Python can, using all the cores.
+DECOMPRESSORS = [
+    ((".tar.xz", ".txz"), ["xz", "--decompress", "--stdout", "--threads=0"]),
+    ((".tar.zst", ".tzst"), ["zstd", "--decompress", "--stdout", "--threads=0"]),
+    ((".tar.gz", ".tgz"), ["pigz", "--decompress", "--stdout"]),
+]
+
+MANIFEST_FILE = "clang-runtimes.manifest.json"
+
+
+@contextlib.contextmanager
+def open_stream(distribution_file):
+    """Yield a tarfile object reading the distribution as a stream."""
+    for suffixes, command in DECOMPRESSORS:
+        if distribution_file.endswith(suffixes) and shutil.which(command[0]):
+            break
+    else:
+        with tarfile.open(distribution_file, mode="r|*") as tf:
+            yield tf
+        return
+
+    with open(distribution_file, "rb") as fh:
+        process = subprocess.Popen(command, stdin=fh, stdout=subprocess.PIPE)
+    try:
+        with tarfile.open(fileobj=process.stdout, mode="r|") as tf:
+            yield tf
+        # Read any padding after the end of the archive, so that the
+        # decompressor can finish.
+        while process.stdout.read(1 << 20):
+            pass
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise RuntimeError(f"{command[0]} failed to decompress {distribution_file}")
+
+
+def runtimes_path(name):
+    """Return a member name relative to the lib/clang-runtimes
+    directory, or None if it isn't in that directory."""
+    parts = posixpath.normpath(name).split("/")
+    if len(parts) < 4 or parts[1:3] != ["lib", "clang-runtimes"]:
+        return None
+    relative = parts[3:]
+    if ".." in relative:
+        raise RuntimeError(f"Unsafe path {name} in distribution")
+    return "/".join(relative)
+
+
+def wanted(relative, variants):
+    """Return whether a path relative to lib/clang-runtimes should be
+    extracted for the selected variants, or None for all of them."""
+    if variants is None:
+        return True
+    parts = relative.split("/")
+    for i, part in enumerate(parts[:-1]):
+        if part in TRIPLE_DIRS:
+            return parts[i + 1] in variants
+    return True
+
+
+def unit_of(relative):
+    """Return the part of lib/clang-runtimes that a path is updated
+    with: its variant directory, or the path itself if it isn't in
+    one."""
+    parts = relative.split("/")
+    for i, part in enumerate(parts[:-1]):
+        if part in TRIPLE_DIRS:
+            return "/".join(parts[: i + 2])
+    return relative
+
+
+def symlink_target(relative, linkname):
+    """Return the path relative to lib/clang-runtimes that a symlink
+    refers to."""
+    target = posixpath.normpath(posixpath.join(posixpath.dirname(relative), linkname))
+    if target.startswith("../") or posixpath.isabs(target):
+        raise RuntimeError(f"Symlink {relative} points outside the libraries")
+    return target
+
+
+def link_target(member, relative):
+    """Return the path relative to lib/clang-runtimes that a symlink or
+    hardlink member refers to."""
+    if member.issym():
+        return symlink_target(relative, member.linkname)
+    target = runtimes_path(member.linkname)
+    if target is None:
+        raise RuntimeError(f"Hardlink {member.name} points outside the libraries")
+    return target
+
+
+def extract_member(tf, member, relative, destination):
+    """Extract a member of the distribution to its path relative to
+    lib/clang-runtimes in destination. Hardlinks are renamed to match,
+    and the "data" filter is used where the tarfile module has it."""
+    member.name = relative
+    if member.islnk():
+        member.linkname = runtimes_path(member.linkname)
+    if hasattr(tarfile, "data_filter"):
+        tf.extract(member, destination, filter="data")
+    else:
+        tf.extract(member, destination)
+
+
+def copy_from_archive(tf, member, targets, destination):
+    """Write the contents of a file member to each of targets, which
+    are paths relative to destination."""
+    data = tf.extractfile(member).read()
+    for target in targets:
+        filepath = os.path.join(destination, target)
+        if os.path.lexists(filepath):
+            os.remove(filepath)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, "wb") as fh:
+            fh.write(data)
+        os.chmod(filepath, member.mode & 0o777)
+
+
+def copies_in_directories(relative, copied_directories):
+    """Return the paths that a path is copied to because it is inside a
+    directory being copied to the paths of links to it."""
+    copies = []
+    parts = relative.split("/")
+    for i in range(1, len(parts)):
+        directory = "/".join(parts[:i])
+        rest = "/".join(parts[i:])
+        for link in copied_directories.get(directory, []):
+            copies.append(f"{link}/{rest}")
+    return copies
+
+
+def extract_runtimes(distribution_file, destination, variants, units=None):
+    """Extract the selected parts of lib/clang-runtimes from the
+    distribution into destination, or only those in units if that
+    isn't None."""
+    found = False
+    extracted = set()
+    # Links whose targets weren't extracted, because they are in a
+    # variant that wasn't selected, or are hardlinks to a file that
+    # isn't being extracted. Those targets are copied in by a second
+    # pass over the archive, including the whole of a directory that a
+    # symlink refers to.
+    missing_targets = {}
+    with open_stream(distribution_file) as tf:
+        for member in tf:
+            relative = runtimes_path(member.name)
+            if not relative:
+                continue
+            found = True
+            if not wanted(relative, variants):
+                continue
+            if units is not None and unit_of(relative) not in units:
+                continue
+            if member.issym() or member.islnk():
+                target = link_target(member, relative)
+                if not wanted(target, variants) or (
+                    member.islnk() and target not in extracted
+                ):
+                    missing_targets.setdefault(target, []).append(relative)
+                    continue
+            extract_member(tf, member, relative, destination)
+            extracted.add(relative)
+    if not found:
+        raise RuntimeError("lib/clang-runtimes not found in distribution")
+
+    while missing_targets:
+        # A link can point to another link, so this may take more than
+        # one pass. Links inside a copied directory are followed the
+        # same way, so the copy has no links out of it.
+        next_missing = {}
+        copied_directories = {}
+        found_targets = set()
+        with open_stream(distribution_file) as tf:
+            for member in tf:
+                relative = runtimes_path(member.name)
+                if not relative:
+                    continue
+                if relative in missing_targets:
+                    found_targets.add(relative)
+                    copies = list(missing_targets[relative])
+                    if member.isdir():
+                        # Its contents follow it in the archive.
+                        copied_directories[relative] = copies
+                else:
+                    copies = copies_in_directories(relative, copied_directories)
+                    if not copies:
+                        continue
+                if member.issym() or member.islnk():
+                    target = link_target(member, relative)
+                    next_missing.setdefault(target, []).extend(copies)
+                elif member.isdir():
+                    for copy in copies:
+                        os.makedirs(os.path.join(destination, copy), exist_ok=True)
+                elif member.isfile():
+                    copy_from_archive(tf, member, copies, destination)
+        not_found = set(missing_targets) - found_targets
+        if not_found:
+            raise RuntimeError(
+                f"Link target {sorted(not_found)[0]} not found in distribution"
+            )
+        missing_targets = next_missing
+
+
+def file_digest(fileobj):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(1 << 20), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copied_entries(relative, target, digests, symlinks, directories, depth=0):
+    """Return the manifest entries of the files that extract_runtimes
+    copies to relative in place of a link to target: a file, or all the
+    files in a directory."""
+    # Follow the chain of links to the file or directory to be copied.
+    for _ in range(len(symlinks)):
+        if target not in symlinks:
+            break
+        target = symlink_target(target, symlinks[target])
+    if target not in directories:
+        return {relative: {"sha256": digests.get(target)}}
+    if depth > len(symlinks):
+        raise RuntimeError(f"Symlink {relative} is part of a loop")
+    files = {}
+    prefix = target + "/"
+    for name, digest in digests.items():
+        if name.startswith(prefix):
+            files[relative + name[len(target):]] = {"sha256": digest}
+    for name, linkname in symlinks.items():
+        if name.startswith(prefix):
+            files.update(
+                copied_entries(
+                    relative + name[len(target):],
+                    symlink_target(name, linkname),
+                    digests,
+                    symlinks,
+                    directories,
+                    depth + 1,
+                )
+            )
+    return files
+
+
+def scan_archive(distribution_file, variants):
+    """Return the manifest entries of the files that extract_runtimes
+    would write for the selected variants, without writing them."""
+    digests = {}
+    symlinks = {}
+    directories = set()
+    with open_stream(distribution_file) as tf:
+        for member in tf:
+            relative = runtimes_path(member.name)
+            if not relative:
+                continue
+            # The files of variants that aren't selected are hashed too,
+            # in case a link to one of them is replaced by a copy.
+            if member.isfile():
+                digests[relative] = file_digest(tf.extractfile(member))
+            elif member.islnk():
+                digests[relative] = digests.get(link_target(member, relative))
+            elif member.issym():
+                symlinks[relative] = member.linkname
+            elif member.isdir():
+                directories.add(relative)
+    if not digests and not symlinks:
+        raise RuntimeError("lib/clang-runtimes not found in distribution")
+
+    files = {
+        relative: {"sha256": digest}
+        for relative, digest in digests.items()
+        if wanted(relative, variants)
+    }
+    for relative, linkname in symlinks.items():
+        if not wanted(relative, variants):
+            continue
+        target = symlink_target(relative, linkname)
+        if wanted(target, variants):
+            files[relative] = {"symlink": linkname}
+            continue
+        files.update(copied_entries(relative, target, digests, symlinks, directories))
+    return files
+
+
+def read_tree(directory):
+    """Return the manifest entries of the files under directory."""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in filenames + dirnames:
+            filepath = os.path.join(dirpath, filename)
+            relative = os.path.relpath(filepath, directory).replace(os.sep, "/")
+            if os.path.islink(filepath):
+                files[relative] = {"symlink": os.readlink(filepath)}
+            elif filename in filenames:
+                with open(filepath, "rb") as fh:
+                    files[relative] = {"sha256": file_digest(fh)}
+    return files
+
+
+def group_by_unit(files):
+    units = {}
+    for relative, entry in files.items():
+        units.setdefault(unit_of(relative), {})[relative] = entry
+    return units
+
+
+def update_runtimes(distribution_file, destination, staging, variants, old_files, files):
+    """Replace the parts of destination whose files differ between two
+    manifests, using staging as a work directory. Return the number of
+    parts replaced and removed."""
+    old_units = group_by_unit(old_files)
+    new_units = group_by_unit(files)
+    changed = {
+        unit
+        for unit, unit_files in new_units.items()
+        if old_units.get(unit) != unit_files
+        or not os.path.lexists(os.path.join(destination, unit))
+    }
+    removed = set(old_units) - set(new_units)
+    if changed:
+        extract_runtimes(distribution_file, staging, variants, changed)
+
+    # Move the old copies out of the way rather than deleting them
+    # first, so that nothing is missing for longer than it takes to
+    # rename a directory.
+    trash = tempfile.mkdtemp(dir=staging)
+    for i, unit in enumerate(sorted(changed | removed)):
+        unit_path = os.path.join(destination, unit)
+        if os.path.lexists(unit_path):
+            os.rename(unit_path, os.path.join(trash, str(i)))
+        if unit in changed:
+            os.makedirs(os.path.dirname(unit_path), exist_ok=True)
+            os.rename(os.path.join(staging, unit), unit_path)
+            continue
+        # Remove directories left empty, such as that of a triple
+        # whose variants are no longer wanted.
+        parent = os.path.dirname(unit_path)
+        while parent != destination and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+    return len(changed), len(removed)
+
+
+def read_manifest(manifest_file):
+    try:
+        with open(manifest_file) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(manifest_file, manifest):
+    with open(manifest_file + ".tmp", "w") as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    os.replace(manifest_file + ".tmp", manifest_file)
+
+
+def describe_archive(distribution_file, manifest):
+    """Return the size, modification time and hash of the distribution.
+    The hash is taken from the manifest if the size and time match."""
+    file_stat = os.stat(distribution_file)
+    archive = {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns}
+    old_archive = manifest["archive"] if manifest else {}
+    if all(old_archive.get(key) == value for key, value in archive.items()):
+        archive["sha256"] = old_archive["sha256"]
+    else:
+        with open(distribution_file, "rb") as fh:
+            archive["sha256"] = file_digest(fh)
+    return archive
+
 
 def main():
     parser = argparse.ArgumentParser(description=__doc__)
@@ -28,6 +426,17 @@ def main():
         required=True,
         help="The build root directory to copy into",
     )
+    parser.add_argument(
+        "--variants",
+        nargs="+",
+        help="Only copy these library variants",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Copy all the libraries, even if the manifest says they are "
+        "up to date",
+    )
     args = parser.parse_args()
 
     # Find the distribution. This is a glob because scripts may not
@@ -44,31 +453,55 @@ def main():
     os.makedirs(lib_dir, exist_ok=True)
 
     destination = os.path.join(lib_dir, "clang-runtimes")
+    manifest_file = os.path.join(lib_dir, MANIFEST_FILE)
+    variants = sorted(set(args.variants)) if args.variants else None
 
-    if os.path.isdir(destination):
-        shutil.rmtree(destination)
-
-    with tempfile.TemporaryDirectory(
-        dir=args.build_dir,
-    ) as tmp:
-        # Extract the distribution package.
-        with tarfile.open(distribution_file) as tf:
-            tf.extractall(tmp)
-
-        # Find the clang-runtimes directory in the extracted package
-        # directory.
-        for clang_runtimes in glob.glob(
-            os.path.join(tmp, "*", "lib", "clang-runtimes")
-        ):
-            break
+    manifest = None
+    if os.path.isdir(destination) and not args.force:
+        manifest = read_manifest(manifest_file)
+    archive = describe_archive(distribution_file, manifest)
+    if (
+        manifest is not None
+        and manifest["archive"]["sha256"] == archive["sha256"]
+        and manifest["variants"] == variants
+    ):
+        if manifest["archive"] != archive:
+            manifest["archive"] = archive
+            write_manifest(manifest_file, manifest)
+        print(f"{destination} is up to date")
+        return
+
+    # The manifest doesn't describe the libraries while they change.
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+
+    with tempfile.TemporaryDirectory(dir=lib_dir) as tmp:
+        if manifest is None:
+            if os.path.isdir(destination):
+                shutil.rmtree(destination)
+            # Extract next to the destination and then move the
+            # directory into place, so that an interrupted copy doesn't
+            # leave a partial one.
+            extract_runtimes(distribution_file, tmp, variants)
+            files = read_tree(tmp)
+            os.chmod(tmp, 0o755)
+            os.rename(tmp, destination)
+            # Leave something for TemporaryDirectory to clean up.
+            os.mkdir(tmp)
+            print(f"Copied {len(files)} files to {destination}")
         else:
-            raise RuntimeError("Extracted distribution directory not found")
+            files = scan_archive(distribution_file, variants)
+            changed, removed = update_runtimes(
+                distribution_file, destination, tmp, variants, manifest["files"], files
+            )
+            print(
+                f"Replaced {changed} and removed {removed} variant directories "
+                f"and shared files in {destination}"
+            )
 
-        # Move the directory containing the target libraries into
-        # position. The rest of the files in the distribution folder
-        # will be deleted automatically when the tmp object goes out of
-        # scope.
-        shutil.move(clang_runtimes, lib_dir)
+    write_manifest(
+        manifest_file, {"archive": archive, "variants": variants, "files": files}
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+"""
+Script to replace identical files in an installed target libraries
+directory (lib/clang-runtimes) with links to a single copy.
+Many library variants differ only in options such as -fno-exceptions,
+so their headers, and often their libraries, are the same.
+
+Files are grouped by size and mode, then by a hash of their contents.
+In each group the first path in sorted order is kept, and the others
+are replaced with hardlinks to it, or with relative symlinks if
+--mode=symlink is given. Running the script again on the same
+directory changes nothing.
+
+Identical archive members can't be shared this way, since an archive
+is a single file. --archive-report measures how much more space that
+would save, by counting the archive members that appear in more than
+one place, without changing anything.
+"""
+
+import argparse
+import hashlib
+import os
+import stat
+import sys
+
+AR_MAGIC = b"!<arch>\n"
+AR_HEADER_SIZE = 60
+
+
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_files(directory):
+    """Return the regular files under directory, without following
+    symlinks, with their stat results."""
+    files = []
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            file_stat = os.lstat(filepath)
+            if stat.S_ISREG(file_stat.st_mode):
+                files.append((filepath, file_stat))
+    return files
+
+
+def find_duplicates(files):
+    """Return lists of paths of files with the same contents and mode,
+    each sorted, with more than one path in each."""
+    by_size = {}
+    for filepath, file_stat in files:
+        if file_stat.st_size > 0:
+            key = (file_stat.st_size, file_stat.st_mode)
+            by_size.setdefault(key, []).append(filepath)
+
+    groups = []
+    for candidates in by_size.values():
+        if len(candidates) < 2:
+            continue
+        by_digest = {}
+        for filepath in candidates:
+            by_digest.setdefault(file_digest(filepath), []).append(filepath)
+        groups.extend(
+            sorted(paths) for paths in by_digest.values() if len(paths) > 1
+        )
+    return sorted(groups)
+
+
+def replace_with_link(filepath, target, mode):
+    # Make the link under a temporary name first, so that the file is
+    # never missing if the script is interrupted.
+    temp_path = filepath + ".dedup-tmp"
+    if mode == "symlink":
+        os.symlink(os.path.relpath(target, os.path.dirname(filepath)), temp_path)
+    else:
+        os.link(target, temp_path)
+    os.replace(temp_path, filepath)
+
+
+def deduplicate(directory, mode, dry_run):
+    """Link together the identical files under directory and return the
+    number of files replaced and the number of bytes saved."""
+    replaced = 0
+    saved = 0
+    for group in find_duplicates(find_files(directory)):
+        target = group[0]
+        target_stat = os.stat(target)
+        for filepath in group[1:]:
+            if os.path.samefile(filepath, target):
+                continue
+            if not dry_run:
+                replace_with_link(filepath, target, mode)
+            replaced += 1
+            saved += target_stat.st_size
+    return replaced, saved
+
+
+def archive_members(filename):
+    """Yield the contents of each member of an ar archive,
+    except for the symbol and long name tables."""
+    with open(filename, "rb") as fh:
+        data = fh.read()
+    if not data.startswith(AR_MAGIC):
+        return
+    offset = len(AR_MAGIC)
+    while offset + AR_HEADER_SIZE <= len(data):
+        header = data[offset : offset + AR_HEADER_SIZE]
+        name = header[:16].rstrip()
+        size = int(header[48:58])
+        offset += AR_HEADER_SIZE
+        if name not in (b"/", b"//", b"/SYM64/", b"__.SYMDEF", b"__.SYMDEF SORTED"):
+            yield data[offset : offset + size]
+        offset += size + (size & 1)
+
+
+def archive_report(directory):
+    """Return the total size of the archive members under directory,
+    and how much of that is taken by members duplicated elsewhere."""
+    seen_archives = set()
+    seen_members = set()
+    total = 0
+    duplicated = 0
+    for filepath, file_stat in find_files(directory):
+        if not filepath.endswith(".a"):
+            continue
+        # A hardlinked archive is only stored once.
+        inode = (file_stat.st_dev, file_stat.st_ino)
+        if inode in seen_archives:
+            continue
+        seen_archives.add(inode)
+        for member in archive_members(filepath):
+            total += len(member)
+            digest = hashlib.sha256(member).digest()
+            if digest in seen_members:
+                duplicated += len(member)
+            seen_members.add(digest)
+    return total, duplicated
+
+
+def format_size(size):
+    return f"{size / (1 << 20):.1f} MiB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "directory",
+        help="The installed target libraries directory",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["hardlink", "symlink"],
+        default="hardlink",
+        help="How to link duplicate files (default: hardlink)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report the space that would be saved without changing anything",
+    )
+    parser.add_argument(
+        "--archive-report",
+        action="store_true",
+        help="Also report how much space identical archive members take",
+    )
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        sys.exit(f"{args.directory} is not a directory")
+
+    replaced, saved = deduplicate(args.directory, args.mode, args.dry_run)
+    verb = "Would replace" if args.dry_run else "Replaced"
+    print(
+        f"{verb} {replaced} duplicate files in {args.directory} with "
+        f"{args.mode}s, saving {format_size(saved)}"
+    )
+    if args.archive_report:
+        total, duplicated = archive_report(args.directory)
+        print(
+            f"Archive members: {format_size(total)} in total, of which "
+            f"{format_size(duplicated)} are duplicates of other members"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+"""
+Script to package a staged install tree, as an alternative to CPack.
+
+The staging directory holds the files of the package as they should
+appear when it is unpacked, for example a single LLVM-ET-Arm-...
+directory. With --output, they are written to a tar archive that is
+the same whenever the files are the same:
+- the entries are sorted by path;
+- every entry has the same modification time, SOURCE_DATE_EPOCH if
+  it is set, or --mtime;
+- the owner is root, and the permissions are 0755 for directories and
+  executable files, and 0644 for other files;
+- files that are hardlinks to each other, such as the library files
+  shared by LLVM_TOOLCHAIN_LIBRARY_DEDUP=hardlink, are stored once,
+  with the others as hardlinks to the first in sorted order.
+
+The archive is compressed by the xz or zstd program, according to its
+extension, in a separate multithreaded process. xz is always run in
+its multithreaded mode, with at least two threads and a block size set
+by --level, because its single-threaded mode, which xz before 5.4 uses
+when there is only one core, writes a different stream. The compressed
+data then depends only on the archive, the compressor's version and
+--level, not on the number of cores. If xz isn't available, Python's
+own compression is used instead, which is slower and whose output
+differs from xz's.
+
+With --unpack-dir, the staged files are also linked into that
+directory, as if the archive had been unpacked there, for the package
+tests. This saves compressing the package and decompressing it again
+when only the unpacked files are needed. Files are copied instead if
+they can't be linked.
+"""
+
+import argparse
+import lzma
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tarfile
+
+# Programs that can compress each type of archive faster than Python
+# can, using all the cores.
+COMPRESSORS = [
+    ((".tar.xz", ".txz"), ["xz", "--compress", "--stdout"]),
+    ((".tar.zst", ".tzst"), ["zstd", "--compress", "--stdout", "--threads=0", "-q"]),
+]
+
+XZ_DEFAULT_LEVEL = 6
+
+# The dictionary size of each xz level in KiB. xz's multithreaded mode
+# uses blocks of three times this by default.
+XZ_DICTIONARY_SIZES = [256, 1024, 2048, 4096, 4096, 8192, 8192, 16384, 32768, 65536]
+
+
+def find_entries(staging_dir):
+    """Return the paths under staging_dir, relative to it and sorted,
+    with their lstat results. Symlinks to directories aren't followed."""
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(staging_dir):
+        for name in dirnames + filenames:
+            filepath = os.path.join(dirpath, name)
+            relative = os.path.relpath(filepath, staging_dir)
+            entries.append((relative.replace(os.sep, "/"), os.lstat(filepath)))
+    entries.sort(key=lambda entry: entry[0].split("/"))
+    return entries
+
+
+def tar_info(name, entry_stat, mtime):
+    info = tarfile.TarInfo(name)
+    info.mtime = mtime
+    info.uid = info.gid = 0
+    info.uname = info.gname = "root"
+    if stat.S_ISDIR(entry_stat.st_mode):
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+    elif stat.S_ISLNK(entry_stat.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.mode = 0o777
+    elif stat.S_ISREG(entry_stat.st_mode):
+        info.type = tarfile.REGTYPE
+        info.size = entry_stat.st_size
+        info.mode = 0o755 if entry_stat.st_mode & 0o111 else 0o644
+    else:
+        raise RuntimeError(f"{name} is not a file, directory or symlink")
+    return info
+
+
+def write_tar(fileobj, staging_dir, mtime):
+    """Write the staged files to fileobj as an uncompressed tar stream."""
+    first_links = {}
+    with tarfile.open(fileobj=fileobj, mode="w|", format=tarfile.PAX_FORMAT) as tf:
+        for name, entry_stat in find_entries(staging_dir):
+            filepath = os.path.join(staging_dir, name)
+            info = tar_info(name, entry_stat, mtime)
+            if info.issym():
+                info.linkname = os.readlink(filepath).replace(os.sep, "/")
+                tf.addfile(info)
+            elif info.isdir():
+                tf.addfile(info)
+            else:
+                inode = (entry_stat.st_dev, entry_stat.st_ino)
+                if entry_stat.st_nlink > 1 and inode in first_links:
+                    info.type = tarfile.LNKTYPE
+                    info.linkname = first_links[inode]
+                    info.size = 0
+                    tf.addfile(info)
+                    continue
+                first_links[inode] = name
+                with open(filepath, "rb") as fh:
+                    tf.addfile(info, fh)
+
+
+def xz_mode_options(level):
+    """Return the xz options that keep it in its multithreaded mode with
+    the same blocks on any host, so that the output is always the same."""
+    if level is None:
+        level = XZ_DEFAULT_LEVEL
+    if not 0 <= level < len(XZ_DICTIONARY_SIZES):
+        raise RuntimeError(f"xz levels are 0 to 9, not {level}")
+    threads = max(os.cpu_count() or 1, 2)
+    block_size = 3 * XZ_DICTIONARY_SIZES[level]
+    return [f"--threads={threads}", f"--block-size={block_size}KiB"]
+
+
+def compressor_command(output, level):
+    for suffixes, command in COMPRESSORS:
+        if output.endswith(suffixes):
+            if level is not None:
+                command = command + [f"-{level}"]
+            if command[0] == "xz":
+                command = command + xz_mode_options(level)
+            return command
+    raise RuntimeError(
+        f"{output} must end with one of "
+        + ", ".join(suffix for suffixes, _ in COMPRESSORS for suffix in suffixes)
+    )
+
+
+def write_archive(output, staging_dir, mtime, level):
+    command = compressor_command(output, level)
+    temp_output = output + ".tmp"
+    if shutil.which(command[0]):
+        with open(temp_output, "wb") as fh:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=fh)
+        try:
+            write_tar(process.stdin, staging_dir, mtime)
+        finally:
+            process.stdin.close()
+            returncode = process.wait()
+        if returncode != 0:
+            raise RuntimeError(f"{command[0]} failed to compress {output}")
+    elif command[0] == "xz":
+        preset = XZ_DEFAULT_LEVEL if level is None else level
+        with lzma.open(temp_output, "wb", preset=preset) as fh:
+            write_tar(fh, staging_dir, mtime)
+    else:
+        raise RuntimeError(f"{command[0]} is needed to write {output}")
+    os.replace(temp_output, output)
+
+
+def link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def unpack_staged(staging_dir, unpack_dir):
+    """Recreate the staged tree in unpack_dir, as unpacking the archive
+    would, linking the files rather than copying them."""
+    copies = {}
+    for name, entry_stat in find_entries(staging_dir):
+        source = os.path.join(staging_dir, name)
+        destination = os.path.join(unpack_dir, name)
+        if os.path.lexists(destination) and not stat.S_ISDIR(entry_stat.st_mode):
+            os.remove(destination)
+        if stat.S_ISDIR(entry_stat.st_mode):
+            os.makedirs(destination, exist_ok=True)
+        elif stat.S_ISLNK(entry_stat.st_mode):
+            os.symlink(os.readlink(source), destination)
+        else:
+            # If the file has to be copied, keep the staged files that
+            # are hardlinks to each other as hardlinks in the copy.
+            inode = (entry_stat.st_dev, entry_stat.st_ino)
+            if inode in copies:
+                link_or_copy(copies[inode], destination)
+            else:
+                link_or_copy(source, destination)
+                copies[inode] = destination
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "staging_dir",
+        help="Directory containing the files to package",
+    )
+    parser.add_argument(
+        "--output",
+        help="The archive to write, ending in .tar.xz or .tar.zst",
+    )
+    parser.add_argument(
+        "--level",
+        type=int,
+        help="Compression level for the compressor (default: its own)",
+    )
+    parser.add_argument(
+        "--mtime",
+        type=int,
+        default=0,
+        help="Modification time of every entry, in seconds since the "
+        "epoch, if SOURCE_DATE_EPOCH isn't set (default: 0)",
+    )
+    parser.add_argument(
+        "--unpack-dir",
+        help="Also recreate the staged files in this directory",
+    )
+    args = parser.parse_args()
+    if not args.output and not args.unpack_dir:
+        parser.error("nothing to do: give --output and/or --unpack-dir")
+
+    mtime = int(os.environ.get("SOURCE_DATE_EPOCH", args.mtime))
+    try:
+        if args.output:
+            write_archive(args.output, args.staging_dir, mtime, args.level)
+        if args.unpack_dir:
+            unpack_staged(args.staging_dir, args.unpack_dir)
+    except (OSError, RuntimeError) as e:
+        sys.exit(f"package_archive.py: {e}")
+
+
+if __name__ == "__main__":
+    main()
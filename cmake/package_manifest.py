@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+
+"""
+Script to record what is in a toolchain package, and to compare two
+such records to see how the package has grown.
+
+It has two subcommands:
+
+generate
+    Writes a JSON manifest of a package: a .tar.xz, .tar.zst or .zip
+    file, or a directory of staged or unpacked files. The manifest
+    lists every file with its size and SHA-256 hash, the install
+    component it belongs to and, for the target libraries, the
+    library variant. Paths are relative to the package's top-level
+    directory, whose name is recorded as "root", so that manifests of
+    different versions can be compared. Symlinks are listed with their
+    targets, and hardlinks with the path they are linked to, since
+    they take no more space when unpacked.
+
+    The components are found from the install_manifest_<component>.txt
+    files that CMake writes in the build directory each time a
+    component is installed, including by CPack. The path of each
+    installed file is matched to the package by its longest suffix.
+
+diff
+    Compares the manifests of two packages and prints the unpacked
+    size and number of files of each part of the package: each library
+    variant in lib/clang-runtimes, the rest of lib/clang-runtimes, the
+    programs in bin, the other headers, and everything else. The parts
+    that grew the most come first. --top also lists the files whose
+    size changed the most.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import posixpath
+import stat
+import sys
+import zipfile
+
+from copy_target_libraries import TRIPLE_DIRS, open_stream
+
+RUNTIMES_DIR = "lib/clang-runtimes"
+
+
+def file_digest(fh):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fh.read(1 << 20), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_directory(directory):
+    """Return the entries of a directory tree, by path. The first of
+    each set of hardlinks in sorted order is the one with the contents,
+    as in the archives written by package_archive.py. os.walk lists
+    symlinks to directories with the directories, without following
+    them, so they are picked out from there."""
+    names = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dir_links = [
+            dirname
+            for dirname in dirnames
+            if os.path.islink(os.path.join(dirpath, dirname))
+        ]
+        for filename in filenames + dir_links:
+            filepath = os.path.join(dirpath, filename)
+            names.append(os.path.relpath(filepath, directory).replace(os.sep, "/"))
+    entries = {}
+    first_links = {}
+    for name in sorted(names, key=lambda name: name.split("/")):
+        filepath = os.path.join(directory, name)
+        file_stat = os.lstat(filepath)
+        if stat.S_ISLNK(file_stat.st_mode):
+            entries[name] = {"symlink": os.readlink(filepath)}
+            continue
+        inode = (file_stat.st_dev, file_stat.st_ino)
+        if file_stat.st_nlink > 1 and inode in first_links:
+            entries[name] = {"hardlink": first_links[inode]}
+            continue
+        first_links[inode] = name
+        with open(filepath, "rb") as fh:
+            entries[name] = {"size": file_stat.st_size, "sha256": file_digest(fh)}
+    return entries
+
+
+def read_tar(package):
+    entries = {}
+    with open_stream(package) as tf:
+        for member in tf:
+            name = posixpath.normpath(member.name)
+            if member.issym():
+                entries[name] = {"symlink": member.linkname}
+            elif member.islnk():
+                entries[name] = {"hardlink": posixpath.normpath(member.linkname)}
+            elif member.isreg():
+                entries[name] = {
+                    "size": member.size,
+                    "sha256": file_digest(tf.extractfile(member)),
+                }
+    return entries
+
+
+def read_zip(package):
+    entries = {}
+    with zipfile.ZipFile(package) as zf:
+        for info in zf.infolist():
+            if not info.is_dir():
+                with zf.open(info) as fh:
+                    entries[info.filename] = {
+                        "size": info.file_size,
+                        "sha256": file_digest(fh),
+                    }
+    return entries
+
+
+def split_root(entries):
+    """Return the package's top-level directory, if it has one, and the
+    entries with their paths relative to it."""
+    tops = {name.split("/", 1)[0] for name in entries}
+    if len(tops) != 1 or any("/" not in name for name in entries):
+        return "", entries
+    root = tops.pop()
+    relative = {}
+    for name, entry in entries.items():
+        if "hardlink" in entry:
+            entry = {"hardlink": entry["hardlink"][len(root) + 1:]}
+        relative[name[len(root) + 1:]] = entry
+    return root, relative
+
+
+def read_install_manifests(build_dir, components):
+    """Return the paths installed by each component."""
+    installed = {}
+    for component in components:
+        filename = os.path.join(build_dir, f"install_manifest_{component}.txt")
+        try:
+            with open(filename) as fh:
+                installed[component] = fh.read().split("\n")
+        except FileNotFoundError:
+            print(f"warning: {filename} not found", file=sys.stderr)
+    return installed
+
+
+def find_components(paths, installed):
+    """Return the component of each package path that an install
+    manifest lists."""
+    components = {}
+    for component, installed_paths in installed.items():
+        for installed_path in installed_paths:
+            # A directory installed from "<dir>/." has "/./" in its paths.
+            parts = posixpath.normpath(installed_path.replace("\\", "/")).split("/")
+            for i in range(1, len(parts)):
+                suffix = "/".join(parts[i:])
+                if suffix in paths:
+                    components.setdefault(suffix, component)
+                    break
+    return components
+
+
+def variant_of(path):
+    """Return the library variant a package path belongs to, if any."""
+    if not path.startswith(RUNTIMES_DIR + "/"):
+        return None
+    parts = path[len(RUNTIMES_DIR) + 1:].split("/")
+    for i, part in enumerate(parts[:-2]):
+        if part in TRIPLE_DIRS:
+            return parts[i + 1]
+    return None
+
+
+def generate(args):
+    if os.path.isdir(args.package):
+        entries = read_directory(args.package)
+    elif args.package.endswith(".zip"):
+        entries = read_zip(args.package)
+    else:
+        entries = read_tar(args.package)
+    root, entries = split_root(entries)
+    installed = {}
+    if args.build_dir:
+        installed = read_install_manifests(args.build_dir, args.components)
+    components = find_components(set(entries), installed)
+
+    files = []
+    for path in sorted(entries):
+        entry = {"path": path}
+        entry.update(entries[path])
+        if path in components:
+            entry["component"] = components[path]
+        variant = variant_of(path)
+        if variant is not None:
+            entry["variant"] = variant
+        files.append(entry)
+    manifest = {
+        "package": args.package_name or os.path.basename(os.path.normpath(args.package)),
+        "root": root,
+        "files": files,
+    }
+    temp_output = args.output + ".tmp"
+    with open(temp_output, "w") as fh:
+        json.dump(manifest, fh, indent=1)
+        fh.write("\n")
+    os.replace(temp_output, args.output)
+
+
+def part_of(entry):
+    """Return the part of the package that a manifest entry is
+    accounted to in the diff."""
+    path = entry["path"]
+    if "variant" in entry:
+        return f"variant {entry['variant']}"
+    if path.startswith(RUNTIMES_DIR + "/"):
+        return RUNTIMES_DIR
+    if path.startswith("bin/"):
+        return "bin"
+    if "/include/" in f"/{path}":
+        return "headers"
+    return "other"
+
+
+def account(manifest):
+    """Return the unpacked size and number of files of each part of a
+    package, and the size of each file. Links count as files but take
+    no space."""
+    parts = {}
+    sizes = {}
+    for entry in manifest["files"]:
+        size = entry.get("size", 0)
+        sizes[entry["path"]] = size
+        part = parts.setdefault(part_of(entry), [0, 0])
+        part[0] += size
+        part[1] += 1
+    return parts, sizes
+
+
+def format_size(size):
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            return f"{sign}{size:.1f} {unit}" if unit != "B" else f"{sign}{size} B"
+        size /= 1024
+    return f"{sign}{size:.1f} GiB"
+
+
+def format_change(old, new):
+    change = new - old
+    text = ("+" if change >= 0 else "") + format_size(change)
+    if old:
+        text += f" ({change / old:+.1%})"
+    return text
+
+
+def diff(args):
+    manifests = []
+    for filename in (args.old, args.new):
+        with open(filename) as fh:
+            manifests.append(json.load(fh))
+    (old_parts, old_sizes), (new_parts, new_sizes) = map(account, manifests)
+
+    rows = []
+    for name in sorted(set(old_parts) | set(new_parts)):
+        old_size, old_files = old_parts.get(name, (0, 0))
+        new_size, new_files = new_parts.get(name, (0, 0))
+        rows.append((name, old_size, new_size, old_files, new_files))
+    rows.sort(key=lambda row: (-(row[2] - row[1]), row[0]))
+    rows.append(
+        (
+            "total",
+            sum(row[1] for row in rows),
+            sum(row[2] for row in rows),
+            sum(row[3] for row in rows),
+            sum(row[4] for row in rows),
+        )
+    )
+
+    changed_files = sorted(
+        (
+            (path, old_sizes.get(path), new_sizes.get(path))
+            for path in set(old_sizes) | set(new_sizes)
+            if old_sizes.get(path) != new_sizes.get(path)
+        ),
+        key=lambda f: (-abs((f[2] or 0) - (f[1] or 0)), f[0]),
+    )[: args.top]
+
+    if args.json:
+        json.dump(
+            {
+                "parts": [
+                    dict(zip(["part", "old_size", "new_size", "old_files", "new_files"], row))
+                    for row in rows
+                ],
+                "files": [
+                    {"path": path, "old_size": old, "new_size": new}
+                    for path, old, new in changed_files
+                ],
+            },
+            sys.stdout,
+            indent=1,
+        )
+        print()
+        return
+
+    print(f"{manifests[0]['package']} -> {manifests[1]['package']}")
+    width = max(len(row[0]) for row in rows)
+    print(f"{'part':<{width}}  {'old size':>10}  {'new size':>10}  change, files")
+    for name, old_size, new_size, old_files, new_files in rows:
+        print(
+            f"{name:<{width}}  {format_size(old_size):>10}  "
+            f"{format_size(new_size):>10}  {format_change(old_size, new_size)}, "
+            f"{old_files} -> {new_files}"
+        )
+    if changed_files:
+        print()
+        for path, old, new in changed_files:
+            if old is None:
+                print(f"added    {path}: {format_size(new)}")
+            elif new is None:
+                print(f"removed  {path}: {format_size(old)}")
+            else:
+                print(f"changed  {path}: {format_change(old, new)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="subcommand", required=True)
+
+    generate_parser = subparsers.add_parser(
+        "generate", help="Write the manifest of a package"
+    )
+    generate_parser.add_argument(
+        "package",
+        help="Package file, or directory of staged or unpacked files",
+    )
+    generate_parser.add_argument(
+        "--output", required=True, help="The manifest file to write"
+    )
+    generate_parser.add_argument(
+        "--package-name",
+        help="Name of the package to record (default: the package's file name)",
+    )
+    generate_parser.add_argument(
+        "--build-dir",
+        help="Build directory containing the install_manifest_<component>.txt files",
+    )
+    generate_parser.add_argument(
+        "--components",
+        nargs="*",
+        default=[],
+        help="The components in the package",
+    )
+    generate_parser.set_defaults(function=generate)
+
+    diff_parser = subparsers.add_parser(
+        "diff", help="Compare the manifests of two packages"
+    )
+    diff_parser.add_argument("old", help="Manifest of the old package")
+    diff_parser.add_argument("new", help="Manifest of the new package")
+    diff_parser.add_argument(
+        "--top",
+        type=int,
+        default=0,
+        help="Also list this many of the files whose size changed the most",
+    )
+    diff_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the comparison as JSON",
+    )
+    diff_parser.set_defaults(function=diff)
+
+    args = parser.parse_args()
+    try:
+        args.function(args)
+    except (OSError, RuntimeError, ValueError, KeyError) as e:
+        sys.exit(f"package_manifest.py: {e}")
+
+
+if __name__ == "__main__":
+    main()
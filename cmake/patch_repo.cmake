@@ -10,6 +10,9 @@ function(get_patch_command toolchain_root patch_dir patch_command_out)
     elseif(GIT_PATCH_METHOD STREQUAL "apply")
         list(APPEND patch_script_args "--method" "apply")
     endif()
+    if(NOT GIT_PATCH_METHOD STREQUAL "am")
+        list(APPEND patch_script_args "--batch" "--cache")
+    endif()
     list(APPEND patch_script_args ${toolchain_root}/patches/${patch_dir})
 
     set(${patch_command_out} ${patch_script_args} PARENT_SCOPE)
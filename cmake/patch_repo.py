@@ -5,11 +5,163 @@ Script to apply a set of patches to a git repository.
 """
 
 import argparse
+import hashlib
+import json
 import os
 import pathlib
 import subprocess
 import sys
 
+CACHE_FILE = "patch_repo_cache.json"
+
+
+def apply_series(git_cmd, series, extra_args, check=False):
+    """Run git apply on the concatenation of a series of patches.
+    git apply checks every patch before changing anything, so either
+    the whole series is applied or none of it is."""
+    apply_args = git_cmd + ["apply", "--ignore-whitespace"] + extra_args
+    if check:
+        apply_args.append("--check")
+    apply_args.append("-")
+    return subprocess.run(apply_args, input=b"".join(series), capture_output=check)
+
+
+def find_failing_patch(git_cmd, series, extra_args):
+    """Return the index of the first patch in a series that doesn't
+    apply on top of the ones before it."""
+    # The first `applies` patches apply, the first `fails` don't.
+    applies = 0
+    fails = len(series)
+    while fails - applies > 1:
+        middle = (applies + fails) // 2
+        p = apply_series(git_cmd, series[:middle], extra_args, check=True)
+        if p.returncode == 0:
+            applies = middle
+        else:
+            fails = middle
+    return fails - 1
+
+
+def touched_paths(git_cmd, series):
+    """Return the paths that a series of patches changes."""
+    output = subprocess.check_output(
+        git_cmd + ["apply", "--numstat", "-z", "-"], input=b"".join(series)
+    )
+    fields = output.decode().split("\0")
+    paths = set()
+    while fields:
+        path = fields.pop(0).split("\t")[-1]
+        if path:
+            paths.add(path)
+        elif fields:
+            # A rename is followed by its old and new paths.
+            paths.update(fields[:2])
+            del fields[:2]
+    return sorted(paths)
+
+
+def hash_paths(git_cmd, repo_dir, paths):
+    """Return the blob ID of each path in the working tree, or None for
+    those that don't exist."""
+    existing = [p for p in paths if os.path.lexists(os.path.join(repo_dir, p))]
+    blobs = []
+    if existing:
+        blobs = subprocess.check_output(
+            git_cmd + ["hash-object", "--stdin-paths"],
+            input="".join(p + "\n" for p in existing),
+            text=True,
+        ).split()
+    found = dict(zip(existing, blobs))
+    return {p: found.get(p) for p in paths}
+
+
+def git_path(git_cmd, repo_dir, name):
+    """Return the path of a file in the repository's git directory."""
+    return os.path.join(
+        repo_dir,
+        subprocess.check_output(
+            git_cmd + ["rev-parse", "--git-path", name], text=True
+        ).strip(),
+    )
+
+
+def apply_atomically(git_cmd, repo_dir, series, update_worktree=True):
+    """Apply a series of patches to a temporary index holding the
+    current contents of the files that the series changes. If every
+    patch applies, write the patched files to the working tree, unless
+    update_worktree is False. Return whether the series applied.
+
+    The real index and working tree are untouched until the whole
+    series has been applied, so nothing needs to be undone if it fails.
+    Only the files that the series changes are read and written."""
+    paths = touched_paths(git_cmd, series)
+    index_file = os.path.abspath(
+        git_path(git_cmd, repo_dir, f"patch_repo_index.{os.getpid()}")
+    )
+    env = dict(os.environ, GIT_INDEX_FILE=index_file, GIT_LITERAL_PATHSPECS="1")
+    paths_input = "".join(p + "\0" for p in paths)
+    try:
+        subprocess.run(git_cmd + ["read-tree", "HEAD"], env=env, check=True)
+        subprocess.run(
+            git_cmd + ["update-index", "--add", "--remove", "-z", "--stdin"],
+            input=paths_input,
+            text=True,
+            env=env,
+            check=True,
+        )
+        p = subprocess.run(
+            git_cmd + ["apply", "--cached", "--ignore-whitespace", "-"],
+            input=b"".join(series),
+            env=env,
+        )
+        if p.returncode != 0:
+            return False
+        if not update_worktree:
+            return True
+
+        patched = subprocess.check_output(
+            git_cmd + ["ls-files", "-z", "--"] + paths, text=True, env=env
+        ).split("\0")
+        for path in set(paths) - set(patched):
+            if os.path.lexists(os.path.join(repo_dir, path)):
+                os.remove(os.path.join(repo_dir, path))
+        subprocess.run(
+            git_cmd + ["checkout-index", "--force", "-z", "--stdin"],
+            input="".join(p + "\0" for p in paths if p in patched),
+            text=True,
+            env=env,
+            check=True,
+        )
+        return True
+    finally:
+        if os.path.exists(index_file):
+            os.remove(index_file)
+
+
+def series_key(git_cmd, series, extra_args):
+    """Return the cache key of a series of patches applied to the
+    current commit."""
+    digest = hashlib.sha256()
+    digest.update(subprocess.check_output(git_cmd + ["rev-parse", "HEAD"]))
+    digest.update(json.dumps(extra_args).encode())
+    for patch in series:
+        digest.update(hashlib.sha256(patch).digest())
+    return digest.hexdigest()
+
+
+def read_cache(cache_file):
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_cache(cache_file, cache):
+    with open(cache_file + ".tmp", "w") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(cache_file + ".tmp", cache_file)
+
 
 def main():
     parser = argparse.ArgumentParser(description=__doc__)
@@ -42,6 +194,21 @@ def main():
         dest="three_way",
         help="If the patch does not apply cleanly, fall back on 3-way merge.",
     )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Check and apply the whole series with a single git apply. If any patch fails, none are applied. Only used with apply.",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Record the contents of the files changed by the series in the repository's git directory, keyed by the commit and the patches. If they are found to be already patched, do nothing. Only used with apply.",
+    )
+    parser.add_argument(
+        "--atomic",
+        action="store_true",
+        help="Apply the whole series to a temporary index first, and only change the working tree if every patch applies. With am, only start git am if every patch applies.",
+    )
     args = parser.parse_args()
 
     # If the patch is valid but contain conflicts, using --3way --apply can apply
@@ -51,6 +218,14 @@ def main():
     if args.method == "apply" and args.restore_on_fail and args.three_way:
         print("--restore_on_fail is incompatible with --3way using apply")
         exit(1)
+    # A 3-way merge can leave conflict markers, which mustn't be
+    # mistaken for a patched file later.
+    if args.method == "apply" and args.cache and args.three_way:
+        print("--cache is incompatible with --3way")
+        exit(1)
+    if args.atomic and args.three_way:
+        print("--atomic is incompatible with --3way")
+        exit(1)
 
     if args.repo_dir:
         git_cmd = ["git", "-C", args.repo_dir]
@@ -70,7 +245,17 @@ def main():
     print(f"Found {len(patch_list)} patches to apply:")
     print("\n".join(p.name for p in patch_list))
 
+    extra_args = ["--3way"] if args.three_way else []
+    series = [patch.read_bytes() for patch in patch_list]
+    repo_dir = args.repo_dir or "."
+
     if args.method == "am":
+        if args.atomic and series:
+            print("Checking all patches...")
+            if not apply_atomically(git_cmd, repo_dir, series, update_worktree=False):
+                failed = patch_list[find_failing_patch(git_cmd, series, extra_args)]
+                print(f"Unable to apply {failed.name}, so no patches were applied")
+                sys.exit(2 if args.restore_on_fail else 1)
         merge_args = git_cmd + ["am", "-k", "--ignore-whitespace"]
         if args.three_way:
             merge_args.append("--3way")
@@ -98,6 +283,30 @@ def main():
             else:
                 print("Unable to abort.")
         sys.exit(1)
+
+    # An empty series needs no checks and isn't worth caching.
+    use_cache = args.cache and series
+    if use_cache:
+        key = series_key(git_cmd, series, extra_args)
+        cache_file = git_path(git_cmd, repo_dir, CACHE_FILE)
+        cache = read_cache(cache_file)
+        # The cache records the contents of each file changed by the
+        # series, after the series has been applied.
+        patched = cache.get(key)
+        if patched and hash_paths(git_cmd, repo_dir, patched) == patched:
+            print("All patches already applied.")
+            sys.exit(0)
+
+    if (args.atomic or args.batch) and series:
+        print("Applying all patches...")
+        if args.atomic:
+            applied = apply_atomically(git_cmd, repo_dir, series)
+        else:
+            applied = apply_series(git_cmd, series, extra_args).returncode == 0
+        if not applied:
+            failed = patch_list[find_failing_patch(git_cmd, series, extra_args)]
+            print(f"Unable to apply {failed.name}, so no patches were applied")
+            sys.exit(2 if args.restore_on_fail else 1)
     else:
         applied_patches = []
         for current_patch in patch_list:
@@ -147,7 +356,11 @@ def main():
                     )
                     sys.exit(2)
                 sys.exit(1)
-        print(f"All patches applied.")
+
+    if use_cache:
+        cache[key] = hash_paths(git_cmd, repo_dir, touched_paths(git_cmd, series))
+        write_cache(cache_file, cache)
+    print(f"All patches applied.")
 
 
 main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Check how cmake/copy_target_libraries.py copies a selected variant
+# that links to another variant's files. Invoked as
+#   check-copy-target-libraries.py <copy_target_libraries.py> <work dir>
+# it writes a small distribution in which variant v3's lib directory is
+# a symlink to v1's, copies only v3, and prints the copied tree. It then
+# changes only multilib.yaml in the distribution and copies again, to
+# show which parts of the libraries are replaced.
+
+import io
+import os
+import subprocess
+import sys
+import tarfile
+
+ROOT = "LLVM-ET-Arm-test/lib/clang-runtimes"
+
+
+def add_file(tf, name, data):
+    info = tarfile.TarInfo(f"{ROOT}/{name}")
+    info.size = len(data)
+    tf.addfile(info, io.BytesIO(data))
+
+
+def add_entry(tf, name, entry_type, linkname=""):
+    info = tarfile.TarInfo(f"{ROOT}/{name}")
+    info.type = entry_type
+    info.linkname = linkname
+    info.mode = 0o755
+    tf.addfile(info)
+
+
+def write_distribution(filename, multilib_yaml):
+    with tarfile.open(filename, "w:gz") as tf:
+        add_file(tf, "multilib.yaml", multilib_yaml)
+        add_entry(tf, "arm-none-eabi", tarfile.DIRTYPE)
+        add_entry(tf, "arm-none-eabi/v1", tarfile.DIRTYPE)
+        add_entry(tf, "arm-none-eabi/v1/lib", tarfile.DIRTYPE)
+        add_file(tf, "arm-none-eabi/v1/lib/libc.a", b"libc\n")
+        add_entry(tf, "arm-none-eabi/v1/lib/libm.a", tarfile.SYMTYPE, "libc.a")
+        add_entry(tf, "arm-none-eabi/v1/lib/ldscripts", tarfile.DIRTYPE)
+        add_file(tf, "arm-none-eabi/v1/lib/ldscripts/a.ld", b"script\n")
+        add_entry(tf, "arm-none-eabi/v3", tarfile.DIRTYPE)
+        add_entry(
+            tf, "arm-none-eabi/v3/lib", tarfile.SYMTYPE, "../../arm-none-eabi/v1/lib"
+        )
+        add_entry(tf, "arm-none-eabi/v3/include", tarfile.DIRTYPE)
+        add_file(tf, "arm-none-eabi/v3/include/stdio.h", b"header\n")
+
+
+def copy(script, distribution, build_dir):
+    result = subprocess.run(
+        [
+            sys.executable,
+            script,
+            "--distribution-file",
+            distribution,
+            "--build-dir",
+            build_dir,
+            "--variants",
+            "v3",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    print(result.stdout.replace(build_dir, "<build>"), end="")
+    print(result.stderr, end="")
+    if result.returncode != 0:
+        sys.exit(1)
+
+
+def main():
+    script, work_dir = sys.argv[1:3]
+    os.makedirs(work_dir)
+    distribution = os.path.join(work_dir, "distribution.tar.gz")
+    build_dir = os.path.join(work_dir, "build")
+    destination = os.path.join(build_dir, "llvm", "lib", "clang-runtimes")
+
+    write_distribution(distribution, b"first\n")
+    copy(script, distribution, build_dir)
+    for dirpath, dirnames, filenames in sorted(os.walk(destination)):
+        for name in sorted(dirnames + filenames):
+            filepath = os.path.join(dirpath, name)
+            relative = os.path.relpath(filepath, destination).replace(os.sep, "/")
+            if os.path.islink(filepath):
+                print(f"{relative} -> {os.readlink(filepath)}")
+            elif os.path.isdir(filepath):
+                print(f"{relative}/")
+            else:
+                with open(filepath, "rb") as fh:
+                    print(f"{relative}: {fh.read().decode().strip()}")
+
+    write_distribution(distribution, b"second\n")
+    copy(script, distribution, build_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Check that the shards planned by arm-multilib/test-shards.py together
+# run every unit exactly once. Invoked as
+#   check-test-shards.py <test-shards.py> <history> <count> <units...>
+# it plans every shard with the units in the order given and in reverse
+# order, and exits with 1 if the plans differ, if a piece of a unit is
+# planned twice or not at all, or if two pieces of a unit are in the
+# same shard. The union of the shards is printed, one piece per line,
+# as "<variant> <check target> <piece> <pieces>", for the test to check
+# how the units were split.
+
+import subprocess
+import sys
+
+
+def plan(script, history, count, units):
+    shards = []
+    for index in range(count):
+        output = subprocess.run(
+            [sys.executable, script, "--history", history, "plan"]
+            + ["--count", str(count), "--index", str(index)]
+            + units,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        shards.append(output.splitlines())
+    return shards
+
+
+def main():
+    script, history, count = sys.argv[1:4]
+    count = int(count)
+    units = sys.argv[4:]
+
+    errors = []
+    shards = plan(script, history, count, units)
+    if plan(script, history, count, units[::-1]) != shards:
+        errors.append("the plan depends on the order of the units")
+
+    planned = {}
+    for index, shard in enumerate(shards):
+        for line in shard:
+            variant, target, piece, pieces = line.split()
+            if line in planned:
+                errors.append(f"{line} is in shards {planned[line]} and {index}")
+            planned[line] = index
+
+    units_planned = {}
+    for line, index in planned.items():
+        variant, target, piece, pieces = line.split()
+        units_planned.setdefault(f"{variant}:{target}", []).append(
+            (int(piece), int(pieces), index)
+        )
+    for unit in units:
+        pieces = sorted(units_planned.pop(unit, []))
+        if not pieces:
+            errors.append(f"{unit} is not planned")
+            continue
+        count_of_pieces = pieces[0][1]
+        if [(p[0], p[1]) for p in pieces] != [
+            (piece, count_of_pieces) for piece in range(1, count_of_pieces + 1)
+        ]:
+            errors.append(f"{unit} is planned as pieces {pieces}")
+        if len({p[2] for p in pieces}) != len(pieces):
+            errors.append(f"{unit} has two pieces in one shard")
+    for unit in units_planned:
+        errors.append(f"{unit} is planned but wasn't given")
+
+    for line in sorted(planned):
+        print(line)
+    for error in errors:
+        print(f"error: {error}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
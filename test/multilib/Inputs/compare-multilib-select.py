@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Check that arm-multilib/multilib_select.py selects the same library
+# variants as clang. Each argument after the first two is a set of
+# compile flags. For each one, clang -print-multi-directory is run, and
+# the multilib flags clang prints for it are given to multilib_select
+# with the multilib.yaml clang uses. The result is printed as
+# "<flags>: <directories or error>", so that the test can check which
+# variants were chosen, and the exit code is 1 if the two disagree.
+
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+
+
+def run_clang(clang, args):
+    return subprocess.run([clang] + args, capture_output=True, text=True)
+
+
+def main():
+    clang, multilib_dir = sys.argv[1:3]
+    sys.path.insert(0, multilib_dir)
+    import multilib_select
+
+    clang = shutil.which(clang) or clang
+    multilib_yaml = os.path.join(
+        os.path.dirname(clang), "..", "lib", "clang-runtimes", "multilib.yaml"
+    )
+    multilib_set = multilib_select.load(multilib_yaml)
+
+    mismatches = 0
+    for flags in sys.argv[3:]:
+        flag_list = shlex.split(flags)
+        result = run_clang(clang, ["-print-multi-directory"] + flag_list)
+        multilib_flags = run_clang(
+            clang, ["-print-multi-flags-experimental"] + flag_list
+        ).stdout.split()
+        selected = multilib_set.select(multilib_flags)
+        error = multilib_select.selection_error(selected)
+
+        if error is not None:
+            print(f"{flags}: error: {error}")
+            if result.returncode == 0 or error not in result.stderr:
+                print(f"MISMATCH: clang printed {result.stdout!r}, {result.stderr!r}")
+                mismatches += 1
+            continue
+        directories = [variant.dir for variant in selected]
+        print(f"{flags}: {' '.join(directories)}")
+        if result.returncode != 0 or result.stdout.split() != directories:
+            print(f"MISMATCH: clang printed {result.stdout!r}, {result.stderr!r}")
+            mismatches += 1
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
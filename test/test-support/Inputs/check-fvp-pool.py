@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: Copyright 2024 Arm Limited and/or its affiliates <open-source-office@arm.com>
+
+# Run test programs through the FVP pool in fvp_pool.py with its stub
+# worker, which runs them as host programs, and print what happened so
+# that the test can check that the pool reuses running models and
+# reports a timeout without running the test again outside the pool.
+
+import os
+import subprocess
+import sys
+import time
+
+TEST_PROGRAM = """\
+import sys, time
+if sys.argv[1] == "sleep":
+    time.sleep(float(sys.argv[2]))
+print("program", *sys.argv[1:], flush=True)
+sys.exit(int(sys.argv[2]))
+"""
+
+
+def main():
+    test_support_dir, work_dir = sys.argv[1:3]
+    sys.path.insert(0, test_support_dir)
+    import fvp_pool
+
+    os.makedirs(work_dir, exist_ok=True)
+    pool_dir = os.path.join(work_dir, "pool")
+    image = os.path.join(work_dir, "program")
+    with open(image, "w") as fh:
+        fh.write(f"#!{sys.executable}\n" + TEST_PROGRAM)
+    os.chmod(image, 0o755)
+
+    # Start the server here, rather than leaving it to the first test,
+    # so that it exits soon after the last one.
+    settings = ["--fvp-install-dir", work_dir, "--fvp-config-dir", work_dir]
+    server = subprocess.Popen(
+        [sys.executable, fvp_pool.__file__, "--pool-dir", pool_dir, "--worker", "stub"]
+        + settings
+        + ["--fvp-model", "stub", "--max-workers", "1", "--idle-timeout", "2"]
+    )
+    port_file = os.path.join(
+        pool_dir, fvp_pool.pool_key("stub", work_dir, work_dir, "stub", []) + ".port"
+    )
+    while not os.path.exists(port_file):
+        time.sleep(0.1)
+
+    def run(arguments, timeout):
+        stats = {}
+        returncode = fvp_pool.run_fvp_pooled(
+            pool_dir, "stub", work_dir, work_dir, "stub", [], image, arguments,
+            timeout, work_dir, True, None, None, stats,
+        )
+        print(f"returncode {returncode} model runs {stats['model_runs']}", flush=True)
+        return stats["model_pid"]
+
+    first_model = run(["exit", "3"], 30)
+    print("reused", run(["exit", "0"], 30) == first_model, flush=True)
+
+    start_time = time.monotonic()
+    try:
+        run(["sleep", "5"], 1)
+    except subprocess.TimeoutExpired:
+        print("timed out", time.monotonic() - start_time < 4, flush=True)
+    print("replaced", run(["exit", "0"], 30) != first_model, flush=True)
+
+    server.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    main()